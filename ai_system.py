@@ -1,48 +1,54 @@
-import os
-from dotenv import load_dotenv
-from rag_engine import RAGEngine
-from tools.google_search import GoogleSearchTool
-from workflow import Workflow
-from openai import OpenAI
+from container import Container, get_container
 from interfaces.dialogue_state import DialogueState
-load_dotenv(".env")
+from tracing import span
 
 class AISystem:
-    def __init__(self, state: DialogueState = None):
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-        pinecone_index_name = os.getenv("PINECONE_INDEX_NAME")
-        self.rag_engine = RAGEngine(
-            pinecone_index_name=pinecone_index_name
-        )
-        self.google_search = GoogleSearchTool()
-        self.openai_client = OpenAI(api_key=openai_api_key)
-        self.workflow = Workflow(self.openai_client)
+    def __init__(self, state: DialogueState = None, container: Container = None):
+        # Важкі компоненти спільні для процесу, граф компілюється один раз
+        self.container = container or get_container()
+        self.rag_engine = self.container.get("rag_engine")
+        self.google_search = self.container.get("google_search")
+        self.openai_client = self.container.get("openai_client")
+        self.workflow = self.container.get("workflow")
         self.state = state if state else DialogueState(
             user_input="",
             current_node="analyze_intent"
         )
-    def process_query(self) -> DialogueState:
+    def process_query(self, state: DialogueState = None) -> DialogueState:
         """Основна логіка обробки запиту з режимами роботи"""
-        if not self.state.user_input.strip():
-            self.state.response_messages.append({
+        if state is not None:
+            # Окремий стан запиту: компоненти спільні, а стан - ні
+            return self._process(state)
+        self.state = self._process(self.state)
+        return self.state
+
+    def _process(self, state: DialogueState) -> DialogueState:
+        if not state.user_input.strip():
+            state.response_messages.append({
                 "role": "assistant",
                 "content": "❓ Будь ласка, введіть запит"
             })
-            return self.state
-        self.state = self._process_redmine()
-        return self.state
+            return state
+        # Кореневий спан: усі етапи запиту отримують його trace_id
+        with span("request") as attrs:
+            result = self._process_redmine(state)
+            if result is not None:
+                attrs.update(intent=result.intent, tier=result.prompt_stats.get("tier"))
+            return result
 
-    def _process_redmine(self) -> DialogueState:
+    def _process_redmine(self, state: DialogueState) -> DialogueState:
         try:
-            rag_result = self.rag_engine.search(self.state.user_input)
-            self.state.RAG_context = ""
+            rag_result = self.rag_engine.search(state.user_input)
+            state.RAG_context = ""
+            state.rag_chunks = []
             if rag_result['success'] and rag_result['score'] > 0.75:
-                self.state.RAG_context = rag_result['context']
-                self.state.sources = rag_result['sources']
+                state.RAG_context = rag_result['context']
+                state.sources = rag_result['sources']
+                state.rag_chunks = rag_result['raw_results']
         except Exception as e:
             print(f"RAG пошук помилка: {e}")
         try:
-            response = self.workflow.process_user_input(self.state)
+            response = self.workflow.process_user_input(state)
             return response
         except Exception as e:
             print(f"Function calling помилка: {e}")
\ No newline at end of file
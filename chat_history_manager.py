@@ -1,64 +1,178 @@
-from langchain.memory import ConversationBufferWindowMemory, ConversationSummaryBufferMemory
-from langchain.schema import BaseMessage, HumanMessage, AIMessage
-from typing import List, Dict
 import json
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+
+from openai_gateway import OpenAIGateway, PRIORITY_LOW
+from token_counter import count_tokens, truncate_to_tokens
+from tracing import span
+
+SUMMARY_PROMPT = (
+    "Стисло підсумуй розмову користувача з HR-асистентом Redmine. "
+    "Збережи номери завдань, дати, години, імена та незавершені запити. "
+    "Відповідай мовою розмови, без вступу, не більше кількох речень."
+)
+
+
+class _SessionMemory:
+    """Пам'ять однієї сесії: підсумок + вікно останніх повідомлень"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.summary = ""
+        self.window: List[Dict] = []  # {"role", "content", "tokens"}
+        self.window_tokens = 0
+        self.overflow: List[Dict] = []  # Витіснені з вікна, чекають на підсумовування
+        self.summarizing = False
+        self.cached_context: Optional[str] = None
+
+
 class ChatHistoryManager:
-    def __init__(self, max_token_limit: int = 2000, k: int = 10):
-        self.window_memory = ConversationBufferWindowMemory(
-            memory_key="chat_history",
-            k=k,
-            return_messages=True,
-        )
-        self.summary_memory = ConversationSummaryBufferMemory(
-            memory_key="chat_summary",
-            max_token_limit=max_token_limit,
-            return_messages=True,
-        )
-
-    def add_message(self, user_message: str, ai_response: str):
-        self.window_memory.chat_memory.add_user_message(user_message)
-        self.window_memory.chat_memory.add_ai_message(ai_response)
-
-        self.summary_memory.chat_memory.add_user_message(user_message)
-        self.summary_memory.chat_memory.add_ai_message(ai_response)
-
-    def get_history(self, format_type: str = "gradio") -> List:
-        messages = self.window_memory.chat_memory.messages
+    """Пам'ять розмови з бюджетом токенів: вікно останніх повідомлень + фоновий підсумок старіших"""
+
+    def __init__(self, openai_client=None, max_token_limit: int = 2000, summary_token_limit: int = 300,
+                 message_token_limit: int = 500, summary_model: str = "gpt-4.1-nano", max_sessions: int = 1000):
+        """
+        Args:
+            openai_client: Клієнт OpenAI для підсумовування (без нього підсумок - обрізаний текст)
+            max_token_limit: Бюджет токенів вікна останніх повідомлень
+            summary_token_limit: Максимальний розмір підсумку
+            message_token_limit: Максимальний розмір одного повідомлення у вікні
+            summary_model: Дешева модель для підсумовування
+            max_sessions: Скільки сесій тримати в пам'яті (найдавніше використані витісняються)
+        """
+        self.openai_client = openai_client
+        self.gateway = OpenAIGateway(openai_client) if openai_client is not None else None
+        self.max_token_limit = max_token_limit
+        self.summary_token_limit = summary_token_limit
+        self.message_token_limit = message_token_limit
+        self.summary_model = summary_model
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, _SessionMemory]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+
+    def _session(self, session_id: str) -> _SessionMemory:
+        with self._sessions_lock:
+            if session_id not in self.sessions:
+                self.sessions[session_id] = _SessionMemory()
+                if len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            else:
+                self.sessions.move_to_end(session_id)
+            return self.sessions[session_id]
+
+    def add_message(self, user_message: str, ai_response: str, session_id: str = "default"):
+        memory = self._session(session_id)
+        with memory.lock:
+            self._append(memory, "user", user_message)
+            self._append(memory, "assistant", ai_response)
+            # Витісняємо найстаріші повідомлення, поки вікно не вкладеться в бюджет
+            while memory.window_tokens > self.max_token_limit and len(memory.window) > 2:
+                message = memory.window.pop(0)
+                memory.window_tokens -= message["tokens"]
+                memory.overflow.append(message)
+            memory.cached_context = None
+            start_summary = bool(memory.overflow) and not memory.summarizing
+            if start_summary:
+                memory.summarizing = True
+        if start_summary:
+            self._executor.submit(self._summarize, memory)
+
+    def _append(self, memory: _SessionMemory, role: str, content: str):
+        content = truncate_to_tokens(content or "", self.message_token_limit)
+        tokens = count_tokens(content)
+        memory.window.append({"role": role, "content": content, "tokens": tokens})
+        memory.window_tokens += tokens
+
+    def _summarize(self, memory: _SessionMemory):
+        """Фоново додає витіснені повідомлення в підсумок"""
+        while True:
+            with memory.lock:
+                overflow, memory.overflow = memory.overflow, []
+                summary = memory.summary
+                if not overflow:
+                    memory.summarizing = False
+                    return
+
+            dialogue = "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in overflow)
+            new_summary = None
+            if self.gateway is not None:
+                try:
+                    # Фонове підсумовування поступається запитам користувачів
+                    response = self.gateway.chat(
+                        priority=PRIORITY_LOW,
+                        model=self.summary_model,
+                        messages=[
+                            {"role": "system", "content": SUMMARY_PROMPT},
+                            {"role": "user", "content": f"Попередній підсумок:\n{summary or '-'}\n\nНові повідомлення:\n{dialogue}"}
+                        ],
+                        max_completion_tokens=self.summary_token_limit,
+                        temperature=0,
+                    )
+                    new_summary = response.choices[0].message.content
+                except Exception as e:
+                    print(f"Помилка підсумовування історії: {e}")
+            if not new_summary:
+                # Без LLM лишаємо найновішу частину тексту в межах бюджету
+                new_summary = truncate_to_tokens(f"{summary}\n{dialogue}".strip(), self.summary_token_limit, from_start=True)
+
+            with memory.lock:
+                memory.summary = truncate_to_tokens(new_summary.strip(), self.summary_token_limit)
+                memory.cached_context = None
+
+    def get_context(self, session_id: str = "default") -> str:
+        """Компактний контекст розмови для промпту (кешується до наступного повідомлення)"""
+        memory = self._session(session_id)
+        with memory.lock, span("memory.get_context", cache_hit=memory.cached_context is not None):
+            if memory.cached_context is None:
+                parts = []
+                if memory.summary:
+                    parts.append(f"Summary of earlier conversation: {memory.summary}")
+                parts.extend(f"{m['role'].capitalize()}: {m['content']}" for m in memory.window)
+                memory.cached_context = "\n".join(parts)
+            return memory.cached_context
+
+    def get_history(self, format_type: str = "gradio", session_id: str = "default") -> List:
+        memory = self._session(session_id)
+        with memory.lock:
+            messages = list(memory.window)
         if format_type == "gradio":
             history = []
             for i in range(0, len(messages), 2):
                 if i + 1 < len(messages):
-                    user_msg = messages[i].content
-                    ai_msg = messages[i + 1].content
-                    history.append([user_msg, ai_msg])
+                    history.append([messages[i]["content"], messages[i + 1]["content"]])
             return history
         elif format_type == "openai":
-            return  [
-                {"role": "user" if isinstance(msg, HumanMessage) else "assistant", 
-                 "content": msg.content}
-                for msg in messages
-            ]
-    def clear_history(self):
-        self.window_memory.clear()
-        self.summary_memory.clear()
-    def save_to_file(self, file_path: str):
-        history = self.get_history("openai")
+            return [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+
+    def clear_history(self, session_id: Optional[str] = None):
+        with self._sessions_lock:
+            if session_id is None:
+                self.sessions.clear()
+            else:
+                self.sessions.pop(session_id, None)
+
+    def save_to_file(self, file_path: str, session_id: str = "default"):
+        history = self.get_history("openai", session_id)
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(history, f, ensure_ascii=False, indent=2)
-    def load_from_file(self, filepath: str):
+
+    def load_from_file(self, filepath: str, session_id: str = "default"):
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
                 history = json.load(f)
-            
-            self.clear_history()
+
+            self.clear_history(session_id)
+            user_message = None
             for msg in history:
                 if msg["role"] == "user":
-                    self.window_memory.chat_memory.add_user_message(msg["content"])
-                    self.summary_memory.chat_memory.add_user_message(msg["content"])
-                elif msg["role"] == "assistant":
-                    self.window_memory.chat_memory.add_ai_message(msg["content"])
-                    self.summary_memory.chat_memory.add_ai_message(msg["content"])
+                    user_message = msg["content"]
+                elif msg["role"] == "assistant" and user_message is not None:
+                    self.add_message(user_message, msg["content"], session_id)
+                    user_message = None
         except FileNotFoundError:
             pass
@@ -0,0 +1,111 @@
+"""Circuit breaker для зовнішніх сервісів (Pinecone, OpenAI, Redmine, Google)"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+from metrics import CIRCUIT_REJECTED, CIRCUIT_STATE
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Сервіс вважається недоступним - виклик відхилено без звернення до нього"""
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Для HTTP сервісів: збій - це мережа, тайм-аут або 5xx, а не 4xx на конкретний запит"""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status is None or status >= 500
+
+
+class CircuitBreaker:
+    """closed -> (failure_threshold збоїв поспіль) -> open -> (reset_timeout) -> half_open -> пробний виклик"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_max_calls: int = 1, is_failure: Optional[Callable[[Exception], bool]] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure or (lambda error: True)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(_STATE_VALUES[CLOSED], name=name)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            print(f"🔌 Circuit {self.name}: {self.state} -> {state}")
+            self.state = state
+            CIRCUIT_STATE.set(_STATE_VALUES[state], name=self.name)
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    CIRCUIT_REJECTED.inc(name=self.name)
+                    raise CircuitOpenError(f"{self.name} недоступний (circuit open)")
+                self._set_state(HALF_OPEN)
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    CIRCUIT_REJECTED.inc(name=self.name)
+                    raise CircuitOpenError(f"{self.name} перевіряється (circuit half-open)")
+                self._probes += 1
+
+    def _on_success(self):
+        with self._lock:
+            self.failures = 0
+            self._set_state(CLOSED)
+
+    def _on_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure(e):
+                self._on_failure()
+            else:
+                # Помилка запиту (напр. 404), а не сервісу
+                self._on_success()
+            raise
+        self._on_success()
+        return result
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str, is_failure: Optional[Callable[[Exception], bool]] = None) -> CircuitBreaker:
+    """Один breaker на сервіс для всього процесу.
+
+    Пороги: CIRCUIT_FAILURE_THRESHOLD / CIRCUIT_RESET_SECONDS, для окремого сервісу -
+    CIRCUIT_<NAME>_FAILURE_THRESHOLD / CIRCUIT_<NAME>_RESET_SECONDS (напр. CIRCUIT_REDMINE_RESET_SECONDS).
+    """
+    with _breakers_lock:
+        if name not in _breakers:
+            prefix = "CIRCUIT_" + name.upper().replace(".", "_").replace("-", "_")
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(os.getenv(f"{prefix}_FAILURE_THRESHOLD", os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))),
+                reset_timeout=float(os.getenv(f"{prefix}_RESET_SECONDS", os.getenv("CIRCUIT_RESET_SECONDS", 30))),
+                is_failure=is_failure,
+            )
+        return _breakers[name]
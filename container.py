@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from dotenv import load_dotenv
+load_dotenv(".env")
+
+
+class Container:
+    """Спільні для процесу компоненти: кожен створюється один раз, при першому зверненні"""
+
+    def __init__(self):
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self.startup_timings: Dict[str, float] = {}
+        # Час створення вкладених залежностей (щоб не рахувати його двічі)
+        self._nested_seconds = []
+        self._providers: Dict[str, Callable[[], Any]] = {
+            "openai_client": self._create_openai_client,
+            "google_search": self._create_google_search,
+            "redmine_api": self._create_redmine_api,
+            "rag_engine": self._create_rag_engine,
+            "workflow": self._create_workflow,
+        }
+
+    def get(self, name: str) -> Any:
+        """Компонент за назвою (створюється при першому виклику)"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                if name not in self._providers:
+                    raise KeyError(f"Невідомий компонент: {name}")
+                started = time.perf_counter()
+                self._nested_seconds.append(0.0)
+                try:
+                    self._instances[name] = self._providers[name]()
+                finally:
+                    nested = self._nested_seconds.pop()
+                elapsed = time.perf_counter() - started
+                self.startup_timings[name] = round(elapsed - nested, 3)
+                if self._nested_seconds:
+                    self._nested_seconds[-1] += elapsed
+                print(f"⚙️ {name} створено за {self.startup_timings[name]} с")
+        return self._instances[name]
+
+    def warm_up(self, *names: str) -> Dict[str, float]:
+        """Створює компоненти заздалегідь (при старті процесу, а не на першому запиті)"""
+        for name in names or self._providers:
+            self.get(name)
+        return self.startup_timings
+
+    def startup_report(self) -> str:
+        total = sum(self.startup_timings.values())
+        lines = [f"   {name}: {seconds} с" for name, seconds in self.startup_timings.items()]
+        return "\n".join([f"🚀 Старт компонентів: {round(total, 3)} с"] + lines)
+
+    def _create_openai_client(self):
+        from openai import OpenAI
+        return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    def _create_google_search(self):
+        from tools.google_search import GoogleSearchTool
+        return GoogleSearchTool()
+
+    def _create_redmine_api(self):
+        from tools.redmine_api import RedmineAPI
+        redmine_api = RedmineAPI(google_search=self.get("google_search"))
+        if os.getenv("REDMINE_MIRROR_ENABLED", "true").lower() != "false" and redmine_api.state.redmine_api_key:
+            from concurrent.futures import ThreadPoolExecutor
+            from redmine_mirror import RedmineMirror
+            redmine_api.mirror = RedmineMirror(
+                redmine_api.fetch_live,
+                db_path=os.getenv("REDMINE_MIRROR_DB", "data/redmine_mirror.db"),
+                # Свій пул: повний sync не займає воркерів інтерактивних списків
+                executor=ThreadPoolExecutor(
+                    max_workers=int(os.getenv("REDMINE_MIRROR_PAGE_WORKERS", 2)),
+                    thread_name_prefix="redmine-mirror-page"
+                )
+            )
+            redmine_api.mirror.start()
+        return redmine_api
+
+    def _create_rag_engine(self):
+        from rag_engine import RAGEngine
+        return RAGEngine(
+            pinecone_index_name=os.getenv("PINECONE_INDEX_NAME"),
+            openai_client=self.get("openai_client")
+        )
+
+    def _create_workflow(self):
+        from workflow import Workflow
+        return Workflow(self.get("openai_client"), redmine_api=self.get("redmine_api"))
+
+
+_container = None
+_container_lock = threading.Lock()
+
+
+def get_container() -> Container:
+    """Один контейнер на процес"""
+    global _container
+    if _container is None:
+        with _container_lock:
+            if _container is None:
+                _container = Container()
+    return _container
@@ -0,0 +1,122 @@
+import re
+from typing import List, Dict, Any, Optional
+
+from token_counter import count_tokens, truncate_to_sentence
+
+# Вага типу фрагмента: результат функції - пряма відповідь на запит, історія - лише допоміжна
+KIND_WEIGHTS = {
+    "tool": 1.5,
+    "rag": 1.0,
+    "history": 0.8,
+    "sources": 0.6,
+}
+# Порядок фрагментів у промпті (незалежно від рангу)
+KIND_ORDER = ["history", "tool", "rag", "sources"]
+KIND_TITLES = {
+    "history": "Conversation context",
+    "tool": "Execution result",
+    "rag": "Knowledge base",
+    "sources": "Sources",
+}
+
+
+class ContextAssembler:
+    """Збирає контекст для промпту в межах бюджету токенів"""
+
+    def __init__(self, max_tokens: int = 2000, max_piece_share: float = 0.6,
+                 duplicate_threshold: float = 0.8, model: Optional[str] = None):
+        """
+        Args:
+            max_tokens: Бюджет токенів усього контексту
+            max_piece_share: Максимальна частка бюджету для одного фрагмента
+            duplicate_threshold: Схожість (Jaccard по шинглах), з якої фрагменти вважаються дублікатами
+            model: Модель для токенізатора
+        """
+        self.max_tokens = max_tokens
+        self.max_piece_share = max_piece_share
+        self.duplicate_threshold = duplicate_threshold
+        self.model = model
+
+    def assemble(self, query: str, pieces: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Args:
+            query: Запит користувача (для оцінки релевантності)
+            pieces: [{"kind": "tool"|"rag"|"history"|"sources", "text": str, "score": float}]
+
+        Returns:
+            {"text", "tokens", "original_tokens", "saved_tokens", "pieces_used", "pieces_dropped"}
+        """
+        candidates = []
+        original_tokens = 0
+        for piece in pieces:
+            text = (piece.get("text") or "").strip()
+            if not text:
+                continue
+            tokens = count_tokens(text, self.model)
+            original_tokens += tokens
+            kind = piece.get("kind", "rag")
+            rank = KIND_WEIGHTS.get(kind, 1.0) * (0.5 + self._relevance(query, text)) * piece.get("score", 1.0)
+            candidates.append({"kind": kind, "text": text, "tokens": tokens, "rank": rank})
+
+        candidates.sort(key=lambda c: c["rank"], reverse=True)
+
+        selected = []
+        dropped = 0
+        used_tokens = 0
+        piece_limit = int(self.max_tokens * self.max_piece_share)
+        for candidate in candidates:
+            if self._is_duplicate(candidate["text"], selected):
+                dropped += 1
+                continue
+            remaining = self.max_tokens - used_tokens
+            limit = min(remaining, piece_limit)
+            if limit < 20:
+                dropped += 1
+                continue
+            if candidate["tokens"] > limit:
+                candidate["text"] = truncate_to_sentence(candidate["text"], limit, self.model)
+                candidate["tokens"] = count_tokens(candidate["text"], self.model)
+            selected.append(candidate)
+            used_tokens += candidate["tokens"]
+
+        sections = []
+        for kind in KIND_ORDER + sorted({c["kind"] for c in selected} - set(KIND_ORDER)):
+            texts = [c["text"] for c in selected if c["kind"] == kind]
+            if texts:
+                sections.append(f"{KIND_TITLES.get(kind, kind.capitalize())}:\n" + "\n\n".join(texts))
+
+        return {
+            "text": "\n\n".join(sections),
+            "tokens": used_tokens,
+            "original_tokens": original_tokens,
+            "saved_tokens": max(0, original_tokens - used_tokens),
+            "pieces_used": len(selected),
+            "pieces_dropped": dropped,
+        }
+
+    def _relevance(self, query: str, text: str) -> float:
+        """Частка слів запиту, що зустрічаються у фрагменті (по основі з 5 літер)"""
+        query_stems = self._stems(query)
+        if not query_stems:
+            return 0.0
+        return len(query_stems & self._stems(text)) / len(query_stems)
+
+    @staticmethod
+    def _stems(text: str) -> set:
+        return {word[:5] for word in re.findall(r"\w{3,}", text.lower())}
+
+    def _is_duplicate(self, text: str, selected: List[Dict]) -> bool:
+        shingles = self._shingles(text)
+        if not shingles:
+            return False
+        for other in selected:
+            other_shingles = other.setdefault("shingles", self._shingles(other["text"]))
+            union = len(shingles | other_shingles)
+            if union and len(shingles & other_shingles) / union >= self.duplicate_threshold:
+                return True
+        return False
+
+    @staticmethod
+    def _shingles(text: str, size: int = 3) -> set:
+        words = re.findall(r"\w+", text.lower())
+        return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))} if words else set()
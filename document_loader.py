@@ -1,22 +1,39 @@
-import os, re, hashlib, logging, PyPDF2, ebooklib, chardet
-from typing import List, Dict, Optional
+import os, re, json, time, random, hashlib, logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple
 from pathlib import Path
-import pandas as pd
-from docx import Document
-from ebooklib import epub
-from bs4 import BeautifulSoup
-from sentence_transformers import SentenceTransformer
 
+# Парсери форматів (PyPDF2, docx, pandas, ebooklib, bs4, chardet) і torch імпортуються
+# при першому використанні - --check та інші команди без файлів стартують без них
 from openai import OpenAI
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
 
 load_dotenv(".env")
 
+
+def _extract_pdf_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str, float]]:
+    """Витягує текст зі сторінок [start, end) PDF (виконується у воркері пулу)"""
+    import PyPDF2
+    pages = []
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page_num in range(start, end):
+            started = time.perf_counter()
+            try:
+                page_text = reader.pages[page_num].extract_text() or ""
+            except Exception as e:
+                logging.error(f"Помилка читання сторінки {page_num + 1} PDF {file_path}: {e}")
+                page_text = ""
+            pages.append((page_num, page_text, time.perf_counter() - started))
+    return pages
+
+
 class DocumentLoader:
     """Завантажувач документів в Pinecone векторну базу"""
     
-    def __init__(self, pinecone_index_name: str, auto_create_index: bool = True, dimension: int = 1024):
+    def __init__(self, pinecone_index_name: str, auto_create_index: bool = True, dimension: int = 1024,
+                 index=None, openai_client: OpenAI = None):
         """
         Ініціалізація DocumentLoader
         
@@ -24,16 +41,21 @@ class DocumentLoader:
             pinecone_index_name: Назва індексу Pinecone
             auto_create_index: Автоматично створювати індекс якщо не існує
             dimension: Розмірність векторів (768 для multilingual-e5-base)
+            index: Готовий індекс (напр. локальний для бенчмарку) замість Pinecone
+            openai_client: Готовий клієнт OpenAI
         """
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.openai_client = openai_client or OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         
-        # Pinecone
-        self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
         self.index_name = pinecone_index_name
         self.dimension = dimension
-        
-        # Ініціалізуємо індекс (створюємо якщо не існує)
-        self.index = self._init_pinecone_index(auto_create_index)
+        if index is not None:
+            self.pc = None
+            self.index = index
+        else:
+            # Pinecone
+            self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+            # Ініціалізуємо індекс (створюємо якщо не існує)
+            self.index = self._init_pinecone_index(auto_create_index)
         
         # Автоматично визначаємо модель embedding на основі розмірності індексу
         self._detect_embedding_model()
@@ -41,6 +63,21 @@ class DocumentLoader:
         # Налаштування
         self.chunk_size = 1000  # Розмір чанків
         self.chunk_overlap = 200  # Перекриття між чанками
+        self.pdf_workers = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))  # Процесів для PDF
+        self.pdf_pages_per_task = int(os.getenv("PDF_PAGES_PER_TASK", 16))  # Сторінок на одну задачу
+        
+        # Upsert в Pinecone
+        self.upsert_concurrency = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", 4))  # Паралельних запитів
+        self.upsert_max_bytes = int(os.getenv("PINECONE_UPSERT_MAX_BYTES", 2 * 1024 * 1024 * 9 // 10))  # Ліміт 2MB із запасом
+        self.upsert_max_vectors = int(os.getenv("PINECONE_UPSERT_MAX_VECTORS", 1000))  # Ліміт Pinecone на запит
+        self.upsert_retries = int(os.getenv("PINECONE_UPSERT_RETRIES", 4))
+        self.upsert_backoff = float(os.getenv("PINECONE_UPSERT_BACKOFF", 0.5))  # Базова затримка, с
+        self.delete_batch_size = 1000  # Ліміт Pinecone на кількість ID в одному delete
+        self.source_query_top_k = 1000  # ID документа за метаданими за один запит (ліміт Pinecone для top_k)
+        
+        # Namespace для запису/видалення та локальна мапа source -> ID чанків
+        self.namespace = os.getenv("PINECONE_NAMESPACE", "")
+        self.source_map_path = Path(os.getenv("SOURCE_CHUNK_MAP", "data/source_chunk_map.json"))
         
         # Підтримувані формати
         self.supported_formats = {
@@ -275,7 +312,7 @@ class DocumentLoader:
                 'is_empty': True
             }
     
-    def load_directory(self, directory_path: str, recursive: bool = True) -> Dict:
+    def load_directory(self, directory_path: str, recursive: bool = True, replace: bool = False) -> Dict:
         """Завантаження всіх файлів з директорії"""
         directory = Path(directory_path)
         if not directory.exists() or not directory.is_dir():
@@ -324,7 +361,7 @@ class DocumentLoader:
                 print(f"\n📄 Обробляю файл {i}/{len(files_to_process)}: {file_path.name}")
                 
                 # file_path вже є Path об'єктом, конвертуємо в строку
-                result = self.load_file(str(file_path))
+                result = self.load_file(str(file_path), replace=replace)
                 results.append(result)
                 
                 if result['success']:
@@ -356,9 +393,9 @@ class DocumentLoader:
             'results': results
         }
     
-    def load_file(self, file_path: str, source_name: Optional[str] = None) -> Dict:
+    def load_file(self, file_path: str, source_name: Optional[str] = None, replace: bool = False) -> Dict:
+        """Завантаження одного файлу (replace=True - замінює лише вектори цього документа)"""
         print(f"   Завантажено: {Path(file_path)} векторів")
-        """Завантаження одного файлу"""
         file_path = Path(file_path)
         if not file_path.exists():
             return {'success': False, 'error': f'Файл не існує: {file_path}'}
@@ -372,15 +409,33 @@ class DocumentLoader:
             }
         
         try:            
-            # Витягуємо текст з файлу
-            loader_func = self.supported_formats[file_ext]
-            text_content = loader_func(file_path)
+            # Витягуємо текст з файлу; PDF читаємо посторінково і одразу віддаємо в чанкер
+            extraction_stats = None
+            if file_ext == '.pdf':
+                extraction_stats = {}
+                parts = self._iter_pdf_pages(file_path, extraction_stats)
+            else:
+                loader_func = self.supported_formats[file_ext]
+                parts = [loader_func(file_path)]
             
-            if not text_content:
-                return {'success': False, 'error': 'Файл порожній або не вдалося витягти текст'}
+            text_length = 0
+            def _count(parts: Iterable[str]) -> Iterator[str]:
+                nonlocal text_length
+                for part in parts:
+                    text_length += len(part)
+                    yield part
             
             # Розбиваємо на чанки
-            chunks = self._split_text(text_content)
+            chunks = list(self._iter_chunks(_count(parts)))
+            
+            if extraction_stats:
+                self._log_extraction_stats(file_path, extraction_stats)
+            
+            if not text_length:
+                result = {'success': False, 'error': 'Файл порожній або не вдалося витягти текст'}
+                if extraction_stats:
+                    result['extraction'] = extraction_stats
+                return result
             
             if not chunks:
                 return {'success': False, 'error': 'Не вдалося створити чанки'}
@@ -388,7 +443,19 @@ class DocumentLoader:
             # Завантажуємо в Pinecone
             source = source_name or file_path.name
             
-            result = self._upload_chunks(chunks, source, str(file_path))
+            # При заміні не завантажуємо чанки, що не змінились (ID містить хеш тексту)
+            previous_ids = set()
+            replaced_deleted = 0
+            if replace:
+                ids, complete = self._source_ids(source)
+                if complete:
+                    previous_ids = set(ids)
+                else:
+                    # Запит повернув повну сторінку - всіх старих ID не знаємо, видаляємо документ перед завантаженням
+                    logging.warning(f"'{source}': понад {self.source_query_top_k} старих векторів, документ перезавантажується повністю")
+                    replaced_deleted = self._delete_by_source_query(source)['deleted']
+            
+            result = self._upload_chunks(chunks, source, str(file_path), skip_ids=previous_ids)
             
             if result.get('error'):
                 return {
@@ -397,36 +464,113 @@ class DocumentLoader:
                     'partial_upload': result.get('uploaded', 0)
                 }
             
-            return {
+            stale_deleted = replaced_deleted
+            if replace:
+                stale_ids = previous_ids - set(result['ids'])
+                if stale_ids and not result.get('errors'):
+                    stale_deleted += self._delete_ids(sorted(stale_ids))['deleted']
+                self._update_source_map(source, result['ids'], replace=not result.get('errors'))
+            else:
+                self._update_source_map(source, result['ids'])
+            
+            response = {
                 'success': True,
                 'file': str(file_path),
                 'source': source,
                 'chunks_created': len(chunks),
                 'vectors_uploaded': result['uploaded'],
-                'text_length': len(text_content)
+                'text_length': text_length,
+                'vectors_skipped': result.get('skipped', 0),
+                'stale_deleted': stale_deleted,
+                'upload_seconds': result.get('seconds', 0.0),
+                'vectors_per_second': result.get('vectors_per_second', 0.0)
             }
+            if result.get('errors'):
+                response['errors'] = result['errors']
+            if extraction_stats:
+                response['extraction'] = extraction_stats
+            return response
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
     def _load_pdf(self, file_path: Path) -> str:
         """Завантаження PDF"""
-        text = ""
+        return "".join(self._iter_pdf_pages(file_path)).strip()
+    
+    def _iter_pdf_pages(self, file_path: Path, stats: Optional[Dict] = None) -> Iterator[str]:
+        """Паралельне витягування тексту PDF діапазонами сторінок, віддає сторінки по порядку"""
+        if stats is None:
+            stats = {}
+        started = time.perf_counter()
+        page_timings = []
+        empty_pages = []
+        
         try:
+            import PyPDF2
             with open(file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page_num, page in enumerate(reader.pages):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += f"\n--- Сторінка {page_num + 1} ---\n{page_text}\n"
+                total_pages = len(PyPDF2.PdfReader(file).pages)
         except Exception as e:
             logging.error(f"Помилка читання PDF {file_path}: {e}")
+            stats.update({'pages': 0, 'error': str(e)})
+            return
         
-        return text.strip()
+        step = max(1, self.pdf_pages_per_task)
+        ranges = [(start, min(start + step, total_pages)) for start in range(0, total_pages, step)]
+        workers = min(self.pdf_workers, len(ranges))
+        
+        def _page_batches() -> Iterator[List[Tuple[int, str, float]]]:
+            if workers <= 1:
+                for start, end in ranges:
+                    yield _extract_pdf_page_range(str(file_path), start, end)
+                return
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # map повертає результати в порядку діапазонів, навіть якщо воркери закінчують у різний час
+                yield from executor.map(
+                    _extract_pdf_page_range,
+                    [str(file_path)] * len(ranges),
+                    [start for start, _ in ranges],
+                    [end for _, end in ranges],
+                )
+        
+        try:
+            for batch in _page_batches():
+                for page_num, page_text, elapsed in batch:
+                    page_timings.append((page_num + 1, elapsed))
+                    if not page_text.strip():
+                        empty_pages.append(page_num + 1)
+                        continue
+                    yield f"\n--- Сторінка {page_num + 1} ---\n{page_text}\n"
+        except Exception as e:
+            logging.error(f"Помилка читання PDF {file_path}: {e}")
+            stats['error'] = str(e)
+        finally:
+            slowest = sorted(page_timings, key=lambda item: item[1], reverse=True)[:5]
+            stats.update({
+                'pages': total_pages,
+                'workers': max(workers, 1),
+                'empty_pages': empty_pages,
+                'empty_ratio': round(len(empty_pages) / total_pages, 3) if total_pages else 0.0,
+                'extract_seconds': round(time.perf_counter() - started, 3),
+                'page_seconds': {page: round(elapsed, 4) for page, elapsed in page_timings},
+                'slowest_pages': [{'page': page, 'seconds': round(elapsed, 4)} for page, elapsed in slowest],
+            })
+    
+    def _log_extraction_stats(self, file_path: Path, stats: Dict):
+        """Виводить статистику витягування тексту з PDF"""
+        print(f"   📑 {file_path.name}: {stats.get('pages', 0)} сторінок за {stats.get('extract_seconds', 0)} с "
+              f"({stats.get('workers', 1)} воркерів)")
+        if stats.get('slowest_pages'):
+            slowest = ", ".join(f"{p['page']} ({p['seconds']} с)" for p in stats['slowest_pages'])
+            print(f"   🐢 Найповільніші сторінки: {slowest}")
+        if stats.get('empty_pages'):
+            print(f"   ⚠️ Сторінок без текстового шару: {len(stats['empty_pages'])} "
+                  f"({stats['empty_ratio'] * 100:.0f}%) - можливо, скановані, потрібен OCR")
     
     def _load_docx(self, file_path: Path) -> str:
         """Завантаження DOCX"""
         try:
+            from docx import Document
             doc = Document(file_path)
             text = ""
             
@@ -449,6 +593,7 @@ class DocumentLoader:
     def _load_excel(self, file_path: Path) -> str:
         """Завантаження Excel"""
         try:
+            import pandas as pd
             # Читаємо всі листи
             dfs = pd.read_excel(file_path, sheet_name=None)
             text = ""
@@ -465,6 +610,7 @@ class DocumentLoader:
     def _load_csv(self, file_path: Path) -> str:
         """Завантаження CSV"""
         try:
+            import pandas as pd
             df = pd.read_csv(file_path)
             return df.to_string(index=False)
         except Exception as e:
@@ -473,6 +619,9 @@ class DocumentLoader:
     def _load_epub(self, file_path: Path) -> str:
         """Завантаження EPUB"""
         try:
+            import ebooklib
+            from ebooklib import epub
+            from bs4 import BeautifulSoup
             book = epub.read_epub(file_path)
             text = ""
             
@@ -491,6 +640,7 @@ class DocumentLoader:
     def _load_text(self, file_path: Path) -> str:
         """Завантаження текстових файлів"""
         try:
+            import chardet
             # Визначаємо кодування
             with open(file_path, 'rb') as file:
                 raw_data = file.read()
@@ -505,13 +655,24 @@ class DocumentLoader:
     
     def _split_text(self, text: str) -> List[str]:
         """Розбиття тексту на чанки"""
-        chunks = []
-        
+        return list(self._iter_chunks([text]))
+    
+    def _iter_chunks(self, parts: Iterable[str]) -> Iterator[str]:
+        """Потокове розбиття тексту на чанки (текст може надходити частинами, напр. сторінками PDF)"""
         # Простий алгоритм розбиття по реченнях
-        sentences = text.split('.')
         current_chunk = ""
+        tail = ""
         
-        for sentence in sentences:
+        def _sentences() -> Iterator[str]:
+            nonlocal tail
+            for part in parts:
+                # Речення може переходити з однієї частини в іншу, тому незавершений хвіст переносимо
+                pieces = (tail + part).split('.')
+                tail = pieces.pop()
+                yield from pieces
+            yield tail
+        
+        for sentence in _sentences():
             sentence = sentence.strip()
             if not sentence:
                 continue
@@ -521,86 +682,63 @@ class DocumentLoader:
                 current_chunk += sentence + ". "
             else:
                 if current_chunk:
-                    chunks.append(current_chunk.strip())
+                    yield current_chunk.strip()
                 current_chunk = sentence + ". "
         
         # Додаємо останній чанк
         if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks
+            yield current_chunk.strip()
     
-    def _upload_chunks(self, chunks: List[str], source: str, file_path: str) -> Dict:
-        """Завантаження чанків в Pinecone з детальним логуванням"""
+    def _upload_chunks(self, chunks: List[str], source: str, file_path: str, skip_ids: Optional[set] = None) -> Dict:
+        """Завантаження чанків в Pinecone: кілька батчів одночасно, розмір батча під ліміт запиту"""
+        ids = []
+        skip_ids = skip_ids or set()
         uploaded = 0
+        retries = 0
+        batches_sent = 0
         errors = []
+        started = time.perf_counter()
         
         try:
             # Перевіряємо підключення перед початком
-            stats = self.index.describe_index_stats()
-            initial_count = stats.total_vector_count            
-            vectors_to_upsert = []
+            self.index.describe_index_stats()
             
-            for i, chunk in enumerate(chunks):
-                if not chunk.strip():
-                    continue
-                
-                try:
-                    # Генеруємо embedding
-                    embedding = self._get_embedding(chunk)
-                    # Створюємо унікальний ID (ASCII тільки)
-                    chunk_id = self._generate_chunk_id(source, i, chunk)
-                    # Очищуємо метадані від проблемних символів
-                    clean_source = self._clean_text_for_metadata(source)
-                    clean_file_path = self._clean_text_for_metadata(file_path)
-                    clean_chunk = chunk[:1000]  # Обмежуємо розмір метаданих
-                    
-                    # Метадані
-                    metadata = {
-                        'text': clean_chunk,
-                        'source': clean_source,
-                        'file_path': clean_file_path,
-                        'chunk_index': i,
-                        'title': f"{clean_source} - частина {i+1}"
-                    }
-                    
-                    vector = {
-                        'id': chunk_id,
-                        'values': embedding,
-                        'metadata': metadata
-                    }
-                    
-                    vectors_to_upsert.append(vector)
-                    
-                    # Завантажуємо батчами по 100
-                    if len(vectors_to_upsert) >= 100:
-                        # ДЕТАЛЬНЕ ЛОГУВАННЯ UPSERT
-                        try:
-                            upsert_response = self.index.upsert(vectors=vectors_to_upsert)
-                            uploaded += len(vectors_to_upsert)
-                            vectors_to_upsert = []
-                            
-                            # Перевіряємо чи дійсно додалися вектори
-                            import time
-                            time.sleep(1)  # Невелика пауза для індексації
-                            
-                        except Exception as upsert_error:
-                            errors.append(f"Upsert error: {str(upsert_error)}")
-                            vectors_to_upsert = []  # Очищуємо батч
-                            continue
-                
-                except Exception as chunk_error:
-                    error_msg = f"Чанк {i}: {str(chunk_error)}"
-                    errors.append(error_msg)
-                    continue
+            vectors = self._iter_vectors(chunks, source, file_path, errors, ids, skip_ids)
+            concurrency = max(1, self.upsert_concurrency)
             
-            # Завантажуємо останні вектори
-            if vectors_to_upsert:
-                try:
-                    uploaded += len(vectors_to_upsert)
-                except Exception as final_upsert_error:
-                    errors.append(f"Final upsert error: {str(final_upsert_error)}")
-            result = {'uploaded': uploaded}
+            def _collect(done):
+                nonlocal uploaded, retries
+                for future in done:
+                    batch_result = future.result()
+                    uploaded += batch_result['uploaded']
+                    retries += batch_result['retries']
+                    if batch_result.get('error'):
+                        errors.append(batch_result['error'])
+            
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                in_flight = set()
+                # Поки одні батчі летять в Pinecone, генеруємо embedding для наступних
+                for batch in self._iter_upsert_batches(vectors):
+                    in_flight.add(executor.submit(self._upsert_with_retry, batch))
+                    batches_sent += 1
+                    if len(in_flight) >= concurrency:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        _collect(done)
+                done, _ = wait(in_flight)
+                _collect(done)
+            
+            elapsed = time.perf_counter() - started
+            result = {
+                'uploaded': uploaded,
+                'ids': ids,
+                'skipped': len(set(ids) & skip_ids),
+                'batches': batches_sent,
+                'retries': retries,
+                'seconds': round(elapsed, 3),
+                'vectors_per_second': round(uploaded / elapsed, 2) if elapsed > 0 else 0.0
+            }
+            print(f"   📤 Завантажено {uploaded} векторів ({batches_sent} батчів, {retries} повторів) "
+                  f"за {result['seconds']} с - {result['vectors_per_second']} векторів/с")
             if errors:
                 result['errors'] = errors
                 result['error_count'] = len(errors)
@@ -610,10 +748,89 @@ class DocumentLoader:
         except Exception as e:
             return {
                 'uploaded': uploaded, 
+                'ids': ids,
                 'error': str(e),
                 'errors': errors
             }
     
+    def _iter_vectors(self, chunks: List[str], source: str, file_path: str, errors: List[str],
+                      ids: List[str], skip_ids: set) -> Iterator[Dict]:
+        """Генерує вектори з метаданими для кожного чанка (ID всіх чанків додаються в ids)"""
+        # Очищуємо метадані від проблемних символів
+        clean_source = self._clean_text_for_metadata(source)
+        clean_file_path = self._clean_text_for_metadata(file_path)
+        
+        for i, chunk in enumerate(chunks):
+            if not chunk.strip():
+                continue
+            
+            # Створюємо унікальний ID (ASCII тільки)
+            chunk_id = self._generate_chunk_id(source, i, chunk)
+            ids.append(chunk_id)
+            if chunk_id in skip_ids:
+                continue
+            
+            try:
+                # Генеруємо embedding
+                embedding = self._get_embedding(chunk)
+                
+                # Метадані
+                metadata = {
+                    'text': chunk[:1000],  # Обмежуємо розмір метаданих
+                    'source': clean_source,
+                    'file_path': clean_file_path,
+                    'chunk_index': i,
+                    'title': f"{clean_source} - частина {i+1}"
+                }
+                
+                yield {
+                    'id': chunk_id,
+                    'values': embedding,
+                    'metadata': metadata
+                }
+            
+            except Exception as chunk_error:
+                errors.append(f"Чанк {i}: {str(chunk_error)}")
+                continue
+    
+    def _iter_upsert_batches(self, vectors: Iterable[Dict]) -> Iterator[List[Dict]]:
+        """Групує вектори в батчі, що вкладаються в ліміт розміру запиту Pinecone"""
+        batch = []
+        batch_bytes = 0
+        
+        for vector in vectors:
+            # Розмір залежить від довжини метаданих, тому рахуємо для кожного вектора
+            vector_bytes = len(json.dumps(vector, ensure_ascii=False).encode('utf-8'))
+            if batch and (batch_bytes + vector_bytes > self.upsert_max_bytes
+                          or len(batch) >= self.upsert_max_vectors):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append(vector)
+            batch_bytes += vector_bytes
+        
+        if batch:
+            yield batch
+    
+    def _upsert_with_retry(self, batch: List[Dict]) -> Dict:
+        """Upsert одного батча з повторами та експоненційною затримкою"""
+        last_error = None
+        for attempt in range(self.upsert_retries + 1):
+            try:
+                self.index.upsert(vectors=batch, namespace=self.namespace)
+                return {'uploaded': len(batch), 'retries': attempt}
+            except Exception as upsert_error:
+                last_error = upsert_error
+                if attempt < self.upsert_retries:
+                    delay = self.upsert_backoff * (2 ** attempt)
+                    time.sleep(delay + random.uniform(0, delay))
+        
+        return {
+            'uploaded': 0,
+            'retries': self.upsert_retries,
+            'error': f"Upsert error ({len(batch)} векторів): {str(last_error)}"
+        }
+    
     def _clean_text_for_metadata(self, text: str) -> str:
         """Очищення тексту для безпечного збереження в метаданих"""
         import re
@@ -677,7 +894,8 @@ class DocumentLoader:
             
             # Ініціалізуємо модель якщо ще не ініціалізована
             if not hasattr(self, '_local_model'):
-                # Модель для української мови з розмірністю 768
+                # Модель для української мови з розмірністю 768 (torch вантажиться лише тут)
+                from sentence_transformers import SentenceTransformer
                 self._local_model = SentenceTransformer('intfloat/multilingual-e5-base')
             
             embedding = self._local_model.encode(text).tolist()
@@ -722,20 +940,146 @@ class DocumentLoader:
         
         return chunk_id
     
-    def clear_index(self) -> Dict:
-        """ОБЕРЕЖНО: Очищення всього індексу"""
+    def clear_index(self, namespace: Optional[str] = None) -> Dict:
+        """ОБЕРЕЖНО: Очищення індексу (одного namespace або всіх)"""
         try:
-            # Отримуємо всі ID
             stats = self.index.describe_index_stats()
             if stats.total_vector_count == 0:
                 return {'success': True, 'message': 'Індекс вже порожній'}
             
-            # Видаляємо все (це небезпечна операція!)
-            self.index.delete(delete_all=True)
+            # delete_all без namespace чистить лише namespace '', тому проходимо по всіх
+            namespaces = dict(stats.namespaces) if stats.namespaces else {'': {'vector_count': stats.total_vector_count}}
+            if namespace is not None:
+                namespaces = {namespace: namespaces.get(namespace, {'vector_count': 0})}
+            
+            deleted = 0
+            for ns, data in namespaces.items():
+                if not data['vector_count']:
+                    continue
+                # Видаляємо все (це небезпечна операція!)
+                self.index.delete(delete_all=True, namespace=ns)
+                deleted += data['vector_count']
+            
+            source_map = self._load_source_map()
+            for ns in namespaces:
+                source_map.pop(ns, None)
+            self._save_source_map(source_map)
+            
             return {
                 'success': True, 
-                'message': f'Видалено {stats.total_vector_count} векторів'
+                'message': f'Видалено {deleted} векторів',
+                'namespaces': list(namespaces.keys())
+            }
+            
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def delete_source(self, source: str) -> Dict:
+        """Видалення всіх векторів одного документа (за source) батчами"""
+        try:
+            known_ids = self._load_source_map().get(self.namespace, {}).get(source)
+            if known_ids:
+                result = self._delete_ids(list(known_ids))
+            else:
+                # Документ завантажено без мапи - шукаємо за точним source у метаданих
+                result = self._delete_by_source_query(source)
+                if not result['deleted']:
+                    return {
+                        'success': False,
+                        'source': source,
+                        'error': f"Документ '{source}' не знайдено ні в мапі ID, ні за метаданими source"
+                    }
+            
+            source_map = self._load_source_map()
+            source_map.get(self.namespace, {}).pop(source, None)
+            self._save_source_map(source_map)
+            
+            return {
+                'success': True,
+                'source': source,
+                'message': f"Видалено {result['deleted']} векторів документа '{source}'",
+                **result
             }
             
         except Exception as e:
-            return {'success': False, 'error': str(e)}
\ No newline at end of file
+            return {'success': False, 'source': source, 'error': str(e)}
+    
+    def get_source_ids(self, source: str) -> List[str]:
+        """ID чанків документа: з локальної мапи, або запитом з точним фільтром source у метаданих.
+        
+        ID не вгадуємо за префіксом: _generate_chunk_id відкидає не-ASCII символи та обрізає назву,
+        тому префікси різних документів збігаються. Помилку запиту не ковтаємо - краще відмовити,
+        ніж вважати документ новим.
+        """
+        return self._source_ids(source)[0]
+    
+    def _source_ids(self, source: str) -> Tuple[List[str], bool]:
+        """(ID чанків, чи це всі ID): запит за метаданими віддає не більше source_query_top_k"""
+        ids = self._load_source_map().get(self.namespace, {}).get(source)
+        if ids:
+            return list(ids), True
+        ids = self._query_source_ids(source)
+        return ids, len(ids) < self.source_query_top_k
+    
+    def _query_source_ids(self, source: str) -> List[str]:
+        """ID векторів з metadata.source == source (не більше source_query_top_k за запит)"""
+        dimension = self.index.describe_index_stats().dimension or self.dimension
+        # Потрібен лише фільтр, але query вимагає вектор; нульовий не підходить для cosine
+        probe = [1.0] + [0.0] * (dimension - 1)
+        # Фільтр виконується на сервері; без метаданих відповідь не впирається в ліміт розміру
+        response = self.index.query(
+            vector=probe,
+            top_k=self.source_query_top_k,
+            include_metadata=False,
+            filter={'source': {'$eq': self._clean_text_for_metadata(source)}},
+            namespace=self.namespace
+        )
+        return [match.id for match in response.matches]
+    
+    def _delete_by_source_query(self, source: str) -> Dict:
+        """Видаляє вектори документа сторінками запиту за метаданими, поки сторінки повні"""
+        result = {'deleted': 0, 'batches': 0}
+        seen = set()
+        while True:
+            # Видалення в Pinecone застосовується не миттєво - вже видалені ID можуть повернутись
+            page = self._query_source_ids(source)
+            ids = [chunk_id for chunk_id in page if chunk_id not in seen]
+            if not ids:
+                break
+            seen.update(ids)
+            deleted = self._delete_ids(ids)
+            result['deleted'] += deleted['deleted']
+            result['batches'] += deleted['batches']
+            if len(page) < self.source_query_top_k:
+                break
+        return result
+    
+    def _delete_ids(self, ids: List[str]) -> Dict:
+        """Видалення векторів за ID батчами по delete_batch_size"""
+        batches = 0
+        for start in range(0, len(ids), self.delete_batch_size):
+            self.index.delete(ids=ids[start:start + self.delete_batch_size], namespace=self.namespace)
+            batches += 1
+        return {'deleted': len(ids), 'batches': batches}
+    
+    def _load_source_map(self) -> Dict[str, Dict[str, List[str]]]:
+        """Локальна мапа {namespace: {source: [chunk_id, ...]}}"""
+        try:
+            with open(self.source_map_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+    
+    def _save_source_map(self, source_map: Dict[str, Dict[str, List[str]]]):
+        self.source_map_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.source_map_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(source_map, f, ensure_ascii=False)
+        os.replace(tmp_path, self.source_map_path)
+    
+    def _update_source_map(self, source: str, ids: List[str], replace: bool = False):
+        source_map = self._load_source_map()
+        sources = source_map.setdefault(self.namespace, {})
+        known = [] if replace else sources.get(source, [])
+        sources[source] = list(dict.fromkeys(known + ids))
+        self._save_source_map(source_map)
@@ -1,30 +1,106 @@
 import sqlite3
-import json, os
+import json, os, re
 import uuid
-from datetime import datetime
-from typing import List, Dict, Optional
+import atexit
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import threading
 
+from tracing import span
+
+SCHEMA_VERSION = 2
+
 class AdvancedHistoryManager:
-    def __init__(self, db_path: str = "data/chat_history.db"):
+    def __init__(self, db_path: str = "data/chat_history.db", write_behind: bool = True,
+                 flush_interval: float = 0.2, max_batch: int = 500):
         self.db_path = db_path
         self.lock = threading.Lock()
-        
+        # Одне постійне з'єднання на потік замість sqlite3.connect на кожен виклик
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+
+        # Write-behind: save_message лише ставить повідомлення в чергу, фоновий потік пише батчами
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, str, str, str]] = []
+        self._pending_lock = threading.Lock()
+        # Тримається під час commit батча і під час читання, щоб читач не побачив повідомлення двічі або не пропустив
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self.fts_enabled = False
+
         # Create directory if it doesn't exist
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        
+
         self._init_db()
-    
+
+        if self.write_behind:
+            self._writer = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """Повертає з'єднання поточного потоку (створює при першому виклику)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            # Діє лише для нової бази (до WAL і до створення таблиць); існуючу конвертує history_retention
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            # В WAL режимі NORMAL не втрачає цілісність, але не робить fsync на кожен commit
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+            with self.lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self, exclusive: bool = False) -> Iterator[sqlite3.Connection]:
+        """З'єднання поточного потоку для обслуговування бази (статистика, PRAGMA, VACUUM)
+
+        exclusive=True - запис черги призупинено на час блоку.
+        """
+        if not exclusive:
+            yield self._get_conn()
+            return
+        with self._flush_lock:
+            yield self._get_conn()
+
+    def close(self):
+        """Дописує чергу та закриває всі відкриті з'єднання"""
+        if self._writer is not None:
+            self._stopped.set()
+            self._wakeup.set()
+            self._writer.join()
+            self._writer = None
+        self.flush()
+        with self.lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._get_conn()
+        with conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS sessions (
                     session_id TEXT PRIMARY KEY,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    metadata TEXT
+                    metadata TEXT,
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    last_activity TIMESTAMP
                 )
             """)
-            
+
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS messages (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -35,40 +111,194 @@ class AdvancedHistoryManager:
                     FOREIGN KEY (session_id) REFERENCES sessions (session_id)
                 )
             """)
-            conn.commit()
-    
+
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self._migrate_v1(conn)
+                version = 1
+            # Без FTS5 лишаємось на v1 - після оновлення SQLite міграція виконається знову
+            if version < 2 and self._migrate_v2(conn):
+                version = 2
+            conn.execute(f"PRAGMA user_version = {version}")
+
+        self.fts_enabled = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).fetchone() is not None
+
+    def _migrate_v1(self, conn: sqlite3.Connection):
+        """Індекси та денормалізовані message_count/last_activity в sessions"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "message_count" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+        if "last_activity" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN last_activity TIMESTAMP")
+
+        # Індекс по session_id неявно містить id (rowid), тому покриває і вибірку сесії в порядку id
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages (session_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions (created_at)")
+
+        # Лічильники підтримуються тригерами, тож запис повідомлення лишається O(1)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_after_insert AFTER INSERT ON messages
+            BEGIN
+                UPDATE sessions
+                SET message_count = message_count + 1, last_activity = NEW.timestamp
+                WHERE session_id = NEW.session_id;
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_after_delete AFTER DELETE ON messages
+            BEGIN
+                UPDATE sessions
+                SET message_count = message_count - 1
+                WHERE session_id = OLD.session_id;
+            END
+        """)
+
+        # Одноразове заповнення лічильників для існуючих даних
+        conn.execute("""
+            UPDATE sessions SET
+                message_count = (SELECT COUNT(*) FROM messages m WHERE m.session_id = sessions.session_id),
+                last_activity = COALESCE(
+                    (SELECT MAX(m.timestamp) FROM messages m WHERE m.session_id = sessions.session_id),
+                    created_at
+                )
+        """)
+
+    def _migrate_v2(self, conn: sqlite3.Connection) -> bool:
+        """FTS5 індекс по messages.content, синхронізується тригерами (False - FTS5 недоступний)"""
+        try:
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    content,
+                    content = 'messages',
+                    content_rowid = 'id',
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            # SQLite зібраний без FTS5 - search_messages працюватиме через LIKE
+            print(f"⚠️ FTS5 недоступний, пошук буде повільним: {e}")
+            return False
+
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_after_insert AFTER INSERT ON messages
+            BEGIN
+                INSERT INTO messages_fts (rowid, content) VALUES (NEW.id, NEW.content);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_after_delete AFTER DELETE ON messages
+            BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_after_update AFTER UPDATE OF content ON messages
+            BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+                INSERT INTO messages_fts (rowid, content) VALUES (NEW.id, NEW.content);
+            END
+        """)
+        # Індексуємо вже збережені повідомлення
+        conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        return True
+
     def create_session(self, metadata: dict = None) -> str:
         """Створює нову сесію"""
         session_id = str(uuid.uuid4())
         metadata_json = json.dumps(metadata) if metadata else "{}"
-        
-        with sqlite3.connect(self.db_path) as conn:
+
+        conn = self._get_conn()
+        with conn:
             conn.execute(
-                "INSERT INTO sessions (session_id, metadata) VALUES (?, ?)",
+                "INSERT INTO sessions (session_id, metadata, last_activity) VALUES (?, ?, CURRENT_TIMESTAMP)",
                 (session_id, metadata_json)
             )
-            conn.commit()
-        
+
         return session_id
-    
+
     def save_message(self, session_id: str, role: str, content: str):
         """Зберігає повідомлення в сесію"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
-                (session_id, role, content)
+        # Час фіксуємо в момент виклику (UTC, як CURRENT_TIMESTAMP), а не в момент запису батча
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        message = (session_id, role, content, timestamp)
+
+        if not self.write_behind or self._writer is None:
+            self._insert_messages([message])
+            return
+
+        with self._pending_lock:
+            self._pending.append(message)
+            batch_ready = len(self._pending) >= self.max_batch
+        if batch_ready:
+            self._wakeup.set()
+
+    def flush(self):
+        """Синхронно записує всі повідомлення з черги"""
+        while self._flush_batch():
+            pass
+
+    def _writer_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                # Повідомлення лишаються в черзі і будуть записані наступного разу
+                print(f"❌ Помилка запису історії: {e}")
+
+    def _flush_batch(self) -> bool:
+        """Записує один батч з черги однією транзакцією. Повертає True, якщо щось записано"""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch = self._pending[:self.max_batch]
+            if not batch:
+                return False
+            self._insert_messages(batch)
+            with self._pending_lock:
+                # Нові повідомлення лише додаються в кінець, тому початок черги - це саме записаний батч
+                del self._pending[:len(batch)]
+        return True
+
+    def _insert_messages(self, messages: List[Tuple[str, str, str, str]]):
+        conn = self._get_conn()
+        with span("history.write", messages=len(messages)), conn:
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                messages
             )
-            conn.commit()
-    
+
+    def _drain_pending(self, session_ids: Optional[set] = None):
+        """Записує з черги повідомлення сесій (всі, якщо session_ids не вказано); викликати під _flush_lock"""
+        with self._pending_lock:
+            drained = [message for message in self._pending if session_ids is None or message[0] in session_ids]
+            self._pending = [message for message in self._pending if session_ids is not None and message[0] not in session_ids]
+        for start in range(0, len(drained), self.max_batch):
+            self._insert_messages(drained[start:start + self.max_batch])
+
+    def _has_pending(self, session_id: Optional[str] = None) -> bool:
+        """Чи є незаписані повідомлення (сесії або будь-які, якщо session_id не вказано)"""
+        with self._pending_lock:
+            return any(session_id is None or message[0] == session_id for message in self._pending)
+
+    def _pending_for_session(self, session_id: str) -> List[Tuple[str, str, str, str]]:
+        with self._pending_lock:
+            return [message for message in self._pending if message[0] == session_id]
+
     def get_session_history(self, session_id: str, format_type: str = "messages") -> List:
         """Отримує історію сесії"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY timestamp",
+        with self._flush_lock:
+            cursor = self._get_conn().execute(
+                "SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY id",
                 (session_id,)
             )
             messages = cursor.fetchall()
-        
+            # Read-your-writes: додаємо ще не записані повідомлення цієї сесії
+            messages += [(role, content, timestamp) for _, role, content, timestamp in self._pending_for_session(session_id)]
+
         if format_type == "messages":
             return [
                 {"role": msg[0], "content": msg[1], "timestamp": msg[2]}
@@ -77,45 +307,228 @@ class AdvancedHistoryManager:
         else:
             # Старий формат для сумісності
             return messages
-    
+
+    def get_session_history_page(self, session_id: str, limit: int = 50, cursor: Optional[str] = None) -> Dict:
+        """Останні limit повідомлень сесії (в хронологічному порядку) + cursor для старіших
+
+        cursor - значення "next_cursor" попередньої сторінки; None - найновіша сторінка.
+        """
+        if not cursor and len(self._pending_for_session(session_id)) >= limit:
+            # Незаписаних повідомлень на цілу сторінку - записуємо, щоб cursor (id) охоплював і їх
+            self.flush()
+
+        sql = "SELECT id, role, content, timestamp FROM messages WHERE session_id = ?"
+        params: list = [session_id]
+        if cursor:
+            sql += " AND id < ?"
+            params.append(int(cursor))
+        sql += " ORDER BY id DESC LIMIT ?"
+
+        with self._flush_lock:
+            # Ще не записані повідомлення - найновіші, тому займають кінець першої сторінки
+            pending = self._pending_for_session(session_id)[-limit:] if not cursor else []
+            db_limit = limit - len(pending)
+            # Беремо на одне більше, щоб знати чи є ще старіші повідомлення
+            params.append(db_limit + 1)
+            rows = self._get_conn().execute(sql, params).fetchall()
+
+        has_more = len(rows) > db_limit
+        if has_more:
+            # Наступна сторінка - все, що старіше за найстаріше показане
+            next_cursor = str(rows[db_limit - 1][0] if db_limit else rows[0][0] + 1)
+        else:
+            next_cursor = None
+        rows = rows[:db_limit]
+        rows.reverse()
+
+        messages = [
+            {"id": row[0], "role": row[1], "content": row[2], "timestamp": row[3]}
+            for row in rows
+        ]
+        messages += [
+            {"id": None, "role": role, "content": content, "timestamp": timestamp}
+            for _, role, content, timestamp in pending
+        ]
+
+        return {
+            "messages": messages,
+            "next_cursor": next_cursor,
+            "has_more": has_more
+        }
+
     def get_sessions(self) -> List[Dict]:
         """Отримує список всіх сесій"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                SELECT s.session_id, s.created_at, COUNT(m.id) as message_count
-                FROM sessions s
-                LEFT JOIN messages m ON s.session_id = m.session_id
-                GROUP BY s.session_id, s.created_at
-                ORDER BY s.created_at DESC
+        with self._flush_lock:
+            cursor = self._get_conn().execute("""
+                SELECT session_id, created_at, message_count, last_activity
+                FROM sessions
+                ORDER BY created_at DESC
             """)
             sessions = cursor.fetchall()
-        
+            with self._pending_lock:
+                pending = list(self._pending)
+
+        pending_counts: Dict[str, int] = {}
+        pending_activity: Dict[str, str] = {}
+        for session_id, _, _, timestamp in pending:
+            pending_counts[session_id] = pending_counts.get(session_id, 0) + 1
+            pending_activity[session_id] = timestamp
+
         return [
             {
                 "session_id": session[0],
                 "created_at": session[1],
-                "message_count": session[2]
+                "message_count": session[2] + pending_counts.get(session[0], 0),
+                "last_activity": pending_activity.get(session[0], session[3])
             }
             for session in sessions
         ]
-    
+
     def delete_session(self, session_id: str):
         """Видаляє сесію та всі її повідомлення"""
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._get_conn()
+        with self._flush_lock, conn:
+            with self._pending_lock:
+                self._pending = [message for message in self._pending if message[0] != session_id]
             conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
             conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
-            conn.commit()
-    
-    def search_messages(self, query: str) -> List[Dict]:
-        """Пошук по повідомленнях"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "SELECT role, content, timestamp FROM messages WHERE content LIKE ? ORDER BY timestamp DESC LIMIT 50",
-                (f"%{query}%",)
-            )
-            results = cursor.fetchall()
-        
+
+    def archive_sessions(self, writer: Callable[[List[Dict]], None], limit: int = 100,
+                         inactive_before: Optional[str] = None) -> Tuple[int, int]:
+        """Архівує та видаляє до limit найстаріших за активністю сесій
+
+        inactive_before - лише сесії без активності з цього часу (UTC, "%Y-%m-%d %H:%M:%S").
+        writer отримує сесії з повідомленнями і має зберегти їх до видалення: виняток скасовує
+        видалення. Повертає (сесій, повідомлень).
+        """
+        conn = self._get_conn()
+        where, params = "", []
+        if inactive_before is not None:
+            where, params = "WHERE COALESCE(last_activity, created_at) < ?", [inactive_before]
+
+        # Під _flush_lock черга не пишеться, тож вибрана сесія не отримає повідомлень після архівування
+        with self._flush_lock:
+            # Спершу черга: незаписані повідомлення оновлюють last_activity
+            self._drain_pending()
+            session_ids = [row[0] for row in conn.execute(
+                f"SELECT session_id FROM sessions {where} ORDER BY COALESCE(last_activity, created_at) LIMIT ?",
+                params + [limit]
+            )]
+            if not session_ids:
+                return 0, 0
+            # Повідомлення, що встигли стати в чергу після вибірки, архівуються разом із сесією
+            self._drain_pending(set(session_ids))
+
+            placeholders = ",".join("?" * len(session_ids))
+            sessions = conn.execute(
+                f"SELECT session_id, created_at, metadata, last_activity FROM sessions WHERE session_id IN ({placeholders})",
+                session_ids
+            ).fetchall()
+            messages = conn.execute(
+                f"SELECT session_id, role, content, timestamp FROM messages WHERE session_id IN ({placeholders}) ORDER BY id",
+                session_ids
+            ).fetchall()
+
+            by_session: Dict[str, List[Dict]] = {}
+            for session_id, role, content, timestamp in messages:
+                by_session.setdefault(session_id, []).append(
+                    {"role": role, "content": content, "timestamp": timestamp}
+                )
+            writer([
+                {
+                    "session_id": session_id,
+                    "created_at": created_at,
+                    "last_activity": last_activity,
+                    "metadata": json.loads(metadata) if metadata else {},
+                    "messages": by_session.get(session_id, [])
+                }
+                for session_id, created_at, metadata, last_activity in sessions
+            ])
+
+            with conn:
+                conn.execute(f"DELETE FROM messages WHERE session_id IN ({placeholders})", session_ids)
+                conn.execute(f"DELETE FROM sessions WHERE session_id IN ({placeholders})", session_ids)
+
+        return len(sessions), len(messages)
+
+    def search_messages(self, query: str, session_id: Optional[str] = None, limit: int = 50,
+                        cursor: Optional[str] = None) -> List[Dict]:
+        """Повнотекстовий пошук по повідомленнях (bm25, підсвічування, пагінація через cursor)
+
+        cursor - значення поля "cursor" останнього результату попередньої сторінки.
+        """
+        if self._has_pending(session_id):
+            # Read-your-writes: повідомлення з черги мають потрапити в індекс до пошуку
+            self.flush()
+
+        if not self.fts_enabled:
+            return self._search_messages_like(query, session_id, limit, cursor)
+
+        # Екрануємо синтаксис FTS5: кожне слово як префіксний терм, всі терми через AND
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"*' for term in terms)
+
+        sql = """
+            SELECT m.id, m.session_id, m.role, m.content, m.timestamp,
+                   bm25(messages_fts) AS rank,
+                   snippet(messages_fts, 0, '**', '**', '…', 16) AS snippet
+            FROM messages_fts
+            JOIN messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ?
+        """
+        params: list = [match]
+        if session_id:
+            sql += " AND m.session_id = ?"
+            params.append(session_id)
+        if cursor:
+            # Keyset-пагінація по (rank, id) замість OFFSET
+            last_rank, last_id = cursor.rsplit(":", 1)
+            sql += " AND (bm25(messages_fts) > ? OR (bm25(messages_fts) = ? AND m.id > ?))"
+            params.extend([float(last_rank), float(last_rank), int(last_id)])
+        sql += " ORDER BY rank, m.id LIMIT ?"
+        params.append(limit)
+
+        results = self._get_conn().execute(sql, params).fetchall()
+
         return [
-            {"role": result[0], "content": result[1], "timestamp": result[2]}
+            {
+                "id": result[0],
+                "session_id": result[1],
+                "role": result[2],
+                "content": result[3],
+                "timestamp": result[4],
+                "rank": result[5],
+                "snippet": result[6],
+                "cursor": f"{result[5]!r}:{result[0]}"
+            }
+            for result in results
+        ]
+
+    def _search_messages_like(self, query: str, session_id: Optional[str], limit: int,
+                              cursor: Optional[str] = None) -> List[Dict]:
+        """Пошук через LIKE (якщо FTS5 недоступний), від новіших до старіших; cursor - id"""
+        sql = "SELECT id, session_id, role, content, timestamp FROM messages WHERE content LIKE ?"
+        params: list = [f"%{query}%"]
+        if session_id:
+            sql += " AND session_id = ?"
+            params.append(session_id)
+        if cursor:
+            sql += " AND id < ?"
+            params.append(int(cursor))
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        results = self._get_conn().execute(sql, params).fetchall()
+
+        return [
+            {
+                "id": result[0],
+                "session_id": result[1],
+                "role": result[2],
+                "content": result[3],
+                "timestamp": result[4],
+                "cursor": str(result[0])
+            }
             for result in results
-        ]
\ No newline at end of file
+        ]
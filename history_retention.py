@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from history_manager import AdvancedHistoryManager
+
+load_dotenv(".env")
+
+class HistoryRetention:
+    """Архівування та видалення старих сесій з chat_history.db"""
+
+    def __init__(self, history_manager: AdvancedHistoryManager,
+                 max_age_days: Optional[int] = None,
+                 max_size_mb: Optional[float] = None,
+                 archive_dir: str = "data/archive",
+                 batch_size: int = 100,
+                 vacuum_pages: int = 2000):
+        """
+        Args:
+            history_manager: Сховище історії (архівування і обслуговування через його публічні методи)
+            max_age_days: Архівувати сесії без активності довше за N днів
+            max_size_mb: Архівувати найстаріші сесії, поки база більша за N MB
+            archive_dir: Куди писати стиснуті JSONL сегменти
+            batch_size: Скільки сесій архівувати і видаляти в одній транзакції
+            vacuum_pages: Скільки вільних сторінок повертати ОС за один incremental_vacuum
+        """
+        self.history_manager = history_manager
+        self.max_age_days = max_age_days
+        self.max_size_mb = max_size_mb
+        self.archive_dir = Path(archive_dir)
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+
+    def run(self, dry_run: bool = False) -> Dict:
+        """Застосовує політики віку та розміру, потім звільняє місце"""
+        result = {
+            'success': True,
+            'sessions_archived': 0,
+            'messages_archived': 0,
+            'segments': [],
+            'size_before_mb': round(self.db_size_bytes() / 1024 / 1024, 2)
+        }
+
+        try:
+            self.history_manager.flush()
+
+            cutoff = None
+            if self.max_age_days is not None:
+                cutoff = (datetime.now(timezone.utc) - timedelta(days=self.max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+            max_bytes = self.max_size_mb * 1024 * 1024 if self.max_size_mb is not None else None
+
+            if dry_run:
+                result['sessions_archived'], result['messages_archived'] = self._preview(cutoff, max_bytes)
+            else:
+                self._apply(cutoff, max_bytes, result)
+                result['vacuumed_pages'] = self.vacuum()
+
+        except Exception as e:
+            result['success'] = False
+            result['error'] = str(e)
+
+        result['size_after_mb'] = round(self.db_size_bytes() / 1024 / 1024, 2)
+        return result
+
+    def _apply(self, cutoff: Optional[str], max_bytes: Optional[float], result: Dict):
+        """Архівує сесії старші за cutoff, потім найстаріші, поки база більша за max_bytes"""
+        if cutoff is not None:
+            while self._archive_batch(result, inactive_before=cutoff):
+                pass
+
+        if max_bytes is not None:
+            while self.used_bytes() > max_bytes:
+                if not self._archive_batch(result):
+                    break
+
+    def _preview(self, cutoff: Optional[str], max_bytes: Optional[float]) -> Tuple[int, int]:
+        """Для --dry-run: (сесій, повідомлень), які архівував би run() за обома політиками.
+
+        Звільнене місце оцінюється за часткою тексту сесії в усьому тексті, перерахованою на
+        зайняті сторінки бази (так враховуються індекси та FTS).
+        """
+        used = self.used_bytes()
+        excess = used - max_bytes if max_bytes is not None else 0
+        with self.history_manager.connection() as conn:
+            total_text = conn.execute("SELECT COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0) FROM messages").fetchone()[0]
+            bytes_per_text_byte = used / total_text if total_text else 0
+
+            # Той самий порядок, що й в archive_sessions: сесії за віком - це префікс
+            rows = conn.execute("""
+                SELECT COALESCE(s.last_activity, s.created_at), COUNT(m.id), COALESCE(SUM(LENGTH(CAST(m.content AS BLOB))), 0)
+                FROM sessions s LEFT JOIN messages m ON m.session_id = s.session_id
+                GROUP BY s.session_id
+                ORDER BY COALESCE(s.last_activity, s.created_at)
+            """).fetchall()
+        sessions = messages = 0
+        freed = 0.0
+        for activity, message_count, text_bytes in rows:
+            by_age = cutoff is not None and activity is not None and activity < cutoff
+            if not by_age and freed >= excess:
+                break
+            sessions += 1
+            messages += message_count
+            freed += text_bytes * bytes_per_text_byte
+        return sessions, messages
+
+    def _archive_batch(self, result: Dict, inactive_before: Optional[str] = None) -> int:
+        """Архівує до batch_size найстаріших сесій в стиснутий JSONL сегмент. Повертає кількість сесій"""
+        segments: List[Path] = []
+        # Сегмент записується повністю до видалення, тож збій не втрачає дані
+        sessions, messages = self.history_manager.archive_sessions(
+            lambda records: segments.append(self._write_segment(records)),
+            limit=self.batch_size,
+            inactive_before=inactive_before
+        )
+        if not sessions:
+            return 0
+
+        result['sessions_archived'] += sessions
+        result['messages_archived'] += messages
+        result['segments'].append(str(segments[0]))
+        print(f"📦 Архівовано {sessions} сесій ({messages} повідомлень) → {segments[0].name}")
+        return sessions
+
+    def _write_segment(self, records: List[Dict]) -> Path:
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+        segment = self.archive_dir / f"chat_history-{stamp}.jsonl.gz"
+        tmp_path = segment.with_suffix(".tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, segment)
+        return segment
+
+    def vacuum(self) -> int:
+        """Повертає вільні сторінки ОС (incremental_vacuum) і обрізає WAL"""
+        with self.history_manager.connection() as conn:
+            incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        if not incremental:
+            # Одноразова конвертація існуючої бази в режим INCREMENTAL
+            print("🔧 Перемикаю базу в auto_vacuum=INCREMENTAL (одноразовий VACUUM)...")
+            with self.history_manager.connection(exclusive=True) as conn:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+
+        with self.history_manager.connection(exclusive=True) as conn:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})").fetchall()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return min(free_pages, self.vacuum_pages)
+
+    def used_bytes(self) -> int:
+        """Зайнятий даними розмір бази (без вільних сторінок)"""
+        with self.history_manager.connection() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    def db_size_bytes(self) -> int:
+        """Розмір файлу бази разом з WAL"""
+        total = 0
+        for suffix in ("", "-wal"):
+            try:
+                total += os.path.getsize(self.history_manager.db_path + suffix)
+            except OSError:
+                pass
+        return total
+
+
+def _env_number(name: str, cast):
+    value = os.getenv(name)
+    return cast(value) if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архівування та очищення історії чатів")
+    parser.add_argument('--db', default="data/chat_history.db", help='Шлях до бази історії')
+    parser.add_argument('--max-age-days', type=int, default=_env_number("HISTORY_RETENTION_DAYS", int),
+                        help='Архівувати сесії без активності довше за N днів')
+    parser.add_argument('--max-size-mb', type=float, default=_env_number("HISTORY_MAX_SIZE_MB", float),
+                        help='Архівувати найстаріші сесії, поки база більша за N MB')
+    parser.add_argument('--archive-dir', default=os.getenv("HISTORY_ARCHIVE_DIR", "data/archive"),
+                        help='Директорія для JSONL.gz сегментів')
+    parser.add_argument('--batch-size', type=int, default=100, help='Сесій на одну транзакцію')
+    parser.add_argument('--vacuum-only', action='store_true', help='Лише incremental vacuum')
+    parser.add_argument('--dry-run', action='store_true', help='Показати, скільки сесій буде архівовано')
+
+    args = parser.parse_args()
+
+    history_manager = AdvancedHistoryManager(args.db, write_behind=False)
+    retention = HistoryRetention(
+        history_manager,
+        max_age_days=args.max_age_days,
+        max_size_mb=args.max_size_mb,
+        archive_dir=args.archive_dir,
+        batch_size=args.batch_size
+    )
+
+    try:
+        if args.vacuum_only:
+            pages = retention.vacuum()
+            print(f"✅ Звільнено сторінок: {pages}")
+            return
+
+        if args.max_age_days is None and args.max_size_mb is None:
+            print("❓ Вкажіть --max-age-days та/або --max-size-mb")
+            parser.print_help()
+            return
+
+        result = retention.run(dry_run=args.dry_run)
+        if not result['success']:
+            print(f"❌ Помилка: {result['error']}")
+            return
+
+        label = "Архівовано"
+        if args.dry_run:
+            # Для політики розміру звільнене місце лише оцінюється
+            label = "Буде архівовано (оцінка)" if args.max_size_mb is not None else "Буде архівовано"
+        print(f"📊 {label}: {result['sessions_archived']} сесій, {result['messages_archived']} повідомлень")
+        print(f"💾 Розмір бази: {result['size_before_mb']} MB → {result['size_after_mb']} MB")
+    finally:
+        history_manager.close()
+
+if __name__ == "__main__":
+    main()
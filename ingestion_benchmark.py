@@ -0,0 +1,350 @@
+"""Бенчмарк завантаження документів: генератор корпусу, локальний векторний індекс, час по етапах"""
+import cProfile
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import pstats
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from document_loader import DocumentLoader
+from pipeline_benchmark import InMemoryIndex, hash_embedding
+
+FORMATS = ["pdf", "docx", "xlsx", "csv", "epub", "txt"]
+# Бібліотеки, потрібні DocumentLoader для читання формату
+PARSER_MODULES = {"pdf": "PyPDF2", "docx": "docx", "xlsx": "pandas", "csv": "pandas", "epub": "ebooklib", "txt": "chardet"}
+
+WORDS_UK = (
+    "завдання проєкт звіт години відпустка працівник команда реліз тестування документація "
+    "вимоги клієнт договір термін бюджет оцінка зустріч нарада рішення питання статус пріоритет "
+    "розробка підтримка сервер база даних інтеграція безпека доступ політика процес"
+).split()
+# Стандартні шрифти PDF без кирилиці, тому PDF генеруємо латиницею
+WORDS_EN = (
+    "task project report hours vacation employee team release testing documentation requirements "
+    "client contract deadline budget estimate meeting decision question status priority development "
+    "support server database integration security access policy process"
+).split()
+
+
+def _sentences(rng: random.Random, words: List[str]) -> Iterator[str]:
+    while True:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(6, 16)))
+        yield sentence.capitalize() + "."
+
+
+def _paragraphs(rng: random.Random, words: List[str], target_bytes: int) -> List[str]:
+    paragraphs, size = [], 0
+    sentences = _sentences(rng, words)
+    while size < target_bytes:
+        paragraph = " ".join(next(sentences) for _ in range(rng.randint(3, 8)))
+        paragraphs.append(paragraph)
+        size += len(paragraph.encode("utf-8"))
+    return paragraphs
+
+
+def _write_pdf(path: Path, target_bytes: int, rng: random.Random):
+    """Мінімальний PDF (Helvetica, по 55 рядків на сторінку) без сторонніх бібліотек"""
+    lines = []
+    for paragraph in _paragraphs(rng, WORDS_EN, target_bytes):
+        words, line = paragraph.split(), ""
+        for word in words:
+            if len(line) + len(word) > 90:
+                lines.append(line)
+                line = ""
+            line = f"{line} {word}".strip()
+        lines.append(line)
+    pages = [lines[i:i + 55] for i in range(0, len(lines), 55)]
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page_lines in pages:
+        text = "".join(
+            "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj T* "
+            for line in page_lines
+        )
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td {text}ET".encode("latin-1")
+        objects.append(b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {content_id} 0 R >>".encode()
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(output.tell())
+        output.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = output.tell()
+    output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        output.write(f"{offset:010d} 00000 n \n".encode())
+    output.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    path.write_bytes(output.getvalue())
+
+
+def _write_docx(path: Path, target_bytes: int, rng: random.Random):
+    from docx import Document
+    document = Document()
+    for paragraph in _paragraphs(rng, WORDS_UK, target_bytes):
+        document.add_paragraph(paragraph)
+    document.save(str(path))
+
+
+def _write_xlsx(path: Path, target_bytes: int, rng: random.Random):
+    import pandas as pd
+    rows = _table_rows(rng, target_bytes)
+    pd.DataFrame(rows, columns=["id", "project", "status", "hours", "comment"]).to_excel(path, index=False)
+
+
+def _write_csv(path: Path, target_bytes: int, rng: random.Random):
+    import csv
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", "project", "status", "hours", "comment"])
+        writer.writerows(_table_rows(rng, target_bytes))
+
+
+def _table_rows(rng: random.Random, target_bytes: int) -> List[list]:
+    rows, size = [], 0
+    sentences = _sentences(rng, WORDS_UK)
+    while size < target_bytes:
+        row = [len(rows) + 1, rng.choice(WORDS_UK), rng.choice(["New", "In Progress", "Done"]),
+               round(rng.uniform(0.5, 8), 1), next(sentences)]
+        rows.append(row)
+        size += len(",".join(map(str, row)).encode("utf-8"))
+    return rows
+
+
+def _write_epub(path: Path, target_bytes: int, rng: random.Random):
+    from ebooklib import epub
+    book = epub.EpubBook()
+    book.set_identifier("benchmark")
+    book.set_title("Benchmark")
+    book.set_language("uk")
+    paragraphs = _paragraphs(rng, WORDS_UK, target_bytes)
+    chapters = []
+    for index in range(0, len(paragraphs), 40):
+        chapter = epub.EpubHtml(title=f"Розділ {len(chapters) + 1}", file_name=f"chapter_{len(chapters) + 1}.xhtml", lang="uk")
+        chapter.content = "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs[index:index + 40])
+        book.add_item(chapter)
+        chapters.append(chapter)
+    book.toc = chapters
+    book.spine = chapters
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(str(path), book)
+
+
+def _write_txt(path: Path, target_bytes: int, rng: random.Random):
+    path.write_text("\n\n".join(_paragraphs(rng, WORDS_UK, target_bytes)), encoding="utf-8")
+
+
+WRITERS: Dict[str, Callable[[Path, int, random.Random], None]] = {
+    "pdf": _write_pdf,
+    "docx": _write_docx,
+    "xlsx": _write_xlsx,
+    "csv": _write_csv,
+    "epub": _write_epub,
+    "txt": _write_txt,
+}
+
+
+def generate_corpus(directory: Path, size_mb: float = 1.0, formats: Optional[List[str]] = None, seed: int = 42) -> Dict[str, Dict]:
+    """Файл приблизно size_mb тексту для кожного формату (формат без бібліотеки пропускається)"""
+    directory.mkdir(parents=True, exist_ok=True)
+    corpus = {}
+    for fmt in formats or FORMATS:
+        path = directory / f"benchmark.{fmt}"
+        try:
+            WRITERS[fmt](path, int(size_mb * 1024 * 1024), random.Random(seed))
+            corpus[fmt] = {"path": str(path), "bytes": path.stat().st_size}
+        except ImportError as e:
+            corpus[fmt] = {"error": f"немає бібліотеки: {e.name}"}
+        except Exception as e:
+            corpus[fmt] = {"error": str(e)}
+    return corpus
+
+
+class BenchmarkDocumentLoader(DocumentLoader):
+    """DocumentLoader з локальним індексом у пам'яті та локальними embedding"""
+
+    def __init__(self, workdir: Path, embedding: str = "hash", dimension: int = 768):
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")  # Клієнт створюється, але не викликається
+        super().__init__("benchmark", dimension=dimension, index=InMemoryIndex(dimension))
+        self.embedding = embedding
+        self.source_map_path = workdir / "source_chunk_map.json"
+
+    def _get_embedding(self, text: str) -> List[float]:
+        if self.embedding == "local":
+            return self._get_local_embedding(text)
+        return hash_embedding(text, self.dimension)
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss у КБ на Linux; PDF парситься у дочірніх процесах
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)
+
+
+def _run_stage(stage: str, func: Callable, profiles: Dict, profile_dir: Optional[Path], label: str):
+    profiler = cProfile.Profile() if profile_dir else None
+    started = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        result = func()
+    finally:
+        if profiler:
+            profiler.disable()
+    seconds = time.perf_counter() - started
+    if profiler:
+        profile_path = profile_dir / f"{label}_{stage}.prof"
+        profiler.dump_stats(str(profile_path))
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(8)
+        profiles[stage] = {"file": str(profile_path), "top": stream.getvalue()}
+    return result, seconds
+
+
+def benchmark_file(loader: BenchmarkDocumentLoader, file_path: Path, profile_dir: Optional[Path] = None) -> Dict:
+    """Етапи по черзі (час кожного окремо), потім повний load_file (етапи перекриваються)"""
+    fmt = file_path.suffix.lower().lstrip(".")
+    file_bytes = file_path.stat().st_size
+    profiles: Dict[str, Dict] = {}
+    seconds: Dict[str, float] = {}
+
+    def parse():
+        if file_path.suffix.lower() == ".pdf":
+            return list(loader._iter_pdf_pages(file_path, {}))
+        return [loader.supported_formats[file_path.suffix.lower()](file_path)]
+
+    parts, seconds["parse"] = _run_stage("parse", parse, profiles, profile_dir, fmt)
+    text_bytes = sum(len(part.encode("utf-8")) for part in parts)
+    chunks, seconds["chunk"] = _run_stage("chunk", lambda: list(loader._iter_chunks(parts)), profiles, profile_dir, fmt)
+    errors, ids = [], []
+    vectors, seconds["embed"] = _run_stage(
+        "embed", lambda: list(loader._iter_vectors(chunks, f"stages-{file_path.name}", str(file_path), errors, ids, set())),
+        profiles, profile_dir, fmt
+    )
+
+    def upsert():
+        return sum(loader._upsert_with_retry(batch)["uploaded"] for batch in loader._iter_upsert_batches(vectors))
+
+    uploaded, seconds["upsert"] = _run_stage("upsert", upsert, profiles, profile_dir, fmt)
+
+    started = time.perf_counter()
+    end_to_end = loader.load_file(str(file_path), source_name=f"e2e-{file_path.name}")
+    e2e_seconds = time.perf_counter() - started
+
+    mb = file_bytes / (1024 * 1024)
+    text_mb = text_bytes / (1024 * 1024)
+    return {
+        "format": fmt,
+        "file_mb": round(mb, 2),
+        "text_mb": round(text_mb, 2),
+        "chunks": len(chunks),
+        "vectors": uploaded,
+        "errors": len(errors) + (0 if end_to_end.get("success") else 1),
+        "seconds": {stage: round(value, 3) for stage, value in seconds.items()},
+        "throughput": {
+            "parse_mb_s": round(mb / seconds["parse"], 2) if seconds["parse"] else 0.0,
+            "chunk_mb_s": round(text_mb / seconds["chunk"], 2) if seconds["chunk"] else 0.0,
+            "embed_vectors_s": round(len(vectors) / seconds["embed"], 1) if seconds["embed"] else 0.0,
+            "upsert_vectors_s": round(uploaded / seconds["upsert"], 1) if seconds["upsert"] else 0.0,
+        },
+        "e2e_seconds": round(e2e_seconds, 3),
+        "e2e_mb_s": round(mb / e2e_seconds, 2) if e2e_seconds else 0.0,
+        "peak_rss_mb": _peak_rss_mb(),
+        "profiles": profiles,
+    }
+
+
+def _isolated_worker(queue, workdir: str, embedding: str, file_path: str, profile_dir: Optional[str]):
+    try:
+        loader = BenchmarkDocumentLoader(Path(workdir), embedding=embedding)
+        queue.put(benchmark_file(loader, Path(file_path), Path(profile_dir) if profile_dir else None))
+    except Exception as e:
+        queue.put({"format": Path(file_path).suffix.lstrip("."), "error": str(e)})
+
+
+def run_ingestion_benchmark(size_mb: float = 1.0, formats: Optional[List[str]] = None, embedding: str = "hash",
+                            corpus_dir: Optional[str] = None, profile_dir: Optional[str] = None,
+                            isolate: bool = False) -> Dict:
+    """
+    Args:
+        size_mb: Розмір тексту на формат
+        formats: Формати корпусу (за замовчуванням усі)
+        embedding: hash - детермінований без моделі, local - sentence-transformers
+        corpus_dir: Де генерувати корпус (за замовчуванням тимчасова директорія)
+        profile_dir: Куди писати cProfile кожного етапу (.prof)
+        isolate: Кожен формат в окремому процесі (точний пік RSS на формат)
+    """
+    workdir = Path(corpus_dir) if corpus_dir else Path(tempfile.mkdtemp(prefix="ingestion_bench_"))
+    profile_path = Path(profile_dir) if profile_dir else None
+    if profile_path:
+        profile_path.mkdir(parents=True, exist_ok=True)
+
+    print(f"🏗️ Генерую корпус ({size_mb} MB на формат) у {workdir}")
+    corpus = generate_corpus(workdir, size_mb, formats)
+    results = []
+    loader = None if isolate else BenchmarkDocumentLoader(workdir, embedding=embedding)
+    for fmt, info in corpus.items():
+        if not info.get("error") and importlib.util.find_spec(PARSER_MODULES[fmt]) is None:
+            info["error"] = f"немає бібліотеки парсера: {PARSER_MODULES[fmt]}"
+        if info.get("error"):
+            print(f"⚠️ {fmt}: пропущено ({info['error']})")
+            results.append({"format": fmt, "error": info["error"]})
+            continue
+        print(f"📄 {fmt}: {round(info['bytes'] / 1024 / 1024, 2)} MB")
+        if isolate:
+            context = multiprocessing.get_context("spawn")
+            queue = context.Queue()
+            process = context.Process(target=_isolated_worker, args=(queue, str(workdir), embedding, info["path"], profile_dir))
+            process.start()
+            results.append(queue.get())
+            process.join()
+        else:
+            try:
+                results.append(benchmark_file(loader, Path(info["path"]), profile_path))
+            except Exception as e:
+                results.append({"format": fmt, "error": str(e)})
+    return {"corpus_dir": str(workdir), "embedding": embedding, "size_mb": size_mb, "results": results}
+
+
+def format_report(report: Dict) -> str:
+    header = (f"{'format':<6} {'file MB':>8} {'chunks':>7} {'parse s':>8} {'chunk s':>8} {'embed s':>8} "
+              f"{'upsert s':>9} {'parse MB/s':>11} {'e2e s':>7} {'e2e MB/s':>9} {'peak RSS':>9}")
+    lines = [header, "-" * len(header)]
+    for result in report["results"]:
+        if result.get("error"):
+            lines.append(f"{result['format']:<6} ❌ {result['error']}")
+            continue
+        s = result["seconds"]
+        lines.append(
+            f"{result['format']:<6} {result['file_mb']:>8} {result['chunks']:>7} {s['parse']:>8} {s['chunk']:>8} "
+            f"{s['embed']:>8} {s['upsert']:>9} {result['throughput']['parse_mb_s']:>11} {result['e2e_seconds']:>7} "
+            f"{result['e2e_mb_s']:>9} {result['peak_rss_mb']:>7}MB"
+        )
+    for result in report["results"]:
+        for stage, profile in (result.get("profiles") or {}).items():
+            lines.append(f"\n🔬 {result['format']} / {stage}: {profile['file']}\n{profile['top'].strip()}")
+    return "\n".join(lines)
+
+
+def save_report(report: Dict, path: str):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"💾 Результат збережено в {path}")
@@ -0,0 +1,53 @@
+import re
+from typing import Dict, List
+
+from tools.config.functions import READ_ONLY_FUNCTIONS
+
+DATE_WORDS = {
+    "сьогодні": "today", "today": "today",
+    "вчора": "yesterday", "yesterday": "yesterday",
+    "завтра": "tomorrow", "tomorrow": "tomorrow",
+}
+DATE_PATTERN = re.compile(r"\b(\d{1,2}\.\d{1,2}(?:\.\d{2,4})?)\b")
+ISSUE_PATTERN = re.compile(r"#\s?(\d+)|\b(\d{5,})\b")
+HOURS_PATTERN = re.compile(r"годин|hours?|час", re.IGNORECASE)
+WIKI_PATTERN = re.compile(r"wiki|вікі", re.IGNORECASE)
+MY_ISSUES_PATTERN = re.compile(r"мо[їя] (завдан|задач)|в мене завдан|my (issues|tasks)", re.IGNORECASE)
+
+
+class LocalIntentRouter:
+    """Визначення функцій за ключовими словами - коли OpenAI недоступний.
+
+    Повертає лише read-only виклики: за вгаданим наміром нічого не змінюємо в Redmine.
+    """
+
+    def route(self, query: str) -> List[Dict]:
+        text = (query or "").lower()
+        calls = []
+
+        date = next((value for word, value in DATE_WORDS.items() if word in text), None)
+        date_match = DATE_PATTERN.search(text)
+        if date_match:
+            date = date_match.group(1)
+        if date:
+            calls.append({"name": "get_issue_by_date", "arguments": {"date": date}})
+
+        issue_match = ISSUE_PATTERN.search(text)
+        if issue_match:
+            issue_id = issue_match.group(1) or issue_match.group(2)
+            if HOURS_PATTERN.search(text):
+                calls.append({"name": "get_issue_hours", "arguments": {"issue_name": f"#{issue_id}"}})
+            else:
+                calls.append({"name": "get_issue_by_id", "arguments": {"issue_id": issue_id}})
+
+        if WIKI_PATTERN.search(text):
+            calls.append({"name": "get_wiki_info", "arguments": {"topic": query.strip()}})
+
+        if not calls and MY_ISSUES_PATTERN.search(text):
+            calls.append({"name": "get_my_issues", "arguments": {}})
+
+        return [
+            dict(call, id=f"local-{index}")
+            for index, call in enumerate(calls)
+            if call["name"] in READ_ONLY_FUNCTIONS
+        ]
@@ -11,6 +11,8 @@ class DialogueState(BaseModel):
     messages: List[Dict] = Field(default_factory=list)
     response_messages: List[Dict] = Field(default_factory=list)
     context: Any = Field(default_factory=dict)  # Дозволяємо будь-який тип
+    function_result: Dict[str, Any] = Field(default_factory=dict)  # Структурований результат функції для шаблонів
+    function_results: List[Dict] = Field(default_factory=list)  # Результати всіх викликів, якщо їх кілька
     collected_data: Dict[str, Any] = Field(default_factory=dict)
     required_fields: List[str] = Field(default_factory=list)
     options: Dict[str, Any] = Field(default_factory=dict)
@@ -18,6 +20,8 @@ class DialogueState(BaseModel):
     mode: str = "hybrid"
     RAG_context: str = ""
     sources: List[Any] = Field(default_factory=list)
+    rag_chunks: List[Dict] = Field(default_factory=list)  # Окремі чанки RAG зі score
+    prompt_stats: Dict[str, Any] = Field(default_factory=dict)  # Токени промпту (використано / зекономлено)
     delta: str = ""
     def update(self, **kwargs):
         """Простий update - перевіряє поля і встановлює значення"""
@@ -6,9 +6,11 @@ from dotenv import load_dotenv
 from ai_system import AISystem
 from history_manager import AdvancedHistoryManager
 from interfaces.dialogue_state import DialogueState
+from metrics import QUEUE_MAX_SIZE, QUEUE_SIZE, REQUESTS_IN_PROGRESS, start_metrics_server
 
 load_dotenv(".env")
 history_manager = AdvancedHistoryManager()
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 20))
 def load_file_map() -> Dict[str, str]:
     file_map = {}
     try:
@@ -43,6 +45,19 @@ def load_file_map() -> Dict[str, str]:
 file_map = load_file_map()
 
 ai_system = AISystem(state=DialogueState())
+print(ai_system.container.startup_report())
+def _format_history(messages: list) -> list:
+    """Приводить повідомлення з history_manager до формату Gradio messages"""
+    formatted_history = []
+    for msg in messages:
+        if isinstance(msg, dict) and "role" in msg and "content" in msg:
+            formatted_history.append({"role": msg["role"], "content": msg["content"]})
+        elif isinstance(msg, (list, tuple)) and len(msg) >= 2:
+            # Конвертуємо старий формат [user_msg, bot_msg] в новий
+            formatted_history.append({"role": "user", "content": str(msg[0])})
+            formatted_history.append({"role": "assistant", "content": str(msg[1])})
+    return formatted_history
+
 def load_previous_session(session_list: str, session_state: dict) -> tuple:
     if session_list:
         # Створюємо новий dict якщо session_state є tuple або None
@@ -51,22 +66,26 @@ def load_previous_session(session_list: str, session_state: dict) -> tuple:
             
         session_state["session_id"] = session_list
         
-        # Переконайтеся, що history_manager повертає правильний формат
-        history = history_manager.get_session_history(session_list, format_type="messages")
-        
-        # Перевіряємо і конвертуємо формат якщо потрібно
-        formatted_history = []
-        for msg in history:
-            if isinstance(msg, dict) and "role" in msg and "content" in msg:
-                formatted_history.append(msg)
-            elif isinstance(msg, (list, tuple)) and len(msg) >= 2:
-                # Конвертуємо старий формат [user_msg, bot_msg] в новий
-                formatted_history.append({"role": "user", "content": str(msg[0])})
-                formatted_history.append({"role": "assistant", "content": str(msg[1])})
+        # Спочатку лише найновіші повідомлення, старіші - через load_older_messages
+        page = history_manager.get_session_history_page(session_list, limit=HISTORY_PAGE_SIZE)
+        session_state["history_cursor"] = page["next_cursor"]
         
-        return formatted_history, session_state
+        return _format_history(page["messages"]), session_state
     return [], session_state if isinstance(session_state, dict) else {}
 
+def load_older_messages(history: list, session_state: dict) -> tuple:
+    """Довантажує попередню сторінку історії поточної сесії"""
+    if not isinstance(session_state, dict) or not session_state.get("history_cursor"):
+        return history, session_state
+    
+    page = history_manager.get_session_history_page(
+        session_state["session_id"],
+        limit=HISTORY_PAGE_SIZE,
+        cursor=session_state["history_cursor"]
+    )
+    session_state["history_cursor"] = page["next_cursor"]
+    return _format_history(page["messages"]) + list(history or []), session_state
+
 def clear_chat(session_state: dict) -> tuple:
     """Створює нову сесію та очищає чат"""
     if not isinstance(session_state, dict):
@@ -74,6 +93,7 @@ def clear_chat(session_state: dict) -> tuple:
         
     new_session_id = history_manager.create_session()
     session_state["session_id"] = new_session_id
+    session_state.pop("history_cursor", None)
     # Повертаємо порожній список для chatbot та оновлений session_state
     return [], session_state
 
@@ -89,7 +109,8 @@ def chat_interface(message: str, history: list, mode: str, session_state: dict)
         })
     
     session_id = session_state["session_id"]
-    ai_system.state.update(
+    # Свій стан на кожен запит - паралельні сесії Gradio не перезаписують один одного
+    request_state = DialogueState(
         user_input=message,
         session_state=session_state,
     )
@@ -101,8 +122,9 @@ def chat_interface(message: str, history: list, mode: str, session_state: dict)
     history.append(loader_message)
     yield "", history, session_state
 
+    REQUESTS_IN_PROGRESS.inc()
     try:
-        result = ai_system.process_query()
+        result = ai_system.process_query(request_state)
         response = result.response_messages[-1]["content"] if result.response_messages else "Вибачте, не вдалося обробити ваш запит."
         # Видаляємо прелоадер
         history = [msg for msg in history if msg != loader_message]
@@ -116,6 +138,8 @@ def chat_interface(message: str, history: list, mode: str, session_state: dict)
         error_response = {"role": "assistant", "content": error_message}
         history.append(error_response)
         yield "", history, session_state
+    finally:
+        REQUESTS_IN_PROGRESS.dec()
 
 def create_interface():
     """Створення Gradio інтерфейсу"""
@@ -160,6 +184,8 @@ def create_interface():
         
         with gr.Row(scale=2):
             with gr.Column():
+                # Сесія завантажується сторінками - старіші повідомлення на вимогу
+                load_older_btn = gr.Button("⬆️ Старіші повідомлення", size="sm")
                 chatbot = gr.Chatbot(
                     height=500,
                     placeholder="Напишіть запит і я допоможу знайти інформацію...",
@@ -198,6 +224,15 @@ def create_interface():
                 
                 for example in examples:
                     gr.Markdown(example)
+                
+                gr.Markdown("## 📚 Історія сесій")
+                session_dropdown = gr.Dropdown(
+                    choices=get_session_choices(),
+                    label="Попередні сесії",
+                    info="Виберіть сесію для продовження",
+                    allow_custom_value=False
+                )
+                load_session_btn = gr.Button("📂 Завантажити сесію", size="sm")
                     
                 # with gr.Group():
                 #     gr.Markdown("## 🚀 Швидкі режими:")
@@ -237,17 +272,6 @@ def create_interface():
                 # gr.Markdown("\n\n".join(status_info))
                 
         # with gr.Sidebar(position="right"):
-        #     gr.Markdown("## 📚 Історія сесій")
-            
-        #     # Dropdown для вибору сесії з початковими choices
-        #     session_dropdown = gr.Dropdown(
-        #         choices=get_session_choices(),  # Ініціалізуємо з поточними сесіями
-        #         label="Попередні сесії",
-        #         info="Виберіть сесію для продовження",
-        #         allow_custom_value=False
-        #     )
-
-        #     load_session_btn = gr.Button("📂 Завантажити сесію", size="sm")
         #     refresh_sessions_btn = gr.Button("🔄 Оновити список", size="sm")
         #     remove_sessions_btn = gr.Button("🗑️ Видалити сесію", size="sm")
 
@@ -258,11 +282,16 @@ def create_interface():
         #     return gr.Dropdown(choices=new_choices, value=None)
         # def remove_session(input_session: str):
         #     history_manager.delete_session(input_session)
-        # load_session_btn.click(
-        #     load_previous_session,
-        #     inputs=[session_dropdown, session_state],
-        #     outputs=[chatbot, session_state]
-        # )
+        load_session_btn.click(
+            load_previous_session,
+            inputs=[session_dropdown, session_state],
+            outputs=[chatbot, session_state]
+        )
+        load_older_btn.click(
+            load_older_messages,
+            inputs=[chatbot, session_state],
+            outputs=[chatbot, session_state]
+        )
         
         # refresh_sessions_btn.click(
         #     refresh_sessions, 
@@ -308,6 +337,10 @@ if __name__ == "__main__":
     # Запускаємо інтерфейс
     app = create_interface()
     app.queue(max_size=20)
+    QUEUE_MAX_SIZE.set(20)
+    # Публічного API для глибини черги немає; це те саме значення, що Gradio віддає в /queue/status
+    QUEUE_SIZE.set_function(lambda: len(app._queue))
+    start_metrics_server()
     app.launch(
         server_name="0.0.0.0",
         server_port=7861,
@@ -0,0 +1,234 @@
+"""Метрики у форматі Prometheus (лічильники, gauge, гістограми) та HTTP ендпоінт /metrics"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from tracing import tracer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(label_names: Iterable[str], label_values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        # Метрика без labels видна з нуля, ще до першого оновлення
+        self._values: Dict[Tuple[str, ...], float] = {} if self.label_names else {(): 0}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = ()):
+        super().__init__(name, help_text, label_names)
+        self._function: Optional[Callable[[], float]] = None
+
+    def set_function(self, function: Callable[[], float]):
+        """Значення (без labels) читається з function під час кожного scrape"""
+        self._function = function
+
+    def render(self) -> List[str]:
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                # Джерело змінюється з іншого потоку - лишаємо попереднє значення
+                value = None
+            if value is not None:
+                self.set(value)
+        return super().render()
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [лічильники по бакетах..., sum, count]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {round(series[-2], 6)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набір метрик процесу; render() - текстовий формат Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = metric_class(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, help_text: str, label_names: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, help_text, label_names)
+
+    def gauge(self, name: str, help_text: str, label_names: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge, name, help_text, label_names)
+
+    def histogram(self, name: str, help_text: str, label_names: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help_text, label_names, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUESTS = registry.counter("ai_requests_total", "Оброблені запити по intent і рівню відповіді", ["intent", "tier"])
+REQUESTS_IN_PROGRESS = registry.gauge("ai_requests_in_progress", "Запити, що обробляються зараз")
+QUEUE_MAX_SIZE = registry.gauge("ai_queue_max_size", "Розмір черги Gradio (app.queue max_size)")
+QUEUE_SIZE = registry.gauge("ai_queue_size", "Запити, що чекають у черзі Gradio")
+STAGE_DURATION = registry.histogram("ai_stage_duration_seconds", "Тривалість етапів (rag, OpenAI, Redmine, Google, історія)", ["stage"])
+STAGE_ERRORS = registry.counter("ai_stage_errors_total", "Помилки етапів", ["stage"])
+OPENAI_TOKENS = registry.counter("openai_tokens_total", "Токени OpenAI", ["model", "direction"])
+CACHE_REQUESTS = registry.counter("ai_cache_requests_total", "Звернення до кешів", ["stage", "result"])
+OPENAI_GATEWAY_REQUESTS = registry.counter("openai_gateway_requests_total", "Виклики OpenAI через шлюз (ok, retried, rejected, error)", ["model", "result"])
+OPENAI_GATEWAY_QUEUE = registry.gauge("openai_gateway_queue", "Запити, що чекають лімітів моделі", ["model"])
+CIRCUIT_STATE = registry.gauge("ai_circuit_state", "Стан circuit breaker (0 closed, 1 half-open, 2 open)", ["name"])
+CIRCUIT_REJECTED = registry.counter("ai_circuit_rejected_total", "Виклики, відхилені відкритим circuit breaker", ["name"])
+SINGLE_FLIGHT_CALLS = registry.counter("ai_singleflight_calls_total", "Виклики через single-flight (collapsed - без власного запиту в upstream)", ["name", "result"])
+
+
+def record_span(record: Dict) -> None:
+    """Оновлює метрики із завершеного спану трасування"""
+    stage = record["stage"]
+    attrs = record.get("attrs") or {}
+    STAGE_DURATION.observe(record.get("duration_ms", 0.0) / 1000, stage=stage)
+    if record.get("error"):
+        STAGE_ERRORS.inc(stage=stage)
+    if attrs.get("prompt_tokens") or attrs.get("completion_tokens"):
+        model = attrs.get("model") or "unknown"
+        OPENAI_TOKENS.inc(attrs.get("prompt_tokens", 0) or 0, model=model, direction="in")
+        OPENAI_TOKENS.inc(attrs.get("completion_tokens", 0) or 0, model=model, direction="out")
+    if "cache_hit" in attrs:
+        CACHE_REQUESTS.inc(stage=stage, result="hit" if attrs["cache_hit"] else "miss")
+    if stage == "request":
+        REQUESTS.inc(intent=attrs.get("intent") or "none", tier=attrs.get("tier") or "none")
+
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install() -> None:
+    """Підписує метрики на спани трасування (один раз на процес)"""
+    global _installed
+    with _install_lock:
+        if not _installed:
+            tracer.add_listener(record_span)
+            _installed = True
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """HTTP /metrics у фоновому потоці того ж процесу"""
+    if os.getenv("METRICS_ENABLED", "true").lower() == "false":
+        return None
+    install()
+    port = port if port is not None else int(os.getenv("METRICS_PORT", 9100))
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"⚠️ Не вдалося запустити /metrics на {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"📈 Метрики: http://{host}:{server.server_address[1]}/metrics")
+    return server
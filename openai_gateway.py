@@ -0,0 +1,247 @@
+"""Спільний шлюз до OpenAI: ліміти запитів/токенів на модель, пріоритети, повтори з jitter"""
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import openai
+
+from circuit_breaker import CircuitOpenError, get_breaker
+from metrics import OPENAI_GATEWAY_QUEUE, OPENAI_GATEWAY_REQUESTS
+from token_counter import count_tokens
+from tracing import span
+
+# Менше значення - вищий пріоритет
+PRIORITY_HIGH = 0      # визначення наміру, embedding запиту
+PRIORITY_NORMAL = 1    # генерація відповіді
+PRIORITY_LOW = 2       # фонові задачі (підсумок історії)
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+# 429 - це наші ліміти, а не недоступність сервісу; його обробляє ModelLimiter
+OUTAGE_ERRORS = (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class GatewayOverloaded(Exception):
+    """Запит не виконано: черга переповнена, очікування довше за допустиме або OpenAI недоступний"""
+
+
+class TokenBucket:
+    """Відро токенів, що поповнюється рівномірно (rate_per_minute за хвилину)"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def available(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def wait_time(self, amount: float, now: float) -> float:
+        # Запит, більший за все відро, чекає повного відра
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.available(now)) / self.rate)
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class ModelLimiter:
+    """RPM/TPM ліміти однієї моделі та черга з пріоритетами"""
+
+    def __init__(self, model: str, rpm: float, tpm: float, max_queue: int):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_queue = max_queue
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+
+    def _estimate_wait(self, tokens: int, priority: int, now: float) -> float:
+        # Чекаємо всіх з таким самим або вищим пріоритетом, що вже в черзі
+        ahead = [item for item in self._queue if item[0] <= priority]
+        need_requests = len(ahead) + 1 - self.requests.available(now)
+        need_tokens = sum(item[2] for item in ahead) + tokens - self.tokens.available(now)
+        return max(
+            self.paused_until - now,
+            need_requests / self.requests.rate,
+            need_tokens / self.tokens.rate,
+            0.0,
+        )
+
+    def acquire(self, tokens: int, priority: int, max_wait: float) -> float:
+        """Чекає своєї черги та ємності; повертає час очікування"""
+        started = time.monotonic()
+        deadline = started + max_wait
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise GatewayOverloaded(f"Черга {self.model} переповнена ({len(self._queue)})")
+            estimate = self._estimate_wait(tokens, priority, started)
+            if estimate > max_wait:
+                raise GatewayOverloaded(f"Очікування {self.model} ~{estimate:.1f} с перевищує {max_wait} с")
+            ticket = (priority, next(self._seq), tokens)
+            heapq.heappush(self._queue, ticket)
+            OPENAI_GATEWAY_QUEUE.set(len(self._queue), model=self.model)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._queue[0] is ticket:
+                        wait = max(
+                            self.paused_until - now,
+                            self.requests.wait_time(1, now),
+                            self.tokens.wait_time(tokens, now),
+                        )
+                        if wait <= 0:
+                            self.requests.consume(1)
+                            self.tokens.consume(tokens)
+                            return now - started
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise GatewayOverloaded(f"Не дочекались ліміту {self.model} за {max_wait} с")
+                    self._cond.wait(min(wait, remaining) if wait is not None else remaining)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                OPENAI_GATEWAY_QUEUE.set(len(self._queue), model=self.model)
+                self._cond.notify_all()
+
+    def reconcile(self, estimated: int, actual: int):
+        """Коригує відро токенів за фактичним usage відповіді"""
+        with self._cond:
+            self.tokens.tokens = min(self.tokens.capacity, self.tokens.tokens + estimated - actual)
+
+    def pause(self, seconds: float):
+        """Після 429 притримує всі запити моделі, а не лише той, що отримав помилку"""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def _model_limits() -> Dict[str, Dict[str, float]]:
+    try:
+        return json.loads(os.getenv("OPENAI_MODEL_LIMITS", "{}"))
+    except json.JSONDecodeError as e:
+        print(f"⚠️ Некоректний OPENAI_MODEL_LIMITS: {e}")
+        return {}
+
+
+_limiters: Dict[str, ModelLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model: str) -> ModelLimiter:
+    """Ліміти моделі спільні для всього процесу (незалежно від клієнта)"""
+    with _limiters_lock:
+        if model not in _limiters:
+            limits = _model_limits().get(model, {})
+            _limiters[model] = ModelLimiter(
+                model,
+                rpm=float(limits.get("rpm", os.getenv("OPENAI_RPM_LIMIT", 500))),
+                tpm=float(limits.get("tpm", os.getenv("OPENAI_TPM_LIMIT", 200000))),
+                max_queue=int(os.getenv("OPENAI_MAX_QUEUE", 50)),
+            )
+        return _limiters[model]
+
+
+def estimate_chat_tokens(kwargs: Dict[str, Any]) -> int:
+    """Оцінка токенів запиту так, як їх рахує OpenAI для TPM: промпт + max токенів відповіді"""
+    model = kwargs.get("model")
+    prompt = sum(count_tokens(str(m.get("content") or ""), model) + 4 for m in kwargs.get("messages", []))
+    for key in ("tools", "functions"):
+        if kwargs.get(key):
+            prompt += count_tokens(json.dumps(kwargs[key], ensure_ascii=False), model)
+    completion = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or 1000
+    return prompt + completion
+
+
+class OpenAIGateway:
+    """Обгортка над OpenAI клієнтом: усі виклики проходять через ліміти моделі"""
+
+    def __init__(self, client, max_retries: Optional[int] = None, max_wait: Optional[float] = None):
+        # Повторює шлюз (з урахуванням лімітів), вбудовані повтори клієнта вимикаємо
+        timeout = float(os.getenv("OPENAI_TIMEOUT_SECONDS", 30))
+        self.client = client.with_options(max_retries=0, timeout=timeout) if hasattr(client, "with_options") else client
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("OPENAI_MAX_RETRIES", 3))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("OPENAI_MAX_WAIT_SECONDS", 15))
+        self.base_delay = float(os.getenv("OPENAI_RETRY_BASE_DELAY", 0.5))
+        self.max_delay = float(os.getenv("OPENAI_RETRY_MAX_DELAY", 20))
+
+    def chat(self, priority: int = PRIORITY_NORMAL, max_wait: Optional[float] = None, **kwargs):
+        """chat.completions.create з лімітами"""
+        return self._call(
+            kwargs["model"], estimate_chat_tokens(kwargs), priority, max_wait,
+            lambda: self.client.chat.completions.create(**kwargs),
+        )
+
+    def embed(self, priority: int = PRIORITY_HIGH, max_wait: Optional[float] = None, **kwargs):
+        """embeddings.create з лімітами"""
+        inputs = kwargs["input"] if isinstance(kwargs["input"], list) else [kwargs["input"]]
+        estimate = sum(count_tokens(str(text)) for text in inputs)
+        return self._call(
+            kwargs["model"], estimate, priority, max_wait,
+            lambda: self.client.embeddings.create(**kwargs),
+        )
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter; Retry-After від сервера - нижня межа
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            delay = max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            pass
+        return delay
+
+    def _call(self, model: str, estimate: int, priority: int, max_wait: Optional[float], func: Callable[[], Any]):
+        limiter = get_limiter(model)
+        breaker = get_breaker(f"openai.{model}", is_failure=lambda error: isinstance(error, OUTAGE_ERRORS))
+        max_wait = self.max_wait if max_wait is None else max_wait
+        for attempt in range(self.max_retries + 1):
+            with span("openai.admission", model=model, priority=priority, tokens=estimate) as attrs:
+                try:
+                    attrs["wait_ms"] = round(limiter.acquire(estimate, priority, max_wait) * 1000, 1)
+                except GatewayOverloaded:
+                    OPENAI_GATEWAY_REQUESTS.inc(model=model, result="rejected")
+                    raise
+            try:
+                response = breaker.call(func)
+            except CircuitOpenError as e:
+                OPENAI_GATEWAY_REQUESTS.inc(model=model, result="rejected")
+                raise GatewayOverloaded(str(e)) from e
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    OPENAI_GATEWAY_REQUESTS.inc(model=model, result="error")
+                    # Для викликаючого коду недоступність і стійкий 429 = перевантаження: той самий шлях деградації
+                    if isinstance(e, openai.RateLimitError):
+                        raise GatewayOverloaded(f"OpenAI {model}: ліміт запитів вичерпано після {attempt + 1} спроб") from e
+                    raise GatewayOverloaded(f"OpenAI {model} недоступний: {e}") from e
+                delay = self._backoff(attempt, e)
+                if isinstance(e, openai.RateLimitError):
+                    limiter.pause(delay)
+                OPENAI_GATEWAY_REQUESTS.inc(model=model, result="retried")
+                print(f"⚠️ OpenAI {model}: {e.__class__.__name__}, повтор {attempt + 1} через {delay:.1f} с")
+                time.sleep(delay)
+                continue
+            except Exception:
+                OPENAI_GATEWAY_REQUESTS.inc(model=model, result="error")
+                raise
+            usage = getattr(response, "usage", None)
+            actual = getattr(usage, "total_tokens", None)
+            if actual:
+                limiter.reconcile(estimate, actual)
+            OPENAI_GATEWAY_REQUESTS.inc(model=model, result="ok")
+            return response
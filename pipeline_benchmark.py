@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""Офлайн бенчмарк повного конвеєра AISystem.process_query на локальних замінниках сервісів.
+
+Один локальний HTTP сервер детерміновано відповідає замість OpenAI (/v1), Redmine (/issues, /users, /wiki),
+Google Custom Search (/customsearch/v1) і веб-сторінок (/pages). Pinecone замінено індексом у пам'яті.
+Запити з data/dataset.jsonl проганяються з заданою паралельністю.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlparse
+
+EMBEDDING_DIMENSION = 1536
+
+
+def hash_embedding(text: str, dimension: int = EMBEDDING_DIMENSION) -> List[float]:
+    """Детермінований embedding: хешовані слова (схожі тексти - близькі вектори)"""
+    vector = [0.0] * dimension
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word[:6].encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % dimension] += 1.0 if digest[4] % 2 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def load_dataset(path: str) -> List[Dict]:
+    examples = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                examples.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return examples
+
+
+class InMemoryIndex:
+    """Замінник Pinecone Index: косинусна подібність у пам'яті"""
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION):
+        self.dimension = dimension
+        self.vectors: Dict[str, Dict[str, List]] = {}
+
+    def upsert(self, vectors: List[Dict], namespace: str = ""):
+        store = self.vectors.setdefault(namespace, {})
+        for vector in vectors:
+            store[vector["id"]] = (vector["values"], vector.get("metadata", {}))
+
+    def describe_index_stats(self):
+        namespaces = {name: {"vector_count": len(store)} for name, store in self.vectors.items()}
+        return SimpleNamespace(
+            dimension=self.dimension,
+            total_vector_count=sum(len(store) for store in self.vectors.values()),
+            namespaces=namespaces,
+        )
+
+    def query(self, vector: List[float], top_k: int = 5, include_metadata: bool = True, namespace: str = ""):
+        matches = [
+            SimpleNamespace(id=vector_id, score=sum(a * b for a, b in zip(vector, values)), metadata=metadata)
+            for vector_id, (values, metadata) in self.vectors.get(namespace, {}).items()
+        ]
+        matches.sort(key=lambda match: match.score, reverse=True)
+        return SimpleNamespace(matches=matches[:top_k])
+
+
+class FakeServices:
+    """Детерміновані відповіді OpenAI / Redmine / Google / веб-сторінок"""
+
+    def __init__(self, examples: List[Dict], latency_ms: Dict[str, float]):
+        self.latency_ms = latency_ms
+        self.base_url = ""
+        self.calls = {name: 0 for name in latency_ms}
+        self._lock = threading.Lock()
+        # Запит з датасету -> очікувані виклики функцій
+        self.function_calls = {
+            example["input"].strip().lower(): (example.get("output", {}).get("metadata", {}) or {}).get("function_calls", [])
+            for example in examples if isinstance(example.get("input"), str)
+        }
+        self.issues = [
+            {
+                "id": 1000 + i,
+                "subject": f"User story {1000 + i}",
+                "description": "Benchmark issue " * 10,
+                "status": {"name": "New" if i % 2 else "In Progress"},
+                "priority": {"name": "Normal"},
+                "assigned_to": {"name": "Benchmark User"},
+                "estimated_hours": float(i % 8),
+            }
+            for i in range(25)
+        ]
+
+    def handle(self, method: str, path: str, body: Dict, query: Optional[Dict] = None) -> Optional[Dict]:
+        service = "openai" if path.startswith("/v1/") else "google" if path.startswith(("/customsearch", "/pages")) else "redmine"
+        with self._lock:
+            self.calls[service] += 1
+        time.sleep(self.latency_ms.get(service, 0) / 1000)
+        if service == "openai":
+            return self._openai(path, body)
+        if service == "google":
+            return self._google(path)
+        return self._redmine(method, path, query or {})
+
+    def _openai(self, path: str, body: Dict) -> Dict:
+        if path.endswith("/embeddings"):
+            inputs = body.get("input")
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            tokens = sum(len(str(text)) // 4 for text in inputs)
+            return {
+                "object": "list",
+                "model": body.get("model", ""),
+                "data": [{"object": "embedding", "index": i, "embedding": hash_embedding(str(text))} for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            }
+
+        messages = body.get("messages", [])
+        prompt_tokens = sum(len(str(message.get("content") or "")) for message in messages) // 4
+        user_input = next((str(m.get("content") or "") for m in messages if m.get("role") == "user"), "")
+        message = {"role": "assistant", "content": None}
+        tool_calls = self._tool_calls(user_input, body.get("tools") or []) if body.get("tools") else []
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+            completion_tokens = 20 * len(tool_calls)
+        else:
+            message["content"] = "- **Результат:** дані з Redmine опрацьовано.\n- Якщо потрібно більше деталей, уточніть запит."
+            completion_tokens = len(message["content"]) // 4
+        return {
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{"index": 0, "finish_reason": "tool_calls" if tool_calls else "stop", "message": message}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _tool_calls(self, user_input: str, tools: List[Dict]) -> List[Dict]:
+        available = {tool["function"]["name"]: tool["function"] for tool in tools if tool.get("type") == "function"}
+        tool_calls = []
+        for call in self.function_calls.get(user_input.strip().lower(), []):
+            function = available.get(call.get("name"))
+            if not function:
+                continue
+            values = list((call.get("arguments") or {}).values())
+            arguments = {}
+            for index, (name, schema) in enumerate((function.get("parameters", {}).get("properties") or {}).items()):
+                value = values[index] if index < len(values) else None
+                if schema.get("type") in ("number", "integer"):
+                    arguments[name] = value if isinstance(value, (int, float)) else 1
+                elif name.endswith("_id"):
+                    digits = re.search(r"\d+", str(value or user_input))
+                    arguments[name] = digits.group(0) if digits else str(self.issues[0]["id"])
+                else:
+                    arguments[name] = str(value) if value is not None else user_input
+            tool_calls.append({
+                "id": f"call_{len(tool_calls)}",
+                "type": "function",
+                "function": {"name": function["name"], "arguments": json.dumps(arguments, ensure_ascii=False)},
+            })
+        return tool_calls
+
+    def _google(self, path: str) -> Dict:
+        if path.startswith("/pages"):
+            return {"html": "<html><body><h1>Benchmark page</h1>" + "<p>Static benchmark content.</p>" * 50 + "</body></html>"}
+        return {
+            "items": [
+                {"title": f"Result {i}", "link": f"{self.base_url}/pages/{i}.html", "snippet": "Static snippet", "displayLink": "localhost"}
+                for i in range(3)
+            ],
+            "searchInformation": {"totalResults": "3"},
+        }
+
+    def _redmine(self, method: str, path: str, query: Dict) -> Dict:
+        if method != "GET":
+            return {}
+        match = re.match(r"^/issues/(\d+)\.json", path)
+        if match:
+            issue_id = int(match.group(1))
+            issue = next((issue for issue in self.issues if issue["id"] == issue_id), dict(self.issues[0], id=issue_id))
+            return {"issue": issue}
+        if path.startswith("/issues.json"):
+            offset, limit = int(query.get("offset", 0)), int(query.get("limit", 25))
+            return {"issues": self.issues[offset:offset + limit], "total_count": len(self.issues), "offset": offset, "limit": limit}
+        if path.startswith("/users/"):
+            return {"user": {"id": 1, "login": "benchmark", "status": 1}}
+        if path.startswith("/wiki/"):
+            return {"wiki_page": {"title": "Benchmark", "text": "Benchmark wiki page"}}
+        return {}
+
+
+def start_fake_server(services: FakeServices) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _respond(self, method: str):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            except json.JSONDecodeError:
+                body = {}
+            url = urlparse(self.path)
+            payload = services.handle(method, url.path, body, dict(parse_qsl(url.query)))
+            if "html" in payload:
+                data, content_type = payload["html"].encode("utf-8"), "text/html; charset=utf-8"
+            else:
+                data, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._respond("GET")
+
+        def do_POST(self):
+            self._respond("POST")
+
+        def do_PUT(self):
+            self._respond("PUT")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    services.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="benchmark-fakes", daemon=True).start()
+    return server
+
+
+def configure_environment(base_url: str):
+    """Всі клієнти - на локальний сервер (до імпорту модулів, що читають env при імпорті)"""
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "REDMINE_URL": base_url,
+        "REDMINE_API_KEY": "benchmark",
+        "REDMINE_USER_ID": "1",
+        "GOOGLE_API_KEY": "benchmark",
+        "GOOGLE_SEARCH_ENGINE_ID": "benchmark",
+        "GOOGLE_SEARCH_URL": f"{base_url}/customsearch/v1",
+        "PINECONE_INDEX_NAME": "benchmark",
+        "TRACE_FILE": "",
+        "METRICS_ENABLED": "false",
+        # Вимірюємо живі запити до Redmine, а не локальну копію
+        "REDMINE_MIRROR_ENABLED": "false",
+    })
+
+
+def build_system(examples: List[Dict]):
+    from container import Container
+    from ai_system import AISystem
+    from rag_engine import RAGEngine
+
+    index = InMemoryIndex()
+    index.upsert([
+        {
+            "id": f"doc-{i}",
+            "values": hash_embedding(example["output"]["text"]),
+            "metadata": {"text": example["output"]["text"], "source": "dataset.jsonl", "title": example.get("input", "")},
+        }
+        for i, example in enumerate(examples)
+        if isinstance(example.get("output"), dict) and example["output"].get("text")
+    ], namespace="default")
+
+    class BenchmarkContainer(Container):
+        def _create_rag_engine(self):
+            return RAGEngine(pinecone_index_name="benchmark", openai_client=self.get("openai_client"), index=index)
+
+    return AISystem(container=BenchmarkContainer())
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    from tracing import percentile
+    ordered = sorted(values)
+    return {f"p{q}": round(percentile(ordered, q), 1) for q in (50, 95, 99)}
+
+
+def run_benchmark(system, queries: List[str], concurrency: int) -> Dict:
+    from interfaces.dialogue_state import DialogueState
+    from tracing import summarize, tracer
+
+    spans = []
+    tracer.add_listener(spans.append)
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def run_one(index: int, query: str):
+        nonlocal errors
+        state = DialogueState(user_input=query, session_state={"session_id": f"benchmark-{index % concurrency}"})
+        started = time.perf_counter()
+        try:
+            result = system.process_query(state)
+            failed = result is None or not result.response_messages
+        except Exception as e:
+            print(f"❌ {query}: {e}")
+            failed = True
+        with lock:
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run_one, range(len(queries)), queries))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(queries),
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(queries) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": percentiles(latencies),
+        "stages": summarize(spans),
+    }
+
+
+def compare_with_baseline(result: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """Регресії відносно збереженого результату (p95 і пропускна здатність)"""
+    problems = []
+    if baseline.get("throughput_rps") and result["throughput_rps"] < baseline["throughput_rps"] * (1 - max_regression):
+        problems.append(f"throughput {result['throughput_rps']} < {baseline['throughput_rps']} rps")
+    if baseline.get("latency_ms", {}).get("p95") and result["latency_ms"]["p95"] > baseline["latency_ms"]["p95"] * (1 + max_regression):
+        problems.append(f"request p95 {result['latency_ms']['p95']} > {baseline['latency_ms']['p95']} ms")
+    for stage, stats in result["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        # Етапи коротші за 5 мс занадто шумні для порівняння
+        if base and base["p95_ms"] >= 5 and stats["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            problems.append(f"{stage} p95 {stats['p95_ms']} > {base['p95_ms']} ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн бенчмарк AISystem.process_query")
+    parser.add_argument('--dataset', default="data/dataset.jsonl", help='JSONL з запитами (поле input)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Паралельні запити')
+    parser.add_argument('--repeat', type=int, default=1, help='Скільки разів прогнати датасет')
+    parser.add_argument('--limit', type=int, help='Лише перші N запитів')
+    parser.add_argument('--openai-latency-ms', type=float, default=300, help='Затримка відповіді OpenAI')
+    parser.add_argument('--redmine-latency-ms', type=float, default=50, help='Затримка відповіді Redmine')
+    parser.add_argument('--google-latency-ms', type=float, default=100, help='Затримка відповіді Google')
+    parser.add_argument('--output', help='Зберегти результат у JSON')
+    parser.add_argument('--baseline', help='JSON попереднього запуску для порівняння')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='Допустиме погіршення (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    examples = load_dataset(args.dataset)
+    queries = [example["input"] for example in examples if isinstance(example.get("input"), str)]
+    if args.limit:
+        queries = queries[:args.limit]
+    queries = queries * args.repeat
+    if not queries:
+        print(f"❌ У {args.dataset} немає запитів")
+        sys.exit(1)
+
+    services = FakeServices(examples, {
+        "openai": args.openai_latency_ms,
+        "redmine": args.redmine_latency_ms,
+        "google": args.google_latency_ms,
+    })
+    server = start_fake_server(services)
+    configure_environment(services.base_url)
+
+    system = build_system(examples)
+    print(f"🏁 {len(queries)} запитів, паралельність {args.concurrency}")
+    result = run_benchmark(system, queries, args.concurrency)
+    result["upstream_calls"] = dict(services.calls)
+    server.shutdown()
+
+    from tracing import format_summary
+    print(f"📊 {result['requests']} запитів за {result['seconds']} с: {result['throughput_rps']} запитів/с, "
+          f"помилок {result['errors']}")
+    print(f"⏱️ Запит: p50 {result['latency_ms']['p50']} мс, p95 {result['latency_ms']['p95']} мс, "
+          f"p99 {result['latency_ms']['p99']} мс")
+    print(f"🔌 Виклики сервісів: {result['upstream_calls']}")
+    print(format_summary(result["stages"]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+        print(f"💾 Результат збережено в {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            problems = compare_with_baseline(result, json.load(file), args.max_regression)
+        if problems:
+            print("❌ Регресії відносно baseline:")
+            for problem in problems:
+                print(f"   {problem}")
+            sys.exit(1)
+        print("✅ Без регресій відносно baseline")
+
+
+if __name__ == "__main__":
+    main()
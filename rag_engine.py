@@ -1,23 +1,41 @@
 import json
 import os
 import logging
+import threading
+from collections import OrderedDict
 from typing import List, Dict
 from openai import OpenAI
 from pinecone import Pinecone
-from sentence_transformers import SentenceTransformer
 from interfaces.dialogue_state import DialogueState
 from tools.config.functions import get_functions
+from tracing import annotate, span, traced
+from single_flight import SingleFlight
+from circuit_breaker import get_breaker
+from openai_gateway import GatewayOverloaded, OpenAIGateway, PRIORITY_HIGH, PRIORITY_NORMAL
 class RAGEngine:
     """Система пошуку через Pinecone RAG"""
     
-    def __init__(self, pinecone_index_name: str = "streamlit"):
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, pinecone_index_name: str = "streamlit", openai_client: OpenAI = None, index=None):
+        self.openai_client = openai_client or OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.gateway = OpenAIGateway(self.openai_client)
         
-        # Ініціалізація Pinecone (новий API)
-        self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    
         self.index_name = pinecone_index_name
-        self.index = self.pc.Index(pinecone_index_name)
+        # Однакові одночасні запити ділять один пошук / один embedding
+        self._search_flight = SingleFlight("rag_engine.search")
+        self._embedding_flight = SingleFlight("rag_engine.embedding")
+        self.breaker = get_breaker("pinecone")
+        # Останні успішні результати пошуку - відповідь, поки Pinecone недоступний
+        self._answer_cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._answer_cache_size = int(os.getenv("RAG_CACHE_SIZE", 256))
+        self._answer_cache_lock = threading.Lock()
+        if index is not None:
+            # Готовий індекс (напр. локальний у бенчмарку) - без підключення до Pinecone
+            self.pc = None
+            self.index = index
+        else:
+            # Ініціалізація Pinecone (новий API)
+            self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+            self.index = self.pc.Index(pinecone_index_name)
         self._detect_embedding_model()
         self._log_index_stats()
     
@@ -49,9 +67,29 @@ class RAGEngine:
         except Exception as e:
             print(f"❌ Помилка отримання статистики: {e}")
 
+    @traced("rag_engine.search")
     def search(self, query: str, top_k: int = 5) -> Dict:
+        return self._search_flight.do((query.strip(), top_k), self._search, query, top_k)
+
+    def _search(self, query: str, top_k: int) -> Dict:
+        key = (" ".join(query.lower().split()), top_k)
+        result = self._search_index(query, top_k)
+        with self._answer_cache_lock:
+            if result.get('success'):
+                self._answer_cache[key] = result
+                self._answer_cache.move_to_end(key)
+                while len(self._answer_cache) > self._answer_cache_size:
+                    self._answer_cache.popitem(last=False)
+            elif result.get('error') and key in self._answer_cache:
+                print(f"⚠️ Pinecone недоступний ({result['error']}), відповідь з кешу")
+                annotate(fallback="cache")
+                return dict(self._answer_cache[key], stale=True)
+        return result
+
+    def _search_index(self, query: str, top_k: int) -> Dict:
         try:
-            stats = self.index.describe_index_stats()
+            with span("pinecone.describe_index_stats"):
+                stats = self.breaker.call(self.index.describe_index_stats)
             total_vectors = stats.total_vector_count                   
             if total_vectors == 0:
                 return {
@@ -64,24 +102,29 @@ class RAGEngine:
                 }
             
             # Генеруємо embedding для запиту
-            embedding = self._get_embedding(query)
+            with span("rag_engine.embedding", model=self.embedding_model):
+                embedding = self._get_embedding(query)
             
             # Шукаємо в default namespace (де більше векторів)
-            results = self.index.query(
-                vector=embedding,
-                top_k=top_k,
-                include_metadata=True,
-                namespace="default"  # ← Ключове виправлення!
-            )
-                    
-            # Якщо в default мало результатів, спробуємо порожній namespace
-            if len(results.matches) < top_k // 2:
-                empty_results = self.index.query(
+            with span("pinecone.query", namespace="default"):
+                results = self.breaker.call(
+                    self.index.query,
                     vector=embedding,
                     top_k=top_k,
                     include_metadata=True,
-                    namespace=""  # Порожній namespace
-                )                
+                    namespace="default"  # ← Ключове виправлення!
+                )
+                    
+            # Якщо в default мало результатів, спробуємо порожній namespace
+            if len(results.matches) < top_k // 2:
+                with span("pinecone.query", namespace=""):
+                    empty_results = self.breaker.call(
+                        self.index.query,
+                        vector=embedding,
+                        top_k=top_k,
+                        include_metadata=True,
+                        namespace=""  # Порожній namespace
+                    )
                 # Об'єднуємо результати
                 all_matches = list(results.matches) + list(empty_results.matches)
                 # Сортуємо за score
@@ -135,6 +178,7 @@ class RAGEngine:
                 total_score += match.score
 
             avg_score = total_score / len(sources) if sources else 0
+            annotate(matches=len(results.matches), relevant=len(context_parts), score=round(avg_score, 3))
 
             return {
                 'success': len(context_parts) > 0,
@@ -160,11 +204,15 @@ class RAGEngine:
     
     def _get_embedding(self, text: str) -> List[float]:
         """Отримання embedding (той же метод що і в DocumentLoader)"""
+        return self._embedding_flight.do((self.embedding_model, text), self._compute_embedding, text)
+
+    def _compute_embedding(self, text: str) -> List[float]:
         try:
             if self.embedding_model == "local":
                 return self._get_local_embedding(text)
             else:
-                response = self.openai_client.embeddings.create(
+                response = self.gateway.embed(
+                    priority=PRIORITY_HIGH,
                     input=text,
                     model=self.embedding_model
                 )
@@ -177,7 +225,8 @@ class RAGEngine:
         try:            
             # Ініціалізуємо модель якщо ще не ініціалізована
             if not hasattr(self, '_local_model'):
-                # Використовуємо ТУ Ж САМУ модель що і DocumentLoader
+                # Використовуємо ТУ Ж САМУ модель що і DocumentLoader (torch вантажиться лише тут)
+                from sentence_transformers import SentenceTransformer
                 self._local_model = SentenceTransformer('intfloat/multilingual-e5-base')
             
             embedding = self._local_model.encode(text).tolist()
@@ -243,7 +292,8 @@ class RAGEngine:
             logging.info(f"🚀 Відправляю запит до OpenAI (model: gpt-4)")
             
             # Викликаємо OpenAI API
-            response = self.openai_client.chat.completions.create(
+            response = self.gateway.chat(
+                priority=PRIORITY_NORMAL,
                 model="gpt-4.1-nano",  # Змінено на більш стабільну модель
                 messages=messages,
                 temperature=0.3,
@@ -288,6 +338,13 @@ class RAGEngine:
                     state.context = "❌ OpenAI повернув порожню відповідь"
                     logging.warning("⚠️ OpenAI повернув порожню відповідь")
         
+        except GatewayOverloaded as e:
+            # Під навантаженням віддаємо знайдений контекст замість помилки
+            logging.warning(f"⏳ OpenAI перевантажений: {e}")
+            state.context = (
+                "⏳ Сервіс відповідей зараз недоступний, тому показую знайдене в базі знань без обробки:\n\n"
+                f"{context[:1500]}"
+            ) if context else "⏳ Сервіс відповідей зараз недоступний. Спробуйте через хвилину."
         except Exception as e:
             # Детальне логування помилки
             logging.error(f"❌ Помилка в generate_answer: {e}", exc_info=True)
@@ -0,0 +1,401 @@
+"""Локальна SQLite копія завдань і витрат часу користувачів Redmine з інкрементальною синхронізацією"""
+import bisect
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Executor
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+from tools.redmine_pagination import PageStream
+from tracing import span
+
+SCHEMA_VERSION = 1
+WORD_PATTERN = re.compile(r"\w+")
+ISSUE_ID_PATTERN = re.compile(r"#?\s*(\d+)")
+MAX_WORD_BONUS = 0.3
+
+
+class IssueList(list):
+    """Завдання вибірки (обмеженої limit); total - скільки всього відповідає запиту"""
+
+    def __init__(self, issues: Iterable = (), total: Optional[int] = None):
+        super().__init__(issues)
+        self.total = len(self) if total is None else total
+
+
+def trigrams(text: str) -> set:
+    """Триграми слів (як у pg_trgm): порядок слів не важливий, одна помилка псує лише кілька триграм"""
+    grams = set()
+    for word in WORD_PATTERN.findall((text or "").lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class RedmineMirror:
+    """Фоновий sync завдань і time entries активних користувачів у SQLite.
+
+    Інкрементальний sync бере лише змінене з моменту курсора (updated_on>=), повний -
+    раз на full_sync_hours, щоб прибрати перепризначені та видалені завдання.
+    """
+
+    def __init__(self, fetch: Callable[..., Dict], db_path: str = "data/redmine_mirror.db",
+                 user_ids: Optional[Iterable[str]] = None, interval: Optional[float] = None,
+                 full_sync_hours: Optional[float] = None, max_age: Optional[float] = None,
+                 executor: Optional[Executor] = None):
+        """
+        Args:
+            fetch: GET до Redmine (patch, params) -> dict без кешу відповідей, зазвичай RedmineAPI.fetch_live
+            user_ids: Користувачі для синхронізації (за замовчуванням REDMINE_SYNC_USER_IDS або REDMINE_USER_ID)
+            interval: Секунд між інкрементальними sync
+            max_age: Скільки секунд після останнього sync дані вважаються актуальними
+            executor: Пул для паралельного завантаження сторінок (без нього - послідовно)
+        """
+        self.fetch = fetch
+        self.executor = executor
+        self.db_path = db_path
+        if user_ids is None:
+            user_ids = os.getenv("REDMINE_SYNC_USER_IDS", os.getenv("REDMINE_USER_ID", "1")).split(",")
+        self.user_ids = [str(user_id).strip() for user_id in user_ids if str(user_id).strip()]
+        self.interval = interval if interval is not None else float(os.getenv("REDMINE_SYNC_INTERVAL", 300))
+        self.full_sync_seconds = 3600 * (full_sync_hours if full_sync_hours is not None
+                                         else float(os.getenv("REDMINE_FULL_SYNC_HOURS", 24)))
+        self.max_age = max_age if max_age is not None else float(os.getenv("REDMINE_MIRROR_MAX_AGE", self.interval * 3))
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed_statuses: Optional[set] = None
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._init_db()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._get_conn()
+        with conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS issues (
+                    id INTEGER PRIMARY KEY,
+                    assigned_to_id TEXT,
+                    subject TEXT,
+                    subject_lower TEXT,
+                    status_id INTEGER,
+                    is_closed INTEGER DEFAULT 0,
+                    estimated_hours REAL,
+                    updated_on TEXT,
+                    data TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_issues_user_updated ON issues(assigned_to_id, updated_on);
+                CREATE INDEX IF NOT EXISTS idx_issues_user_subject ON issues(assigned_to_id, subject_lower);
+
+                CREATE TABLE IF NOT EXISTS time_entries (
+                    id INTEGER PRIMARY KEY,
+                    issue_id INTEGER,
+                    user_id TEXT,
+                    hours REAL,
+                    spent_on TEXT,
+                    updated_on TEXT,
+                    data TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_time_entries_issue ON time_entries(issue_id);
+
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    resource TEXT,
+                    user_id TEXT,
+                    cursor TEXT,
+                    synced_at REAL,
+                    full_synced_at REAL,
+                    PRIMARY KEY (resource, user_id)
+                );
+            """)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self._migrate_v1(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _migrate_v1(self, conn: sqlite3.Connection):
+        """Триграмний індекс назв завдань для нечіткого пошуку"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(issues)")}
+        if "trigram_count" not in columns:
+            conn.execute("ALTER TABLE issues ADD COLUMN trigram_count INTEGER NOT NULL DEFAULT 0")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS issue_trigrams (
+                trigram TEXT NOT NULL,
+                issue_id INTEGER NOT NULL,
+                PRIMARY KEY (trigram, issue_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_issue_trigrams_issue ON issue_trigrams(issue_id)")
+        rows = conn.execute("SELECT id, subject FROM issues").fetchall()
+        self._index_subjects(conn, [(row[0], row[1]) for row in rows])
+
+    def _index_subjects(self, conn: sqlite3.Connection, subjects: List[tuple]):
+        """Оновлює триграми для (issue_id, subject)"""
+        conn.executemany("DELETE FROM issue_trigrams WHERE issue_id = ?", [(issue_id,) for issue_id, _ in subjects])
+        rows, counts = [], []
+        for issue_id, subject in subjects:
+            grams = trigrams(subject)
+            rows.extend((gram, issue_id) for gram in grams)
+            counts.append((len(grams), issue_id))
+        conn.executemany("INSERT OR IGNORE INTO issue_trigrams (trigram, issue_id) VALUES (?, ?)", rows)
+        conn.executemany("UPDATE issues SET trigram_count = ? WHERE id = ?", counts)
+
+    # --- Синхронізація ---
+
+    def _fetch_fresh(self, patch: str, params: Optional[Dict] = None) -> Dict:
+        """Відповідь з кешу (stale) не зберігаємо: інакше sync позначив би старі дані як свіжі"""
+        data = self.fetch(patch, params=params)
+        if data.get("stale"):
+            raise Exception(f"{patch}: Redmine недоступний, відповідь з кешу")
+        return data
+
+    def _fetch_pages(self, patch: str, params: Dict, key: str) -> List[Dict]:
+        """Усі сторінки списку Redmine; неповний список не зберігаємо (курсор пропустив би решту)"""
+        stream = PageStream(self._fetch_fresh, patch, params, key, executor=self.executor)
+        items = stream.all()
+        if stream.truncated:
+            raise Exception(f"{patch}: завантажено {len(items)} з {stream.total_count}")
+        return items
+
+    def _load_closed_statuses(self) -> set:
+        if self._closed_statuses is None:
+            try:
+                statuses = self._fetch_fresh("issue_statuses").get("issue_statuses", [])
+                self._closed_statuses = {status["id"] for status in statuses if status.get("is_closed")}
+            except Exception as e:
+                print(f"⚠️ Не вдалося отримати статуси Redmine: {e}")
+                return set()
+        return self._closed_statuses
+
+    def _sync_state(self, resource: str, user_id: str) -> Dict:
+        row = self._get_conn().execute(
+            "SELECT cursor, synced_at, full_synced_at FROM sync_state WHERE resource = ? AND user_id = ?",
+            (resource, user_id)
+        ).fetchone()
+        return dict(row) if row else {"cursor": None, "synced_at": None, "full_synced_at": None}
+
+    def _save_sync_state(self, conn: sqlite3.Connection, resource: str, user_id: str,
+                         cursor: Optional[str], full: bool):
+        now = time.time()
+        previous = self._sync_state(resource, user_id)
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_state (resource, user_id, cursor, synced_at, full_synced_at) VALUES (?, ?, ?, ?, ?)",
+            (resource, user_id, cursor, now, now if full else previous["full_synced_at"])
+        )
+
+    def sync_user(self, user_id: str, full: bool = False) -> Dict[str, int]:
+        """Синхронізує завдання та витрати часу одного користувача"""
+        issues_state = self._sync_state("issues", user_id)
+        full = full or not issues_state["full_synced_at"] or \
+            time.time() - issues_state["full_synced_at"] > self.full_sync_seconds
+        started = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        issue_params = {"assigned_to_id": user_id, "status_id": "*", "sort": "updated_on"}
+        entry_params = {"user_id": user_id, "sort": "updated_on"}
+        if not full and issues_state["cursor"]:
+            issue_params["updated_on"] = f">={issues_state['cursor']}"
+        entries_state = self._sync_state("time_entries", user_id)
+        if not full and entries_state["cursor"]:
+            entry_params["updated_on"] = f">={entries_state['cursor']}"
+
+        with span("redmine.mirror_sync", user_id=user_id, full=full) as attrs:
+            issues = self._fetch_pages("issues", issue_params, "issues")
+            entries = self._fetch_pages("time_entries", entry_params, "time_entries")
+            closed = self._load_closed_statuses()
+            conn = self._get_conn()
+            with self.lock, conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO issues (id, assigned_to_id, subject, subject_lower, status_id, is_closed, "
+                    "estimated_hours, updated_on, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(
+                        issue["id"],
+                        str((issue.get("assigned_to") or {}).get("id", user_id)),
+                        issue.get("subject", ""),
+                        issue.get("subject", "").lower(),
+                        (issue.get("status") or {}).get("id"),
+                        int(bool((issue.get("status") or {}).get("is_closed")) or (issue.get("status") or {}).get("id") in closed),
+                        issue.get("estimated_hours"),
+                        issue.get("updated_on", ""),
+                        json.dumps(issue, ensure_ascii=False),
+                    ) for issue in issues]
+                )
+                self._index_subjects(conn, [(issue["id"], issue.get("subject", "")) for issue in issues])
+                conn.executemany(
+                    "INSERT OR REPLACE INTO time_entries (id, issue_id, user_id, hours, spent_on, updated_on, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(
+                        entry["id"],
+                        (entry.get("issue") or {}).get("id"),
+                        user_id,
+                        entry.get("hours", 0),
+                        entry.get("spent_on", ""),
+                        entry.get("updated_on", ""),
+                        json.dumps(entry, ensure_ascii=False),
+                    ) for entry in entries]
+                )
+                if full:
+                    # Перепризначені та видалені завдання інкрементальний sync не бачить
+                    seen = [issue["id"] for issue in issues]
+                    placeholders = ",".join("?" * len(seen)) or "NULL"
+                    conn.execute(
+                        f"DELETE FROM issues WHERE assigned_to_id = ? AND id NOT IN ({placeholders})",
+                        [user_id] + seen
+                    )
+                    seen_entries = [entry["id"] for entry in entries]
+                    placeholders = ",".join("?" * len(seen_entries)) or "NULL"
+                    conn.execute(
+                        f"DELETE FROM time_entries WHERE user_id = ? AND id NOT IN ({placeholders})",
+                        [user_id] + seen_entries
+                    )
+                    conn.execute("DELETE FROM issue_trigrams WHERE issue_id NOT IN (SELECT id FROM issues)")
+                # Курсор - час початку sync: зміни під час sync підхопить наступний (>= дає перекриття)
+                self._save_sync_state(conn, "issues", user_id, started, full)
+                self._save_sync_state(conn, "time_entries", user_id, started, full)
+            attrs.update(issues=len(issues), time_entries=len(entries))
+        return {"issues": len(issues), "time_entries": len(entries), "full": full}
+
+    def sync(self, full: bool = False) -> Dict[str, Dict[str, int]]:
+        """Синхронізує всіх користувачів; помилка одного не зупиняє інших"""
+        results = {}
+        for user_id in self.user_ids:
+            try:
+                results[user_id] = self.sync_user(user_id, full=full)
+            except Exception as e:
+                print(f"⚠️ Sync Redmine для користувача {user_id} не вдався: {e}")
+        return results
+
+    def _sync_loop(self):
+        while not self._stopped.is_set():
+            started = time.perf_counter()
+            results = self.sync()
+            if results:
+                total = sum(result["issues"] for result in results.values())
+                print(f"🔄 Redmine mirror: {total} завдань оновлено за {time.perf_counter() - started:.2f} с")
+            self._stopped.wait(self.interval)
+
+    def start(self):
+        """Запускає фоновий sync (перший - одразу)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sync_loop, name="redmine-mirror", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # --- Запити до локальної копії ---
+
+    def is_fresh(self, user_id: str) -> bool:
+        """Чи можна відповідати з копії: користувача синхронізовано не пізніше max_age тому"""
+        synced_at = self._sync_state("issues", str(user_id))["synced_at"]
+        return bool(synced_at) and time.time() - synced_at <= self.max_age
+
+    def _issues(self, where: str, params: List, limit: int) -> IssueList:
+        # COUNT(*) OVER () рахується до LIMIT - повна кількість тим самим запитом
+        rows = self._get_conn().execute(
+            f"SELECT data, COUNT(*) OVER () AS total FROM issues WHERE {where} ORDER BY id DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return IssueList((json.loads(row["data"]) for row in rows), rows[0]["total"] if rows else 0)
+
+    def my_issues(self, user_id: str, limit: int = 5) -> IssueList:
+        return self._issues("assigned_to_id = ?", [str(user_id)], limit)
+
+    def issues_updated_since(self, user_id: str, date: str, limit: int = 10) -> IssueList:
+        # Як і живий запит без status_id - лише відкриті завдання
+        return self._issues("assigned_to_id = ? AND updated_on >= ? AND is_closed = 0", [str(user_id), date], limit)
+
+    def logged_hours(self, user_id: str, issue_id: int) -> float:
+        """Години, списані користувачем на завдання (його time entries синхронізуються повністю)"""
+        row = self._get_conn().execute(
+            "SELECT COALESCE(SUM(hours), 0) FROM time_entries WHERE user_id = ? AND issue_id = ?",
+            (str(user_id), issue_id)
+        ).fetchone()
+        return round(row[0], 2)
+
+    def issues_by_name(self, user_id: str, name: str, open_only: bool = False, limit: int = 5) -> IssueList:
+        """Нечіткий пошук за назвою: найкращі збіги першими"""
+        closed_filter = " AND is_closed = 0" if open_only else ""
+        id_match = ISSUE_ID_PATTERN.fullmatch(name.strip())
+        if id_match:
+            # "#453799" - це номер завдання, а не частина назви
+            issues = self._issues(f"assigned_to_id = ? AND id = ?{closed_filter}", [str(user_id), int(id_match.group(1))], limit)
+            if issues:
+                return issues
+        ranked = self.rank_by_name(user_id, name, open_only, limit)
+        return IssueList((issue for issue, _ in ranked), ranked.total)
+
+    def rank_by_name(self, user_id: str, name: str, open_only: bool = False, limit: int = 5) -> IssueList:
+        """(issue, score) за триграмною схожістю назви; score від 0 до ~1.3. total - усі збіги вище порогу"""
+        query = trigrams(name)
+        if not query:
+            return IssueList()
+        threshold = float(os.getenv("REDMINE_FUZZY_THRESHOLD", 0.45))
+        placeholders = ",".join("?" * len(query))
+        conn = self._get_conn()
+        # Спершу лише лічильники по індексу триграм, JSON завдань - тільки для найкращих
+        rows = conn.execute(
+            f"""
+            SELECT i.id, i.subject_lower, i.trigram_count, m.shared
+            FROM (
+                SELECT issue_id, COUNT(*) AS shared FROM issue_trigrams
+                WHERE trigram IN ({placeholders}) GROUP BY issue_id
+            ) m
+            JOIN issues i ON i.id = m.issue_id
+            WHERE i.assigned_to_id = ?{" AND i.is_closed = 0" if open_only else ""}
+            """,
+            list(query) + [str(user_id)]
+        ).fetchall()
+        # Наскільки запит покритий назвою + загальна схожість (коротша назва з тим самим збігом краща)
+        candidates = sorted((
+            (0.7 * shared / len(query) + 0.3 * shared / (len(query) + trigram_count - shared), issue_id, subject_lower)
+            for issue_id, subject_lower, trigram_count, shared in rows
+        ), reverse=True)
+        words = WORD_PATTERN.findall(name.lower())
+        phrase = f" {' '.join(words)} "
+        ranked = []
+        total = 0
+        for base, issue_id, subject_lower in candidates:
+            # Бонус не більший за MAX_WORD_BONUS - далі збігів вище порогу вже немає
+            if base + MAX_WORD_BONUS < threshold:
+                break
+            may_rank = len(ranked) < limit or base + MAX_WORD_BONUS >= -ranked[-1][0]
+            if not may_rank and base >= threshold:
+                # У top не потрапить, але збіг точно є - лише рахуємо
+                total += 1
+                continue
+            subject_words = WORD_PATTERN.findall(subject_lower)
+            # Точні слова (особливо номери: "12" не те саме, що "1212") і фраза цілком
+            score = base + 0.2 * sum(word in subject_words for word in words) / len(words)
+            if phrase in f" {' '.join(subject_words)} ":
+                score += 0.1
+            if score < threshold:
+                continue
+            total += 1
+            if may_rank:
+                # (-score, -id): відсортований список, найгірший - останній
+                bisect.insort(ranked, (-score, -issue_id))
+                del ranked[limit:]
+        if not ranked:
+            return IssueList(total=total)
+        data = dict(conn.execute(
+            f"SELECT id, data FROM issues WHERE id IN ({','.join('?' * len(ranked))})",
+            [-issue_id for _, issue_id in ranked]
+        ).fetchall())
+        return IssueList(((json.loads(data[-issue_id]), round(-score, 3)) for score, issue_id in ranked), total)
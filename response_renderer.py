@@ -0,0 +1,187 @@
+import re
+from typing import Dict, Any, Callable, Optional
+
+from interfaces.dialogue_state import DialogueState
+
+TEMPLATES = {
+    "uk": {
+        "issue": (
+            "🎯 **Завдання #{id}**\n"
+            "🔗 **Посилання:** {link}\n"
+            "📝 **Назва:** {title}\n"
+            "📊 **Статус:** {status}\n"
+            "⚡ **Пріоритет:** {priority}\n"
+            "👤 **Відповідальний:** {assignee}\n"
+            "📄 **Опис:** {description}"
+        ),
+        "issue_short": "**[#{id}]({link}) - {title} ({status})**",
+        "my_issues": "📋 Ваші завдання:\n\n{items}",
+        "my_issues_empty": "📋 Завдань не знайдено",
+        "issues_by_date": "📅 Завдання на {date}:\n\n{items}",
+        "issues_by_date_empty": "📅 На {date} завдань не знайдено",
+        "search": "🔍 Результати пошуку '{query}':\n\n{items}",
+        "search_empty": "🔍 За запитом '{query}' нічого не знайдено",
+        "shown_of": "… показано {shown} з {total}",
+        "stale": "⚠️ Redmine недоступний, показано збережені дані",
+        "issue_hours": "⏱️ Години по завданню '{query}': {hours} год.",
+        "logged_hours": "🕒 Ви списали: {logged} год.",
+        "hours_filled": "✅ Заповнено {hours} год. для завдання #{id}",
+        "access_ok": "✅ Доступ до Redmine API підтверджено",
+        "user_status": "👤 Статус користувача: {status}",
+        "user_status_set": "✅ Статус користувача змінено на: {status}",
+        "issue_assigned": "✅ Завдання #{id} призначено користувачу {user}",
+        "issue_created": "✅ Завдання створено: {issue}",
+        "untitled": "Без назви",
+        "unknown": "Невідомо",
+        "unassigned": "Не призначено",
+    },
+    "en": {
+        "issue": (
+            "🎯 **Issue #{id}**\n"
+            "🔗 **Link:** {link}\n"
+            "📝 **Subject:** {title}\n"
+            "📊 **Status:** {status}\n"
+            "⚡ **Priority:** {priority}\n"
+            "👤 **Assignee:** {assignee}\n"
+            "📄 **Description:** {description}"
+        ),
+        "issue_short": "**[#{id}]({link}) - {title} ({status})**",
+        "my_issues": "📋 Your issues:\n\n{items}",
+        "my_issues_empty": "📋 No issues found",
+        "issues_by_date": "📅 Issues for {date}:\n\n{items}",
+        "issues_by_date_empty": "📅 No issues found for {date}",
+        "search": "🔍 Search results for '{query}':\n\n{items}",
+        "search_empty": "🔍 Nothing found for '{query}'",
+        "shown_of": "… showing {shown} of {total}",
+        "stale": "⚠️ Redmine is unavailable, showing cached data",
+        "issue_hours": "⏱️ Hours for issue '{query}': {hours} h",
+        "logged_hours": "🕒 You logged: {logged} h",
+        "hours_filled": "✅ Logged {hours} h for issue #{id}",
+        "access_ok": "✅ Redmine API access confirmed",
+        "user_status": "👤 User status: {status}",
+        "user_status_set": "✅ User status changed to: {status}",
+        "issue_assigned": "✅ Issue #{id} assigned to user {user}",
+        "issue_created": "✅ Issue created: {issue}",
+        "untitled": "Untitled",
+        "unknown": "Unknown",
+        "unassigned": "Unassigned",
+    },
+}
+
+# Чи віддавати результат функції шаблоном без generate_response (False - результат потребує LLM)
+FAST_PATH_INTENTS = {
+    "access_to_redmine": True,
+    "get_issue_by_id": True,
+    "get_issue_by_date": True,
+    "get_issue_by_name": True,
+    "search_issues": True,
+    "get_my_issues": True,
+    "get_issue_hours": True,
+    "fill_issue_hours": True,
+    "get_user_status": True,
+    "set_user_status": True,
+    "assign_issue": True,
+    "create_issue": True,
+    "get_wiki_info": False,
+    "get_google_search": False,
+}
+
+
+def detect_language(text: str) -> str:
+    """uk якщо в тексті є кирилиця, інакше en"""
+    return "uk" if re.search(r"[а-яіїєґА-ЯІЇЄҐ]", text or "") else "en"
+
+
+class ResponseRenderer:
+    """Рендеринг результатів функцій Redmine локалізованими шаблонами"""
+
+    def __init__(self, redmine_url: str = ""):
+        self.redmine_url = redmine_url
+        self.renderers: Dict[str, Callable[[Dict[str, Any], str], str]] = {
+            "access_to_redmine": lambda data, lang: self._t(lang, "access_ok"),
+            "get_issue_by_id": lambda data, lang: self.format_issue(data["issue"], lang),
+            "get_my_issues": lambda data, lang: self._list(lang, "my_issues", data),
+            "get_issue_by_date": lambda data, lang: self._list(lang, "issues_by_date", data, date=data.get("date", "")),
+            "get_issue_by_name": lambda data, lang: self._list(lang, "search", data, query=data.get("query", "")),
+            "search_issues": lambda data, lang: self._list(lang, "search", data, query=data.get("query", "")),
+            "get_issue_hours": self._issue_hours,
+            "fill_issue_hours": lambda data, lang: self._t(lang, "hours_filled", id=data["id"], hours=data["hours"]),
+            "get_user_status": lambda data, lang: self._t(lang, "user_status", status=data["status"]),
+            "set_user_status": lambda data, lang: self._t(lang, "user_status_set", status=data["status"]),
+            "assign_issue": lambda data, lang: self._t(lang, "issue_assigned", id=data["id"], user=data["user"]),
+            "create_issue": lambda data, lang: self._t(lang, "issue_created", issue=self.format_issue(data["issue"], lang)),
+        }
+
+    def can_render(self, state: DialogueState) -> bool:
+        """Чи є шаблон для результату і чи дозволено пропустити LLM для цього intent"""
+        if len(state.function_results) > 1:
+            return all(self._can_render(result["name"], result["result"]) for result in state.function_results)
+        return self._can_render(state.intent, state.function_result)
+
+    def _can_render(self, intent: str, data: Dict[str, Any]) -> bool:
+        return bool(FAST_PATH_INTENTS.get(intent) and intent in self.renderers and data)
+
+    def render(self, state: DialogueState, lang: Optional[str] = None) -> str:
+        lang = lang or detect_language(state.user_input)
+        if len(state.function_results) > 1:
+            return "\n\n".join(
+                self._render(result["name"], result["result"], lang) for result in state.function_results
+            )
+        return self._render(state.intent, state.function_result, lang)
+
+    def _render(self, intent: str, data: Dict[str, Any], lang: str) -> str:
+        return self.renderers[intent](data, lang) + self.stale_note(data, lang)
+
+    def format_issue(self, issue: Dict, lang: str = "uk") -> str:
+        """Форматування повної інформації про завдання"""
+        description = issue.get('description', '')[:200] + '...' if issue.get('description') else ''
+        return self._t(
+            lang, "issue",
+            id=issue['id'],
+            link=f"{self.redmine_url}/issues/{issue['id']}",
+            title=issue.get('subject', self._t(lang, "untitled")),
+            status=issue.get('status', {}).get('name', self._t(lang, "unknown")),
+            priority=issue.get('priority', {}).get('name', self._t(lang, "unknown")),
+            assignee=issue.get('assigned_to', {}).get('name', self._t(lang, "unassigned")),
+            description=description,
+        )
+
+    def format_issue_short(self, issue: Dict, lang: str = "uk") -> str:
+        """Короткий формат завдання з посиланням"""
+        return self._t(
+            lang, "issue_short",
+            id=issue['id'],
+            link=f"{self.redmine_url}/issues/{issue['id']}",
+            title=issue.get('subject', self._t(lang, "untitled")),
+            status=issue.get('status', {}).get('name', self._t(lang, "unknown")),
+        )
+
+    def _issue_hours(self, data: Dict[str, Any], lang: str) -> str:
+        text = self._t(lang, "issue_hours", query=data["query"], hours=data["hours"])
+        if data.get("logged_hours") is not None:
+            text += "\n" + self._t(lang, "logged_hours", logged=data["logged_hours"])
+        return text
+
+    def _list(self, lang: str, key: str, data: Dict[str, Any], **values) -> str:
+        issues = data.get("issues") or []
+        if not issues:
+            return self._t(lang, f"{key}_empty", **values)
+        items = "\n".join(self.format_issue_short(issue, lang) for issue in issues)
+        return self._t(lang, key, items=items, **values) + self.listing_note(data, lang)
+
+    def listing_note(self, data: Dict[str, Any], lang: str = "uk") -> str:
+        """Рядок "показано N з M", якщо список обрізано (інакше порожній рядок)"""
+        shown = len(data.get("issues") or [])
+        total = data.get("total_count") or shown
+        if data.get("truncated") or total > shown:
+            return "\n\n" + self._t(lang, "shown_of", shown=shown, total=total)
+        return ""
+
+    def stale_note(self, data: Dict[str, Any], lang: str = "uk") -> str:
+        """Попередження, що дані взято з кешу, бо Redmine недоступний (інакше порожній рядок)"""
+        return "\n\n" + self._t(lang, "stale") if data.get("stale") else ""
+
+    @staticmethod
+    def _t(lang: str, key: str, **values) -> str:
+        templates = TEMPLATES.get(lang, TEMPLATES["uk"])
+        return templates[key].format(**values)
@@ -0,0 +1,60 @@
+import os
+import re
+from typing import Dict, Any, Optional
+
+from interfaces.dialogue_state import DialogueState
+
+# Ціни OpenAI, $ за 1M токенів (вхід, вихід)
+MODEL_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+# Слова, що вимагають пояснення/аналізу, а не просто показу даних
+COMPLEX_MARKERS = re.compile(
+    r"чому|поясни|порівня|проаналіз|як краще|що робити|поради|підсумуй|"
+    r"why|explain|compare|analy[sz]e|summari[sz]e|recommend|how should",
+    re.IGNORECASE,
+)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Вартість виклику в $"""
+    price_in, price_out = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4"])
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+
+class ResponseRouter:
+    """Вибір моделі та бюджету відповіді для generate_response"""
+
+    def __init__(self, fast_model: Optional[str] = None, full_model: Optional[str] = None,
+                 fast_max_tokens: int = 400, full_max_tokens: int = 1200, large_context_tokens: int = 800):
+        self.fast_model = fast_model or os.getenv("RESPONSE_MODEL_FAST", "gpt-4.1-nano")
+        self.full_model = full_model or os.getenv("RESPONSE_MODEL_FULL", "gpt-4")
+        self.fast_max_tokens = fast_max_tokens
+        self.full_max_tokens = full_max_tokens
+        self.large_context_tokens = large_context_tokens
+
+    def complexity(self, state: DialogueState, context_tokens: int = 0) -> int:
+        """Груба оцінка складності відповіді (0 - просто показати дані)"""
+        query = state.user_input or ""
+        score = len(query.split()) // 15
+        if COMPLEX_MARKERS.search(query):
+            score += 2
+        if context_tokens > self.large_context_tokens:
+            score += 1
+        if len(state.rag_chunks) >= 3:
+            score += 1
+        if not state.intent:
+            # Загальне питання без функції - відповідь треба скласти
+            score += 1
+        return score
+
+    def route(self, state: DialogueState, context_tokens: int = 0) -> Dict[str, Any]:
+        """Модель і max_completion_tokens для LLM-відповіді"""
+        score = self.complexity(state, context_tokens)
+        if score <= 1:
+            return {"tier": "fast", "model": self.fast_model, "max_completion_tokens": self.fast_max_tokens, "complexity": score}
+        return {"tier": "full", "model": self.full_model, "max_completion_tokens": self.full_max_tokens, "complexity": score}
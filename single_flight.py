@@ -0,0 +1,60 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from metrics import SINGLE_FLIGHT_CALLS
+from tracing import annotate
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Одночасні однакові виклики (за ключем) виконуються один раз, результат отримують усі.
+
+    Результат спільний для всіх, хто чекав, тому його не можна змінювати на місці.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats = {"calls": 0, "collapsed": 0}
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.stats["collapsed"] += 1
+
+        if not leader:
+            SINGLE_FLIGHT_CALLS.inc(name=self.name, result="collapsed")
+            annotate(coalesced=True)
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        SINGLE_FLIGHT_CALLS.inc(name=self.name, result="leader")
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Наступний виклик з тим самим ключем вже піде в upstream заново
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Профіль часу імпорту та бенчмарк холодного старту (кожен замір - окремий процес)"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+DEFAULT_MODULES = ["ai_system", "upload_docs", "document_loader", "workflow", "main"]
+
+# Холодний старт сервісу: імпорт + створення спільних компонентів (без Gradio UI)
+STARTUP_CODE = """
+import json, time
+started = time.perf_counter()
+from ai_system import AISystem
+imported = time.perf_counter()
+system = AISystem()
+ready = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "init": ready - imported,
+    "total": ready - started,
+    "components": system.container.startup_timings,
+}))
+"""
+
+
+def profile_imports(module: str, top: int = 15) -> Dict:
+    """python -X importtime для модуля: загальний час і найважчі пакети верхнього рівня"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    packages: Dict[str, int] = {}
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        parts = line[len("import time:"):].split("|") if line.startswith("import time:") else []
+        if len(parts) != 3 or "cumulative" in parts[1]:
+            continue
+        self_us, cumulative_us, name = int(parts[0]), int(parts[1]), parts[2].strip()
+        # Власний час модулів, згрупований по пакету верхнього рівня (вкладені імпорти не дублюються)
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+        if name == module:
+            total_us = cumulative_us
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "success": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        "total_seconds": round(total_us / 1_000_000, 3),
+        "heaviest": [(package, round(us / 1_000_000, 3)) for package, us in heaviest],
+    }
+
+
+def benchmark_startup(runs: int = 3) -> Dict:
+    """Медіана холодного старту AISystem за кілька запусків"""
+    samples: List[Dict] = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-c", STARTUP_CODE], capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {"success": False, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr else "unknown"}
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        "success": True,
+        "runs": runs,
+        "import": round(statistics.median(s["import"] for s in samples), 3),
+        "init": round(statistics.median(s["init"] for s in samples), 3),
+        "total": round(statistics.median(s["total"] for s in samples), 3),
+        "components": samples[-1]["components"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Профіль імпортів і бенчмарк старту")
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES, help='Модулі для профілю імпорту')
+    parser.add_argument('--top', type=int, default=10, help='Скільки найважчих пакетів показати')
+    parser.add_argument('--startup', action='store_true', help='Виміряти холодний старт AISystem')
+    parser.add_argument('--runs', type=int, default=3, help='Кількість запусків для --startup')
+    args = parser.parse_args()
+
+    for module in args.modules:
+        result = profile_imports(module, args.top)
+        if not result["success"]:
+            print(f"❌ import {module}: {result['error']}")
+            continue
+        print(f"📦 import {module}: {result['total_seconds']} с")
+        for package, seconds in result["heaviest"]:
+            print(f"   {package}: {seconds} с")
+
+    if args.startup:
+        result = benchmark_startup(args.runs)
+        if not result["success"]:
+            print(f"❌ Старт AISystem: {result['error']}")
+            sys.exit(1)
+        print(f"🚀 Старт AISystem (медіана з {result['runs']}): {result['total']} с "
+              f"(імпорт {result['import']} с, ініціалізація {result['init']} с)")
+        for name, seconds in result["components"].items():
+            print(f"   {name}: {seconds} с")
+
+
+if __name__ == "__main__":
+    main()
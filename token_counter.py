@@ -0,0 +1,90 @@
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # Без tiktoken рахуємо приблизно
+    tiktoken = None
+
+DEFAULT_ENCODING = "cl100k_base"
+# Після невдалого завантаження словника пробуємо знову не раніше ніж через стільки секунд
+ENCODING_RETRY_SECONDS = float(os.getenv("TIKTOKEN_RETRY_SECONDS", 60))
+
+_encodings = {}
+_encoding_failed_at = {}
+_encodings_lock = threading.Lock()
+
+
+def _load_encoding(model: Optional[str]):
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding(DEFAULT_ENCODING)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def _get_encoding(model: Optional[str] = None):
+    """Кешує лише успішно завантажений словник; збій (напр. немає мережі) повторюється пізніше"""
+    if tiktoken is None:
+        return None
+    encoding = _encodings.get(model)
+    if encoding is not None:
+        return encoding
+    with _encodings_lock:
+        if model in _encodings:
+            return _encodings[model]
+        failed_at = _encoding_failed_at.get(model)
+        if failed_at is not None and time.monotonic() - failed_at < ENCODING_RETRY_SECONDS:
+            return None
+        try:
+            encoding = _load_encoding(model)
+        except Exception as e:
+            # Словник tiktoken завантажується з мережі при першому використанні; без нього - оцінка
+            if failed_at is None:
+                print(f"⚠️ tiktoken недоступний ({e}), токени рахуються приблизно")
+            _encoding_failed_at[model] = time.monotonic()
+            return None
+        _encoding_failed_at.pop(model, None)
+        _encodings[model] = encoding
+        return encoding
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Кількість токенів тексту (tiktoken, або оцінка ~4 символи на токен)"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None, from_start: bool = False) -> str:
+    """Обрізає текст до max_tokens (за замовчуванням лишає початок, from_start=True - кінець)"""
+    if max_tokens <= 0 or not text:
+        return ""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        max_chars = max_tokens * 4
+        if len(text) <= max_chars:
+            return text
+        return text[-max_chars:] if from_start else text[:max_chars]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    tokens = tokens[-max_tokens:] if from_start else tokens[:max_tokens]
+    return encoding.decode(tokens)
+
+
+def truncate_to_sentence(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Обрізає текст до max_tokens по межі речення (якщо можливо)"""
+    truncated = truncate_to_tokens(text, max_tokens, model)
+    if len(truncated) == len(text):
+        return text
+    # Шукаємо останній кінець речення в обрізаному тексті
+    ends = [match.end() for match in re.finditer(r"[.!?…](\s|$)|\n", truncated)]
+    if ends and ends[-1] > len(truncated) // 3:
+        return truncated[:ends[-1]].rstrip() + " …"
+    return truncated.rstrip() + "…"
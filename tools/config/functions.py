@@ -168,6 +168,27 @@ def get_functions():
     ]
 
 
+# Функції, що лише читають дані - їх можна виконувати паралельно
+READ_ONLY_FUNCTIONS = {
+    "access_to_redmine",
+    "get_issue_by_date",
+    "get_issue_by_id",
+    "get_issue_by_name",
+    "get_issue_status",
+    "get_my_issues",
+    "get_issue_hours",
+    "get_user_status",
+    "get_wiki_info",
+    "get_google_search",
+    "search_issues",
+}
+
+
+def get_tools():
+    """Функції у форматі tools (для кількох викликів за одну відповідь)"""
+    return [{"type": "function", "function": function} for function in get_functions()]
+
+
 def get_system_prompt() -> str:
     return (
         "You are an HR assistant for Redmine task management system, search information in RAG and analyze it. You work in OS-System "
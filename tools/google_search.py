@@ -1,7 +1,9 @@
 import os, requests, time
 from typing import Dict, Any
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
+from tracing import span
+from single_flight import SingleFlight
+from circuit_breaker import get_breaker, is_upstream_failure
 load_dotenv(".env")
 
 class GoogleSearchTool:
@@ -10,10 +12,18 @@ class GoogleSearchTool:
     def __init__(self):
         self.api_key = os.getenv("GOOGLE_API_KEY")
         self.search_engine_id = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
+        self.search_url = os.getenv("GOOGLE_SEARCH_URL", "https://www.googleapis.com/customsearch/v1")
         self.enabled = bool(self.api_key and self.search_engine_id)
+        # Однакові одночасні пошуки та завантаження сторінок виконуються один раз
+        self._search_flight = SingleFlight("google.search")
+        self._page_flight = SingleFlight("google.fetch_page")
+        self.breaker = get_breaker("google", is_failure=is_upstream_failure)
 
     def search_with_analysis(self, query: str, num_results: int = 3) -> Dict[str, Any]:
         """Пошук з Google та аналіз контенту сторінок"""
+        return self._search_flight.do((query.strip(), num_results), self._search_with_analysis, query, num_results)
+
+    def _search_with_analysis(self, query: str, num_results: int) -> Dict[str, Any]:
         try:
             if not self.enabled:
                 return {
@@ -66,7 +76,7 @@ class GoogleSearchTool:
     def _get_search_results(self, query: str, num_results: int = 3) -> Dict[str, Any]:
         """Отримання результатів пошуку з Google API"""
         try:
-            url = "https://www.googleapis.com/customsearch/v1"
+            url = self.search_url
             params = {
                 'key': self.api_key,
                 'cx': self.search_engine_id,
@@ -75,8 +85,9 @@ class GoogleSearchTool:
                 'hl': 'uk'  # Українська мова
             }
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+            with span("google.search", results=num_results) as attrs:
+                response = self.breaker.call(self._request_search, url, params)
+                attrs["status"] = response.status_code
             
             data = response.json()
             
@@ -107,8 +118,16 @@ class GoogleSearchTool:
                 'error': f'Google API помилка: {str(e)}'
             }
     
+    def _request_search(self, url: str, params: Dict[str, Any]) -> requests.Response:
+        response = requests.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        return response
+
     def _analyze_page_content(self, url: str, title: str, snippet: str) -> Dict[str, Any]:
         """Аналіз контенту веб-сторінки"""
+        return self._page_flight.do((url, snippet), self._fetch_page_content, url, snippet)
+
+    def _fetch_page_content(self, url: str, snippet: str) -> Dict[str, Any]:
         try:
             # Налаштування headers для уникнення блокування
             headers = {
@@ -120,10 +139,13 @@ class GoogleSearchTool:
                 'Upgrade-Insecure-Requests': '1'
             }
             
-            response = requests.get(url, headers=headers, timeout=10)
+            with span("google.fetch_page") as attrs:
+                response = requests.get(url, headers=headers, timeout=10)
+                attrs.update(status=response.status_code, bytes=len(response.content))
             response.raise_for_status()
             
             # Парсинг HTML
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(response.content, 'html.parser')
             
             # Видаляємо скрипти та стилі
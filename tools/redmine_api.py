@@ -1,15 +1,40 @@
-import requests, os
-from typing import Dict
+import requests, os, json, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 from interfaces.dialogue_state import DialogueState
 from interfaces.redmine_state import RedmineState
 from tools.google_search import GoogleSearchTool
+from response_renderer import ResponseRenderer
+from tracing import span
+from single_flight import SingleFlight
+from circuit_breaker import CircuitOpenError, get_breaker, is_upstream_failure
+from tools.redmine_pagination import PageStream
 class RedmineAPI:
     """Клас для роботи з Redmine API"""
     
-    def __init__(self):
+    def __init__(self, google_search: GoogleSearchTool = None, mirror=None):
         self.state = RedmineState()
-        self.google_search = GoogleSearchTool()
+        # Локальна копія завдань (redmine_mirror.RedmineMirror) - пошук без запитів до Redmine
+        self.mirror = mirror
+        self.google_search = google_search or GoogleSearchTool()
+        self.renderer = ResponseRenderer(self.state.redmine_url)
+        # Однакові одночасні GET запити йдуть у Redmine один раз
+        self._get_flight = SingleFlight("redmine.get")
+        self.timeout = float(os.getenv("REDMINE_TIMEOUT_SECONDS", 10))
+        self.breaker = get_breaker("redmine", is_failure=is_upstream_failure)
+        # Останні успішні GET відповіді - поки Redmine недоступний, віддаємо їх
+        self._cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._cache_size = int(os.getenv("REDMINE_CACHE_SIZE", 500))
+        self._cache_lock = threading.Lock()
+        # Списки завантажуються повністю: сторінки після першої - паралельно, з обмеженням часу
+        self.page_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("REDMINE_PAGE_WORKERS", 4)),
+            thread_name_prefix="redmine-page"
+        )
+        self.list_max_items = int(os.getenv("REDMINE_LIST_MAX_ITEMS", 200))
+        self.list_timeout = float(os.getenv("REDMINE_LIST_TIMEOUT_SECONDS", 8))
         
 
     def _make_request(self, patch: str, method: str = "GET", params: Dict = None) -> Dict:
@@ -17,35 +42,121 @@ class RedmineAPI:
         if not self.state.redmine_url or not self.state.redmine_api_key:
             raise Exception("Redmine API не налаштований")
         
+        if method != "GET":
+            return self._send_request(patch, method, params)
+        key = (patch, json.dumps(params or {}, sort_keys=True, default=str))
+        try:
+            data = self._get_flight.do(key, self._send_request, patch, method, params)
+        except Exception as e:
+            unavailable = isinstance(e, CircuitOpenError) or (
+                isinstance(e.__cause__, requests.exceptions.RequestException) and is_upstream_failure(e.__cause__)
+            )
+            with self._cache_lock:
+                cached = self._cache.get(key) if unavailable else None
+            if cached is None:
+                raise
+            print(f"⚠️ Redmine недоступний ({e}), дані з кешу: {patch}")
+            return dict(cached, stale=True)
+        with self._cache_lock:
+            self._cache[key] = data
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return data
+
+    def fetch_live(self, patch: str, params: Dict = None) -> Dict:
+        """GET без single-flight і кешу останніх відповідей (для фонового sync локальної копії)"""
+        return self._send_request(patch, "GET", params)
+
+    def _local_issues(self, lookup: str, *args, **kwargs):
+        """Завдання з локальної копії, або None - тоді запит іде в Redmine"""
+        if self.mirror is None or not self.mirror.is_fresh(self.state.user_id):
+            return None
+        with span("redmine.mirror", lookup=lookup) as attrs:
+            issues = getattr(self.mirror, lookup)(self.state.user_id, *args, **kwargs)
+            attrs["issues"] = len(issues)
+        return issues
+
+    def list_pages(self, patch: str, params: Dict, key: str = "issues", max_items: Optional[int] = None,
+                   timeout: Optional[float] = None) -> PageStream:
+        """Всі сторінки списку Redmine (ітерація - по сторінці, в міру завантаження)"""
+        return PageStream(
+            self._make_request, patch, params, key,
+            executor=self.page_executor,
+            max_items=max_items if max_items is not None else self.list_max_items,
+            timeout=timeout if timeout is not None else self.list_timeout,
+        )
+
+    def _list_issues(self, params: Dict, local_issues: Optional[List[Dict]] = None) -> Dict:
+        """Повний список завдань (з локальної копії або всі сторінки Redmine) і їх форматування"""
+        if local_issues is not None:
+            # Копія повертає не більше list_max_items, total - скільки всього збігів
+            total = getattr(local_issues, 'total', len(local_issues))
+            return {
+                'issues': local_issues,
+                'lines': [self._format_issue_short(issue) for issue in local_issues],
+                'total_count': total,
+                'truncated': total > len(local_issues),
+                'stale': False,
+            }
+        issues, lines = [], []
+        stream = self.list_pages('issues', params)
+        with span("redmine.list", path="issues") as attrs:
+            for page in stream:
+                issues.extend(page)
+                # Форматуємо сторінку, поки завантажуються наступні
+                lines.extend(self._format_issue_short(issue) for issue in page)
+            attrs.update(items=len(issues), total=stream.total_count, truncated=stream.truncated, stale=stream.stale)
+        return {
+            'issues': issues,
+            'lines': lines,
+            'total_count': stream.total_count,
+            'truncated': stream.truncated,
+            'stale': stream.stale,
+        }
+
+    def _listing_note(self, data: Dict) -> str:
+        return self.renderer.listing_note(data, "uk") + self._stale_note(data)
+
+    def _stale_note(self, data: Dict) -> str:
+        return self.renderer.stale_note(data, "uk")
+
+    def _http(self, method: str, url: str, headers: Dict, params: Dict = None) -> requests.Response:
+        if method == "GET":
+            response = requests.get(url, headers=headers, params=params, timeout=self.timeout)
+        elif method == "POST":
+            response = requests.post(url, headers=headers, json=params, timeout=self.timeout)
+        elif method == "PUT":
+            response = requests.put(url, headers=headers, json=params, timeout=self.timeout)
+        else:
+            raise ValueError(f"Непідтримуваний HTTP метод: {method}")
+        response.raise_for_status()
+        return response
+
+    def _send_request(self, patch: str, method: str, params: Dict = None) -> Dict:
         url = f"{self.state.redmine_url}/{patch}.json"
         headers = {
             'X-Redmine-API-Key': self.state.redmine_api_key,
             'Content-Type': 'application/json'
         }
         try:
-            if method == "GET":
-                response = requests.get(url, headers=headers, params=params)
-            elif method == "POST":
-                response = requests.post(url, headers=headers, json=params)
-            elif method == "PUT":
-                response = requests.put(url, headers=headers, json=params)
-            else:
-                raise ValueError(f"Непідтримуваний HTTP метод: {method}")
-            
-            response.raise_for_status()
-            return response.json()
+            with span("redmine.http", method=method, path=patch) as attrs:
+                # Breaker: при недоступному Redmine запити не чекають тайм-аутів
+                response = self.breaker.call(self._http, method, url, headers, params)
+                attrs["status"] = response.status_code
+                # PUT у Redmine відповідає 204 без тіла
+                return response.json() if response.content else {}
             
         except requests.exceptions.RequestException as e:
-            raise Exception(f"Помилка Redmine API: {str(e)}")
+            raise Exception(f"Помилка Redmine API: {str(e)}") from e
 
     def access_to_redmine(self, state: DialogueState) -> DialogueState:
         """Перевірка доступу до Redmine API"""
         try:
-            url = f"{self.base_url}/issues.json"
-            headers = {'X-Redmine-API-Key': self.api_key}
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
+            # Без кешу: перевіряємо саме поточну доступність
+            self._send_request('issues', 'GET', {'limit': 1})
             state.context = "✅ Доступ до Redmine API підтверджено"
+            state.function_result = {'ok': True}
             return state
         except Exception as e:
             state.context = f"❌ Помилка доступу до Redmine API: {str(e)}"
@@ -55,16 +166,15 @@ class RedmineAPI:
         try:
             params = {
                 'assigned_to_id': self.state.user_id,
-                'status_id': '*',
-                'limit': 5
+                'status_id': '*'
             }
-            data = self._make_request('issues', params=params)
-            if not data.get('issues'):
-                state.context = "📋 Завдань не знайдено"
+            data = self._list_issues(params, self._local_issues("my_issues", limit=self.list_max_items))
+            state.function_result = {'issues': data['issues'], 'total_count': data['total_count'], 'truncated': data['truncated'], 'stale': data['stale']}
+            if not data['issues']:
+                state.context = "📋 Завдань не знайдено" + self._stale_note(data)
                 return state
             
-            issues_text = [self._format_issue_short(issue) for issue in data['issues']]
-            state.context = "📋 Ваші завдання:\n\n" + "\n".join(issues_text)
+            state.context = "📋 Ваші завдання:\n\n" + "\n".join(data['lines']) + self._listing_note(data)
             return state
             
         except Exception as e:
@@ -74,16 +184,12 @@ class RedmineAPI:
         issue_id = state.function_calls[0].get("arguments", {}).get("issue_id", "")
         try:
             # Очищуємо ID від # якщо є
-            clean_id = issue_id.replace('#', '').strip()
+            clean_id = str(issue_id).replace('#', '').strip()
             
-            url = f"{self.base_url}/issues/{clean_id}.json"
-            headers = {'X-Redmine-API-Key': self.api_key}
-            
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            issue = response.json()['issue']
-            state.context = self._format_issue(issue)
+            data = self._make_request(f'issues/{clean_id}')
+            issue = data['issue']
+            state.context = self._format_issue(issue) + self._stale_note(data)
+            state.function_result = {'issue': issue, 'stale': bool(data.get('stale'))}
             return state
 
         except Exception as e:
@@ -100,18 +206,18 @@ class RedmineAPI:
 
             params = {
                 'assigned_to_id': self.state.user_id,
-                'updated_on': f">={parsed_date}",
-                'limit': 10
+                'updated_on': f">={parsed_date}"
             }
+            data = self._list_issues(
+                params, self._local_issues("issues_updated_since", parsed_date, limit=self.list_max_items)
+            )
+            state.function_result = {'date': date, 'issues': data['issues'], 'total_count': data['total_count'], 'truncated': data['truncated'], 'stale': data['stale']}
             
-            data = self._make_request('issues', params=params)
-            
-            if not data.get('issues'):
-                state.context = f"📅 На {date} завдань не знайдено"                
+            if not data['issues']:
+                state.context = f"📅 На {date} завдань не знайдено" + self._stale_note(data)                
                 return state
 
-            issues_text = [self._format_issue_short(issue) for issue in data['issues']]
-            state.context = f"📅 Завдання на {date}:\n\n" + "\n".join(issues_text)
+            state.context = f"📅 Завдання на {date}:\n\n" + "\n".join(data['lines']) + self._listing_note(data)
             return state
 
         except Exception as e:
@@ -123,19 +229,18 @@ class RedmineAPI:
         search_term = state.function_calls[0].get("arguments", {}).get("search_term", "")
         try:
             params = {
-                'assigned_to_id': self.user_id,
-                'subject': f"~{search_term}",
-                'limit': 5
+                'assigned_to_id': self.state.user_id,
+                'subject': f"~{search_term}"
             }
 
-            data = self._make_request('issues', params=params)
+            data = self._list_issues(params)
+            state.function_result = {'query': search_term, 'issues': data['issues'], 'total_count': data['total_count'], 'truncated': data['truncated'], 'stale': data['stale']}
 
-            if not data.get('issues'):
-                state.context = f"🔍 За запитом '{search_term}' нічого не знайдено"
+            if not data['issues']:
+                state.context = f"🔍 За запитом '{search_term}' нічого не знайдено" + self._stale_note(data)
                 return state
 
-            issues_text = [self._format_issue_short(issue) for issue in data['issues']]
-            state.context = f"🔍 Результати пошуку '{search_term}':\n\n" + "\n".join(issues_text)
+            state.context = f"🔍 Результати пошуку '{search_term}':\n\n" + "\n".join(data['lines']) + self._listing_note(data)
             return state
 
         except Exception as e:
@@ -147,20 +252,20 @@ class RedmineAPI:
         issue_name = state.function_calls[0].get("arguments", {}).get("issue_name", "")
         try:
             params = {
-                'assigned_to_id': self.user_id,
+                'assigned_to_id': self.state.user_id,
                 'status_id': 'open',
-                'subject': f"~{issue_name}",
-                'limit': 5
+                'subject': f"~{issue_name}"
             }
+            data = self._list_issues(
+                params, self._local_issues("issues_by_name", issue_name, open_only=True, limit=self.list_max_items)
+            )
+            state.function_result = {'query': issue_name, 'issues': data['issues'], 'total_count': data['total_count'], 'truncated': data['truncated'], 'stale': data['stale']}
 
-            data = self._make_request('issues', params=params)
-
-            if not data.get('issues'):
-                state.context = f"🔍 За запитом '{issue_name}' нічого не знайдено"
+            if not data['issues']:
+                state.context = f"🔍 За запитом '{issue_name}' нічого не знайдено" + self._stale_note(data)
                 return state
 
-            issues_text = [self._format_issue_short(issue) for issue in data['issues']]
-            state.context = f"🔍 Результати пошуку '{issue_name}':\n\n" + "\n".join(issues_text)
+            state.context = f"🔍 Результати пошуку '{issue_name}':\n\n" + "\n".join(data['lines']) + self._listing_note(data)
             return state
 
         except Exception as e:
@@ -170,39 +275,56 @@ class RedmineAPI:
         """Отримання годин по завданню"""
         issue_name = state.function_calls[0].get("arguments", {}).get("issue_name", "")
         try:
-            params = {
-                'assigned_to_id': self.user_id,
-                'subject': f"~{issue_name}",
-                'limit': 1
-            }
-
-            data = self._make_request('issues', params=params)
+            issues = self._local_issues("issues_by_name", issue_name, limit=1)
+            if issues is not None:
+                data = {'issues': issues}
+            else:
+                params = {
+                    'assigned_to_id': self.state.user_id,
+                    'subject': f"~{issue_name}",
+                    'limit': 1
+                }
+                data = self._make_request('issues', params=params)
 
             if not data.get('issues'):
-                state.context = f"🔍 За запитом '{issue_name}' нічого не знайдено"
+                state.context = f"🔍 За запитом '{issue_name}' нічого не знайдено" + self._stale_note(data)
                 return state
 
             issue = data['issues'][0]
             hours = issue.get('estimated_hours', 0)
-            state.context = f"⏱️ Години по завданню '{issue_name}': {hours} год."
+            if issues is not None:
+                logged = self.mirror.logged_hours(self.state.user_id, issue['id'])
+            else:
+                logged = self._logged_hours(issue['id'])
+            state.function_result = {
+                'query': issue_name,
+                'hours': hours,
+                'logged_hours': logged,
+                'stale': bool(data.get('stale'))
+            }
+            state.context = self.renderer.renderers['get_issue_hours'](state.function_result, "uk") + self._stale_note(data)
             return state
 
         except Exception as e:
             state.context = f"❌ Помилка отримання годин по завданню '{issue_name}': {str(e)}"
             return state
+    def _logged_hours(self, issue_id: int) -> Optional[float]:
+        """Години, списані користувачем на завдання, з Redmine (None - список неповний)"""
+        params = {'issue_id': issue_id, 'user_id': self.state.user_id}
+        # Без обмеження кількості: частковий підсумок був би неправдивим
+        stream = self.list_pages('time_entries', params, key='time_entries', max_items=0)
+        entries = stream.all()
+        if stream.truncated:
+            return None
+        return round(sum(entry.get('hours', 0) for entry in entries), 2)
+
     def fill_issue_hours(self, state: DialogueState ) -> DialogueState:
         """Заповнення годин по завданню"""
         issue_id = state.function_calls[0].get("arguments", {}).get("issue_id", "")
         hours = state.function_calls[0].get("arguments", {}).get("hours", 0)
         description = state.function_calls[0].get("arguments", {}).get("description", "")
         try:
-            clean_id = issue_id.replace('#', '').strip()
-            
-            url = f"{self.base_url}/issues/{clean_id}.json"
-            headers = {
-                'X-Redmine-API-Key': self.api_key,
-                'Content-Type': 'application/json'
-            }
+            clean_id = str(issue_id).replace('#', '').strip()
             
             data = {
                 'issue': {
@@ -211,9 +333,9 @@ class RedmineAPI:
                 }
             }
             
-            response = requests.put(url, headers=headers, json=data)
-            response.raise_for_status()
+            self._make_request(f'issues/{clean_id}', 'PUT', data)
             state.context = f"✅ Заповнено {hours} год. для завдання #{clean_id}"
+            state.function_result = {'id': clean_id, 'hours': hours}
             return state
 
         except Exception as e:
@@ -222,38 +344,28 @@ class RedmineAPI:
     def get_user_status(self, state: DialogueState) -> DialogueState:
         """Отримання статусу користувача"""
         try:
-            url = f"{self.base_url}/users/{self.user_id}.json"
-            headers = {'X-Redmine-API-Key': self.api_key}
-            
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            user = response.json()['user']
-            status = user.get('status', 'Невідомо')
-            state.context = f"👤 Статус користувача: {status}"
+            data = self._make_request(f'users/{self.state.user_id}')
+            status = data['user'].get('status', 'Невідомо')
+            state.context = f"👤 Статус користувача: {status}" + self._stale_note(data)
+            state.function_result = {'status': status, 'stale': bool(data.get('stale'))}
             return state
 
         except Exception as e:
-            return f"❌ Помилка отримання статусу користувача: {str(e)}"
+            state.context = f"❌ Помилка отримання статусу користувача: {str(e)}"
+            return state
     def set_user_status(self, state: DialogueState) -> DialogueState:
         """Встановлення статусу користувача"""
         status = state.function_calls[0].get("arguments", {}).get("status", "")
         try:
-            url = f"{self.base_url}/users/{self.user_id}.json"
-            headers = {
-                'X-Redmine-API-Key': self.api_key,
-                'Content-Type': 'application/json'
-            }
-            
             data = {
                 'user': {
                     'status': status
                 }
             }
             
-            response = requests.put(url, headers=headers, json=data)
-            response.raise_for_status()
+            self._make_request(f'users/{self.state.user_id}', 'PUT', data)
             state.context = f"✅ Статус користувача змінено на: {status}"
+            state.function_result = {'status': status}
             return state
             
         except Exception as e:
@@ -265,25 +377,19 @@ class RedmineAPI:
         description = state.function_calls[0].get("arguments", {}).get("description", "")
         priority = state.function_calls[0].get("arguments", {}).get("priority", "Normal")
         try:
-            url = f"{self.base_url}/issues.json"
-            headers = {
-                'X-Redmine-API-Key': self.api_key,
-                'Content-Type': 'application/json'
-            }
-            
             data = {
                 'issue': {
                     'subject': subject,
-                    'description': description,
-                    'priority_id': self._get_priority_id(priority)
+                    'description': description
                 }
             }
+            priority_id = self._get_priority_id(priority)
+            if priority_id is not None:
+                data['issue']['priority_id'] = priority_id
             
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            
-            issue = response.json()['issue']
+            issue = self._make_request('issues', 'POST', data)['issue']
             state.context = f"✅ Завдання створено: {self._format_issue(issue)}"
+            state.function_result = {'issue': issue}
             return state
             
         except Exception as e:
@@ -294,13 +400,7 @@ class RedmineAPI:
         issue_id = state.function_calls[0].get("arguments", {}).get("issue_id", "")
         user_id = state.function_calls[0].get("arguments", {}).get("user_id", "")
         try:
-            clean_id = issue_id.replace('#', '').strip()
-            
-            url = f"{self.base_url}/issues/{clean_id}.json"
-            headers = {
-                'X-Redmine-API-Key': self.api_key,
-                'Content-Type': 'application/json'
-            }
+            clean_id = str(issue_id).replace('#', '').strip()
             
             data = {
                 'issue': {
@@ -308,9 +408,9 @@ class RedmineAPI:
                 }
             }
             
-            response = requests.put(url, headers=headers, json=data)
-            response.raise_for_status()
+            self._make_request(f'issues/{clean_id}', 'PUT', data)
             state.context = f"✅ Завдання #{clean_id} призначено користувачу {user_id}"
+            state.function_result = {'id': clean_id, 'user': user_id}
             return state            
         except Exception as e:
             state.context = f"❌ Помилка призначення завдання #{issue_id} користувачу {user_id}: {str(e)}"
@@ -319,13 +419,7 @@ class RedmineAPI:
         """Отримання інформації з Wiki"""
         topic = state.function_calls[0].get("arguments", {}).get("topic", "")
         try:
-            url = f"{self.base_url}/wiki/{topic}.json"
-            headers = {'X-Redmine-API-Key': self.api_key}
-            
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            wiki_info = response.json()['wiki']
+            wiki_info = self._make_request(f'wiki/{topic}')['wiki']
             state.context = f"📖 Wiki інформація про {topic}:\n\n{wiki_info['content'][:200]}..."
             return state
 
@@ -333,36 +427,19 @@ class RedmineAPI:
             state.context = f"❌ Помилка отримання Wiki інформації: {str(e)}"
             return state
 
+    def _get_priority_id(self, priority: str) -> Optional[int]:
+        """ID пріоритету за назвою; None - Redmine поставить пріоритет за замовчуванням"""
+        priorities = self._make_request('enumerations/issue_priorities').get('issue_priorities', [])
+        name = str(priority or '').strip().lower()
+        return next((item['id'] for item in priorities if item.get('name', '').lower() == name), None)
+
     def _format_issue(self, issue: Dict) -> str:
         """Форматування повної інформації про завдання"""
-        issue_id = issue['id']
-        title = issue.get('subject', 'Без назви')
-        status = issue.get('status', {}).get('name', 'Невідомо')
-        priority = issue.get('priority', {}).get('name', 'Невідомо')
-        assignee = issue.get('assigned_to', {}).get('name', 'Не призначено')
-        description = issue.get('description', '')[:200] + '...' if issue.get('description') else ''
-
-        # Генеруємо посилання на завдання
-        issue_link = f"{self.state.redmine_url}/issues/{issue_id}"
-
-        return f"""🎯 **Завдання #{issue_id}**
-🔗 **Посилання:** {issue_link}
-📝 **Назва:** {title}
-📊 **Статус:** {status}
-⚡ **Пріоритет:** {priority}
-👤 **Відповідальний:** {assignee}
-📄 **Опис:** {description}"""
+        return self.renderer.format_issue(issue, "uk")
 
     def _format_issue_short(self, issue: Dict) -> str:
         """Короткий формат завдання з посиланням"""
-        issue_id = issue['id']
-        title = issue.get('subject', 'Без назви')
-        status = issue.get('status', {}).get('name', 'Невідомо')
-
-        # Генеруємо посилання
-        issue_link = f"{self.state.redmine_url}/issues/{issue_id}"
-
-        return f"**[#{issue_id}]({issue_link}) - {title} ({status})**"
+        return self.renderer.format_issue_short(issue, "uk")
     def _parse_date(self, date_str: str) -> str:
         """Парсинг дати в формат Redmine"""
         date_str = date_str.lower().strip()
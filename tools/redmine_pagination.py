@@ -0,0 +1,78 @@
+import contextvars
+import time
+from concurrent.futures import Executor, TimeoutError as FuturesTimeoutError
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Максимальний limit, який приймає Redmine
+PAGE_SIZE = 100
+
+
+class PageStream:
+    """Сторінки списку Redmine по порядку offset.
+
+    Перша сторінка дає total_count, решта завантажуються паралельно. Ітерація віддає
+    сторінки в міру готовності; якщо вийшов час (timeout) або сторінка не завантажилась -
+    ітерація завершується, а truncated = True. stale = True, якщо хоч одна сторінка
+    прийшла з кешу (Redmine недоступний).
+    """
+
+    def __init__(self, fetch: Callable[..., Dict], patch: str, params: Dict, key: str,
+                 executor: Optional[Executor] = None, page_size: int = PAGE_SIZE,
+                 max_items: Optional[int] = None, timeout: Optional[float] = None):
+        self.fetch = fetch
+        self.patch = patch
+        self.params = dict(params or {})
+        self.key = key
+        self.executor = executor
+        self.page_size = page_size
+        self.max_items = max_items
+        self.timeout = timeout
+        self.total_count = 0
+        self.truncated = False
+        self.stale = False
+
+    def _fetch_page(self, offset: int) -> Dict:
+        return self.fetch(self.patch, params=dict(self.params, offset=offset, limit=self.page_size))
+
+    def __iter__(self) -> Iterator[List[Dict]]:
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        first = self._fetch_page(0)
+        self.total_count = int(first.get("total_count", len(first.get(self.key, []))))
+        wanted = min(self.total_count, self.max_items) if self.max_items else self.total_count
+        self.truncated = wanted < self.total_count
+        self.stale = bool(first.get("stale"))
+        yield first.get(self.key, [])[:wanted]
+
+        offsets = list(range(self.page_size, wanted, self.page_size))
+        if self.executor is None:
+            futures = None
+        else:
+            # Копія контексту - спани сторінок належать до трасування запиту
+            futures = [
+                self.executor.submit(contextvars.copy_context().run, self._fetch_page, offset)
+                for offset in offsets
+            ]
+        try:
+            for index, offset in enumerate(offsets):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                try:
+                    if remaining is not None and remaining <= 0:
+                        raise FuturesTimeoutError()
+                    page = futures[index].result(timeout=remaining) if futures else self._fetch_page(offset)
+                except FuturesTimeoutError:
+                    print(f"⚠️ Redmine {self.patch}: не встигли за {self.timeout} с, показано {offset} з {wanted}")
+                    self.truncated = True
+                    return
+                except Exception as e:
+                    print(f"⚠️ Redmine {self.patch}: сторінка offset={offset} не завантажилась: {e}")
+                    self.truncated = True
+                    return
+                self.stale = self.stale or bool(page.get("stale"))
+                yield page.get(self.key, [])[:wanted - offset]
+        finally:
+            for future in futures or []:
+                future.cancel()
+
+    def all(self) -> List[Dict]:
+        """Всі елементи (з урахуванням max_items і timeout)"""
+        return [item for page in self for item in page]
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Трасування етапів обробки запиту: спани з тривалістю та атрибутами (токени, кеш, статус)"""
+import argparse
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Спани в кільцевому буфері пам'яті та (якщо задано TRACE_FILE) у JSONL файлі"""
+
+    def __init__(self, buffer_size: Optional[int] = None, file_path: Optional[str] = None,
+                 enabled: Optional[bool] = None):
+        """
+        Args:
+            buffer_size: Скільки останніх спанів тримати в пам'яті
+            file_path: JSONL файл для спанів (порожній - лише пам'ять)
+            enabled: Вимкнене трасування не записує нічого
+        """
+        self.enabled = enabled if enabled is not None else os.getenv("TRACING_ENABLED", "true").lower() != "false"
+        self.spans = deque(maxlen=buffer_size or int(os.getenv("TRACE_BUFFER_SIZE", 5000)))
+        self.file_path = file_path if file_path is not None else os.getenv("TRACE_FILE", "")
+        self._file_lock = threading.Lock()
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+    @contextmanager
+    def span(self, stage: str, **attrs):
+        """Спан етапу; вкладені спани отримують trace_id батьківського"""
+        if not self.enabled:
+            yield {}
+            return
+        parent = _current_span.get()
+        record = {
+            "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex[:16],
+            "span_id": uuid.uuid4().hex[:8],
+            "parent_id": parent["span_id"] if parent else None,
+            "stage": stage,
+            "start": time.time(),
+            "attrs": dict(attrs),
+        }
+        token = _current_span.set(record)
+        started = time.perf_counter()
+        try:
+            yield record["attrs"]
+        except Exception as e:
+            record["error"] = str(e)[:200]
+            raise
+        finally:
+            record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            _current_span.reset(token)
+            self._export(record)
+
+    def annotate(self, **attrs):
+        """Додає атрибути до поточного спану (токени, cache_hit, кількість результатів...)"""
+        record = _current_span.get()
+        if record is not None:
+            record["attrs"].update(attrs)
+
+    def traced(self, stage: str):
+        """Декоратор: увесь виклик функції - один спан"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """Колбек на кожен завершений спан (напр. для метрик)"""
+        self._listeners.append(listener)
+
+    def _export(self, record: Dict[str, Any]):
+        self.spans.append(record)
+        for listener in self._listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                print(f"⚠️ Помилка обробника спанів: {e}")
+        if self.file_path:
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            try:
+                with self._file_lock, open(self.file_path, "a", encoding="utf-8") as file:
+                    file.write(line + "\n")
+            except OSError as e:
+                print(f"⚠️ Не вдалося записати спан у {self.file_path}: {e}")
+
+    def summary(self, spans: Optional[Iterable[Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+        """p50/p95/p99 по етапах (з буфера пам'яті або переданих спанів)"""
+        return summarize(self.spans if spans is None else spans)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом найближчого рангу (values відсортовані)"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(spans: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    stages: Dict[str, Dict[str, Any]] = {}
+    for record in spans:
+        stage = stages.setdefault(record["stage"], {"durations": [], "errors": 0, "tokens": 0, "cache_hits": 0, "cache_lookups": 0})
+        stage["durations"].append(record.get("duration_ms", 0.0))
+        if record.get("error"):
+            stage["errors"] += 1
+        attrs = record.get("attrs") or {}
+        stage["tokens"] += int(attrs.get("prompt_tokens", 0) or 0) + int(attrs.get("completion_tokens", 0) or 0)
+        if "cache_hit" in attrs:
+            stage["cache_lookups"] += 1
+            stage["cache_hits"] += bool(attrs["cache_hit"])
+
+    result = {}
+    for name, stage in stages.items():
+        durations = sorted(stage["durations"])
+        result[name] = {
+            "count": len(durations),
+            "errors": stage["errors"],
+            "p50_ms": percentile(durations, 50),
+            "p95_ms": percentile(durations, 95),
+            "p99_ms": percentile(durations, 99),
+            "max_ms": durations[-1],
+            "tokens": stage["tokens"],
+            "cache_hit_ratio": round(stage["cache_hits"] / stage["cache_lookups"], 3) if stage["cache_lookups"] else None,
+        }
+    return result
+
+
+def format_summary(summary: Dict[str, Dict[str, Any]]) -> str:
+    header = f"{'stage':<32} {'count':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'tokens':>8} {'cache':>6}"
+    lines = [header, "-" * len(header)]
+    for name, stats in sorted(summary.items(), key=lambda item: item[1]["p95_ms"], reverse=True):
+        cache = "" if stats["cache_hit_ratio"] is None else f"{stats['cache_hit_ratio'] * 100:.0f}%"
+        lines.append(
+            f"{name:<32} {stats['count']:>6} {stats['errors']:>4} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+            f"{stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f} {stats['tokens']:>8} {cache:>6}"
+        )
+    return "\n".join(lines)
+
+
+def load_spans(file_path: str, since: Optional[float] = None) -> List[Dict[str, Any]]:
+    spans = []
+    with open(file_path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if since is None or record.get("start", 0) >= since:
+                spans.append(record)
+    return spans
+
+
+tracer = Tracer()
+span = tracer.span
+annotate = tracer.annotate
+traced = tracer.traced
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p50/p95/p99 по етапах обробки запиту")
+    parser.add_argument('--file', default=os.getenv("TRACE_FILE") or "data/traces.jsonl", help='JSONL файл спанів')
+    parser.add_argument('--stage', help='Лише етапи з цим префіксом')
+    parser.add_argument('--last-minutes', type=float, help='Лише спани за останні N хвилин')
+    args = parser.parse_args()
+
+    since = time.time() - args.last_minutes * 60 if args.last_minutes else None
+    try:
+        spans = load_spans(args.file, since)
+    except FileNotFoundError:
+        print(f"❌ Файл {args.file} не знайдено (задайте TRACE_FILE для запису спанів)")
+        return
+    if args.stage:
+        spans = [record for record in spans if record["stage"].startswith(args.stage)]
+    if not spans:
+        print("📭 Спанів не знайдено")
+        return
+    print(f"📊 Спанів: {len(spans)}, запитів: {len({record['trace_id'] for record in spans})}")
+    print(format_summary(summarize(spans)))
+
+
+if __name__ == "__main__":
+    main()
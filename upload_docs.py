@@ -18,12 +18,42 @@ def main():
     parser.add_argument('--directory', help='Завантажити всі файли з директорії')
     parser.add_argument('--recursive', action='store_true', help='Рекурсивний пошук в підпапках')
     parser.add_argument('--check', action='store_true', help='Перевірити стан індексу')
+    parser.add_argument('--replace', action='store_true', help='Замінити вектори документа (лише змінені чанки)')
+    parser.add_argument('--delete-source', help='Видалити всі вектори документа (source, зазвичай назва файлу)')
+    parser.add_argument('--clear', action='store_true', help='Очистити індекс (всі namespace або --namespace)')
+    parser.add_argument('--namespace', help='Pinecone namespace')
+    parser.add_argument('--bench', action='store_true', help='Бенчмарк завантаження на згенерованому корпусі (без Pinecone)')
+    parser.add_argument('--bench-size-mb', type=float, default=1.0, help='Розмір тексту на формат для --bench')
+    parser.add_argument('--bench-formats', nargs='+', help='Формати для --bench (pdf docx xlsx csv epub txt)')
+    parser.add_argument('--bench-embedding', choices=['hash', 'local'], default='hash', help='Embedding для --bench')
+    parser.add_argument('--bench-dir', help='Директорія для корпусу --bench')
+    parser.add_argument('--bench-isolate', action='store_true', help='Кожен формат в окремому процесі (пік RSS на формат)')
+    parser.add_argument('--bench-output', help='Зберегти результат --bench у JSON')
+    parser.add_argument('--profile', help='Директорія для cProfile кожного етапу --bench')
     
     args = parser.parse_args()
     
     try:
+        # Бенчмарк працює з локальним індексом, Pinecone не потрібен
+        if args.bench:
+            from ingestion_benchmark import format_report, run_ingestion_benchmark, save_report
+            report = run_ingestion_benchmark(
+                size_mb=args.bench_size_mb,
+                formats=args.bench_formats,
+                embedding=args.bench_embedding,
+                corpus_dir=args.bench_dir,
+                profile_dir=args.profile,
+                isolate=args.bench_isolate
+            )
+            print(format_report(report))
+            if args.bench_output:
+                save_report(report, args.bench_output)
+            return
+        
         # Ініціалізація з автоматичним створенням індексу
         loader = DocumentLoader("streamlit", auto_create_index=True, dimension=768)
+        if args.namespace is not None:
+            loader.namespace = args.namespace
         
         # Перевірка індексу
         if args.check:
@@ -44,6 +74,28 @@ def main():
             
             return
         
+        # Видалення документа
+        if args.delete_source:
+            print(f"🗑️ Видаляю вектори документа: {args.delete_source}")
+            result = loader.delete_source(args.delete_source)
+            
+            if result['success']:
+                print(f"✅ {result['message']}")
+            else:
+                print(f"❌ Помилка: {result['error']}")
+            return
+        
+        # Очищення індексу
+        if args.clear:
+            print("⚠️ Очищаю індекс...")
+            result = loader.clear_index(namespace=args.namespace)
+            
+            if result['success']:
+                print(f"✅ {result['message']}")
+            else:
+                print(f"❌ Помилка: {result['error']}")
+            return
+        
         # Завантаження файлу
         if args.file:
             file_path = Path(args.file)
@@ -52,10 +104,13 @@ def main():
                 return
             
             print(f"📄 Завантажую файл: {file_path.name}")
-            result = loader.load_file(file_path)
+            result = loader.load_file(file_path, replace=args.replace)
             
             if result['success']:
                 print(f"✅ Успішно завантажено: {result['chunks_created']} чанків, {result['vectors_uploaded']} векторів")
+                print(f"⚡ Швидкість завантаження: {result.get('vectors_per_second', 0)} векторів/с")
+                if args.replace:
+                    print(f"♻️ Без змін: {result['vectors_skipped']} чанків, видалено застарілих: {result['stale_deleted']}")
             else:
                 print(f"❌ Помилка: {result['error']}")
             return
@@ -63,7 +118,7 @@ def main():
         # Завантаження директорії
         if args.directory:
             print(f"📁 Завантажую директорію: {args.directory}")
-            result = loader.load_directory(args.directory, recursive=args.recursive)
+            result = loader.load_directory(args.directory, recursive=args.recursive, replace=args.replace)
             
             if result['success']:
                 print(f"✅ Завершено: {result['successful']}/{result['total_files']} файлів успішно")
@@ -72,7 +127,7 @@ def main():
             return
         
         # Якщо нічого не вказано
-        print("❓ Вкажіть --file, --directory або --check")
+        print("❓ Вкажіть --file, --directory, --delete-source, --clear, --check або --bench")
         parser.print_help()
         
     except Exception as e:
@@ -1,47 +1,70 @@
+import contextvars
 import json
 import os
-from langgraph.graph import StateGraph
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from langgraph.graph import StateGraph, END
+from chat_history_manager import ChatHistoryManager
+from context_assembler import ContextAssembler
+from openai_gateway import GatewayOverloaded, OpenAIGateway, PRIORITY_HIGH, PRIORITY_NORMAL
+from response_router import ResponseRouter, estimate_cost
 from interfaces.dialogue_state import DialogueState
-from tools.config.functions import analize_prompt, get_functions, get_system_prompt
-from tools.google_search import GoogleSearchTool
+from intent_router import LocalIntentRouter
+from tools.config.functions import READ_ONLY_FUNCTIONS, analize_prompt, get_tools, get_system_prompt
 from tools.redmine_api import RedmineAPI
+from tracing import annotate, span, traced
 
 class Workflow:
-    def __init__(self, openai_client=None):
+    def __init__(self, openai_client=None, redmine_api: RedmineAPI = None):
         self.workflow = StateGraph(DialogueState)
-        self.state = DialogueState(
-                user_input="",
-                current_node="analyze_intent"
-            )
-        self.redmine_api = RedmineAPI()
+        self.redmine_api = redmine_api or RedmineAPI()
         self.openai_client = openai_client
+        self.gateway = OpenAIGateway(openai_client)
+        self.memory = ChatHistoryManager(
+            openai_client,
+            max_token_limit=int(os.getenv("MEMORY_TOKEN_LIMIT", 1500)),
+            summary_token_limit=int(os.getenv("MEMORY_SUMMARY_TOKEN_LIMIT", 300)),
+        )
+        self.context_assembler = ContextAssembler(
+            max_tokens=int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000)),
+            model="gpt-4",
+        )
+        self.response_router = ResponseRouter()
+        self.intent_router = LocalIntentRouter()
+        # Обмежений пул для паралельних read-викликів
+        self.function_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("MAX_PARALLEL_FUNCTION_CALLS", 4)),
+            thread_name_prefix="function-call"
+        )
         self._setup_navigation_flow()
     def _setup_navigation_flow(self):
-        # Define nodes
-        self.workflow.add_node("analyze_intent", self.analyze_intent)
-        self.workflow.add_node("execute_function", self.execute_function)
-        self.workflow.add_node("generate_response", self.generate_response)
-
-        self.workflow.add_node("get_google_search", self.redmine_api.get_google_search)
-        self.workflow.add_node("access_to_redmine", self.redmine_api.access_to_redmine)
-        self.workflow.add_node("get_issue_by_date", self.redmine_api.get_issue_by_date)
-        self.workflow.add_node("get_issue_by_id", self.redmine_api.get_issue_by_id)
-        self.workflow.add_node("get_issue_by_name", self.redmine_api.get_issue_by_name)
-        self.workflow.add_node("get_issue_hours", self.redmine_api.get_issue_hours)
-        self.workflow.add_node("fill_issue_hours", self.redmine_api.fill_issue_hours)
-        self.workflow.add_node("get_user_status", self.redmine_api.get_user_status)
-        self.workflow.add_node("set_user_status", self.redmine_api.set_user_status)
-        self.workflow.add_node("create_issue", self.redmine_api.create_issue)
-        self.workflow.add_node("assign_issue", self.redmine_api.assign_issue)
-        self.workflow.add_node("get_wiki_info", self.redmine_api.get_wiki_info)
+        started = time.perf_counter()
+        # Define nodes (функції Redmine викликає execute_function, окремими вузлами вони не потрібні)
+        self.workflow.add_node("analyze_intent", traced("analyze_intent")(self.analyze_intent))
+        self.workflow.add_node("execute_function", traced("execute_function")(self.execute_function))
+        self.workflow.add_node("generate_response", traced("generate_response")(self.generate_response))
+        self.workflow.add_node("render_response", traced("render_response")(self.render_response))
         # Define edges
-        self.workflow.add_edge("analyze_intent", "execute_function")
-        self.workflow.add_edge("execute_function", "generate_response")
+        self.workflow.add_conditional_edges(
+            "analyze_intent",
+            self._route_after_intent,
+            {"execute_function": "execute_function", "generate_response": "generate_response"}
+        )
+        self.workflow.add_conditional_edges(
+            "execute_function",
+            self._route_after_execute,
+            {"render_response": "render_response", "generate_response": "generate_response"}
+        )
+        self.workflow.add_edge("render_response", END)
+        self.workflow.add_edge("generate_response", END)
 
         # Set entry point
         self.workflow.set_entry_point("analyze_intent")
         
         self.app = self.workflow.compile()
+        self.compile_seconds = round(time.perf_counter() - started, 3)
+        print(f"⚙️ Граф скомпільовано за {self.compile_seconds} с")
     def process_user_input(self, state: DialogueState) -> str:
         result = self.app.invoke(state)
         if isinstance(result, dict):
@@ -52,46 +75,158 @@ class Workflow:
                 return "Вибачте, не вдалося обробити ваш запит."
         else:
             final_state = result
+        
+        # В пам'ять розмови йде лише сам обмін, без службових промптів
+        if final_state.response_messages:
+            self.memory.add_message(
+                final_state.user_input,
+                final_state.response_messages[-1].get("content", ""),
+                self._session_id(final_state)
+            )
        
         return final_state
 
+    def _session_id(self, state: DialogueState) -> str:
+        session_state = state.session_state if isinstance(state.session_state, dict) else {}
+        return str(session_state.get("session_id", "default"))
+
     def execute_function(self, state: DialogueState) -> DialogueState:
-        """Виконує відповідну функцію на основі аналізу наміру"""
+        """Виконує функції з аналізу наміру: читання паралельно, запис - послідовно в заданому порядку"""
+        state.function_result = {}
+        state.function_results = []
         
-        if not state.function_calls:
+        calls = [call for call in state.function_calls if hasattr(self.redmine_api, call["name"])]
+        if not calls:
             state.current_node = "generate_response"
             return state
-            
-        function_call = state.function_calls[0]
-        function_name = function_call["name"]
-        # Викликаємо відповідну функцію RedmineAPI
-        if hasattr(self.redmine_api, function_name):
-            func = getattr(self.redmine_api, function_name)
-            try:
-                result = func(state)
-                state = result
-                state.current_node = "generate_response"
-                state.intent = function_name
-                
-            except Exception as e:
-                print(f"Помилка виконання функції {function_name}: {e}")
-                state.current_node = "generate_response"
+        
+        results = self._run_function_calls(state, calls)
+        
+        state.function_results = results
+        if len(results) == 1:
+            state.context = results[0]["context"]
+            state.function_result = results[0]["result"]
+        else:
+            state.context = "\n\n".join(result["context"] for result in results if result["context"])
+        state.intent = ", ".join(result["name"] for result in results)
+        state.current_node = "generate_response"
+        return state
 
+    def _run_function_calls(self, state: DialogueState, calls: List[Dict]) -> List[Dict]:
+        """Послідовні read-виклики виконуються разом; write-виклик - бар'єр між ними"""
+        results: List[Dict] = [None] * len(calls)
+        pending_reads: List[int] = []
         
+        def run_reads():
+            if len(pending_reads) == 1:
+                index = pending_reads[0]
+                results[index] = self._run_function_call(state, calls[index])
+            elif pending_reads:
+                futures = {
+                    # Копія контексту - спани потоків пулу належать до трасування запиту
+                    index: self.function_executor.submit(
+                        contextvars.copy_context().run, self._run_function_call, state, calls[index]
+                    )
+                    for index in pending_reads
+                }
+                for index, future in futures.items():
+                    results[index] = future.result()
+            pending_reads.clear()
+        
+        for index, call in enumerate(calls):
+            if call["name"] in READ_ONLY_FUNCTIONS:
+                pending_reads.append(index)
+            else:
+                # Запис може залежати від попередніх кроків і впливати на наступні
+                run_reads()
+                results[index] = self._run_function_call(state, call)
+        run_reads()
+        return results
+
+    def _run_function_call(self, state: DialogueState, call: Dict) -> Dict:
+        """Виконує одну функцію RedmineAPI на окремій копії стану"""
+        function_name = call["name"]
+        call_state = state.model_copy(update={
+            "function_calls": [call],
+            "context": "",
+            "function_result": {},
+        })
+        try:
+            with span(f"function.{function_name}"):
+                result = getattr(self.redmine_api, function_name)(call_state)
+            if isinstance(result, DialogueState):
+                context, function_result = result.context, result.function_result
+            else:
+                context, function_result = result, {}
+        except Exception as e:
+            print(f"Помилка виконання функції {function_name}: {e}")
+            context, function_result = f"❌ Помилка виконання функції {function_name}: {e}", {}
+        return {
+            "name": function_name,
+            "arguments": call.get("arguments", {}),
+            "context": context if isinstance(context, str) else json.dumps(context, ensure_ascii=False, default=str),
+            "result": function_result,
+        }
+
+    def _route_after_intent(self, state: DialogueState) -> str:
+        """Без викликів функцій одразу переходимо до відповіді"""
+        return "execute_function" if state.function_calls else "generate_response"
+
+    def _route_after_execute(self, state: DialogueState) -> str:
+        """Детермінований результат простого запиту рендеримо шаблоном, без LLM"""
+        if self.redmine_api.renderer.can_render(state) and self.response_router.complexity(state) == 0:
+            return "render_response"
+        return "generate_response"
+
+    def render_response(self, state: DialogueState) -> DialogueState:
+        """Відповідь з локалізованого шаблону (uk/en) замість generate_response"""
+        started = time.perf_counter()
+        try:
+            content = self.redmine_api.renderer.render(state)
+        except Exception as e:
+            print(f"Помилка рендерингу шаблону {state.intent}: {e}")
+            return self.generate_response(state)
+        state.response_messages.append({
+            "role": "assistant",
+            "content": content
+        })
+        state.prompt_stats = {"tier": "template", "model": None, "latency": round(time.perf_counter() - started, 3), "cost": 0.0}
+        print(f"Відповідь [template] {state.intent}: {state.prompt_stats['latency']} с, $0")
         return state
 
+    def _build_prompt_context(self, state: DialogueState) -> str:
+        """Історія, результат функції та RAG в межах бюджету токенів"""
+        pieces = [{"kind": "history", "text": self.memory.get_context(self._session_id(state))}]
+        if state.context:
+            pieces.append({"kind": "tool", "text": state.context if isinstance(state.context, str) else json.dumps(state.context, ensure_ascii=False, default=str)})
+        for chunk in state.rag_chunks:
+            pieces.append({"kind": "rag", "text": chunk.get("text", ""), "score": chunk.get("score", 1.0)})
+        # Джерела - лише назви, без дублікатів
+        titles = []
+        for source in state.sources:
+            title = f"{source.get('title', '')} ({source.get('source', '')})" if isinstance(source, dict) else str(source)
+            if title not in titles:
+                titles.append(title)
+        if titles:
+            pieces.append({"kind": "sources", "text": "\n".join(f"- {title}" for title in titles)})
+
+        assembled = self.context_assembler.assemble(state.user_input, pieces)
+        state.prompt_stats = {
+            "context_tokens": assembled["tokens"],
+            "saved_tokens": assembled["saved_tokens"],
+            "pieces_dropped": assembled["pieces_dropped"],
+        }
+        print(f"Контекст промпту: {assembled['tokens']} токенів, зекономлено {assembled['saved_tokens']}")
+        return assembled["text"]
+
     def generate_response(self, state: DialogueState) -> DialogueState:
-        history = ""
-        if state.messages:
-            for msg in state.messages[-3:]:
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                history += f"{role.capitalize()}: {content}\n"
+        started = time.perf_counter()
+        prompt_context = self._build_prompt_context(state)
+        route = self.response_router.route(state, state.prompt_stats.get("context_tokens", 0))
         context = (
-            f"{history}"
+            f"{prompt_context}\n\n"
             f"User requested: {state.user_input}\n"
-            f"Executed function: {state.intent}\n"
-            f"Execution result: {state.context} {state.sources}\n\n"
+            f"Executed function: {state.intent}\n\n"
             "Format the answer as a markdown list. Highlight important information in **bold**. "
             "Analyze the execution result above. If the result is not meaningful or is missing, generate a helpful response yourself based on the user's request and conversation context.\n"
             "Compose a clear, helpful, and polite response using the user's request language, considering the provided data and previous conversation context. "
@@ -112,21 +247,61 @@ class Workflow:
                     "content": get_system_prompt()
                 }
             ]
-            state.messages.extend(messages)
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=messages,
-                max_completion_tokens=1200,
-                temperature=0.7,
-            )
+            try:
+                response = self.gateway.chat(
+                    priority=PRIORITY_NORMAL,
+                    model=route["model"],
+                    messages=messages,
+                    max_completion_tokens=route["max_completion_tokens"],
+                    temperature=0.7,
+                )
+            except GatewayOverloaded as e:
+                if route["tier"] != "full":
+                    raise
+                # Повна модель перевантажена - відповідаємо швидкою (в неї окремі ліміти)
+                print(f"⏳ {route['model']} перевантажена ({e}), відповідає {self.response_router.fast_model}")
+                route = dict(route, tier="degraded", model=self.response_router.fast_model,
+                             max_completion_tokens=self.response_router.fast_max_tokens)
+                response = self.gateway.chat(
+                    priority=PRIORITY_NORMAL,
+                    model=route["model"],
+                    messages=messages,
+                    max_completion_tokens=route["max_completion_tokens"],
+                    temperature=0.7,
+                )
             
             ai_response = response.choices[0].message.content
             print(f"AI response: {ai_response}")
+            usage = getattr(response, "usage", None)
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            state.prompt_stats.update({
+                "tier": route["tier"],
+                "model": route["model"],
+                "complexity": route["complexity"],
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "latency": round(time.perf_counter() - started, 3),
+                "cost": round(estimate_cost(route["model"], prompt_tokens, completion_tokens), 6),
+            })
+            annotate(model=route["model"], tier=route["tier"], prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            print(f"Відповідь [{route['tier']}] {route['model']}: {state.prompt_stats['latency']} с, "
+                  f"{prompt_tokens}+{completion_tokens} токенів, ${state.prompt_stats['cost']}")
             state.response_messages.append({
                 "role": "assistant",
                 "content": ai_response
             })
             
+        except GatewayOverloaded as e:
+            print(f"⏳ OpenAI перевантажений: {e}")
+            # Результат функції вже є - показуємо його без обробки LLM
+            content = "⏳ Сервіс відповідей зараз недоступний, спробуйте через хвилину."
+            if state.context or state.RAG_context:
+                content = f"{content}\n\n{state.context or state.RAG_context}"
+            state.response_messages.append({
+                "role": "assistant",
+                "content": content
+            })
         except Exception as e:
             print(f"Помилка генерації відповіді: {e}")
             state.response_messages.append({
@@ -138,14 +313,12 @@ class Workflow:
     def analyze_intent(self, state: DialogueState) -> DialogueState:
         """Аналізує намір користувача за допомогою OpenAI"""
         options = state.options if state.options else {}
-        # Функції для OpenAI function calling
-        functions = get_functions()
-        history = ""
-        if state.messages:
-            for msg in state.messages[-3:]:
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                history += f"{role.capitalize()}: {content}\n"
+        # Стан спільний між запитами - скидаємо виклики попереднього запиту
+        state.intent = ""
+        state.function_calls = []
+        # Функції для OpenAI tool calling (кілька викликів за одну відповідь)
+        tools = get_tools()
+        history = self.memory.get_context(self._session_id(state))
         messages = [{
             "role": "user",
             "content": state.user_input
@@ -154,43 +327,62 @@ class Workflow:
             f"{analize_prompt()}"
             f" RAG information: {state.RAG_context[:100]}"
         )
+        if history:
+            system_prompt += f"\nConversation context:\n{history}"
         messages.append({
             "role": "system",
             "content": f"{system_prompt}"
         })
-        state.messages.extend(messages)
         options.update({
             "model": "gpt-4.1-nano",
-            "function_call": "auto",
+            "tool_choice": "auto",
             "max_completion_tokens": int(os.getenv("OPENAI_MAX_TOKENS", 300)),
             "temperature": float(os.getenv("OPENAI_TEMPERATURE", 0.1)),
         })
         try:
-            response = self.openai_client.chat.completions.create(
+            # Класифікація наміру коротка і потрібна першою - найвищий пріоритет
+            response = self.gateway.chat(
+                priority=PRIORITY_HIGH,
                 model=options.get("model", "gpt-4.1-nano"),
                 messages=messages,
-                functions=functions,
-                function_call=options.get("function_call", "auto"),
+                tools=tools,
+                tool_choice=options.get("tool_choice", "auto"),
+                parallel_tool_calls=True,
                 max_completion_tokens=options.get("max_completion_tokens", 300),
                 temperature=options.get("temperature", 0.1),
             )
             
             message = response.choices[0].message
+            usage = getattr(response, "usage", None)
+            annotate(
+                model=options.get("model", "gpt-4.1-nano"),
+                prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+                tool_calls=len(message.tool_calls or []),
+            )
             print(f"message: {message}")
-            if message.function_call:
-                function_name = message.function_call.name
-                function_args = json.loads(message.function_call.arguments)
-                
-                state.intent = function_name
-                state.function_calls = [{
-                    "name": function_name,
-                    "arguments": function_args
-                }]
-                state.current_node = function_name
+            if message.tool_calls:
+                state.function_calls = [
+                    {
+                        "id": tool_call.id,
+                        "name": tool_call.function.name,
+                        "arguments": json.loads(tool_call.function.arguments or "{}")
+                    }
+                    for tool_call in message.tool_calls
+                ]
+                state.intent = ", ".join(call["name"] for call in state.function_calls)
+                state.current_node = "execute_function"
             else:
                 print(f"No function call detected, generating response directly. {message}")
                 state.current_node = "generate_response"
                 
+        except GatewayOverloaded as e:
+            # OpenAI недоступний - намір за ключовими словами (лише read-only функції)
+            state.function_calls = self.intent_router.route(state.user_input)
+            state.intent = ", ".join(call["name"] for call in state.function_calls)
+            state.current_node = "execute_function" if state.function_calls else "generate_response"
+            annotate(fallback="local_router")
+            print(f"⏳ OpenAI недоступний ({e}), локальний роутер: {state.intent or 'без функцій'}")
         except Exception as e:
             print(f"Помилка при аналізі наміру: {e}")
             state.current_node = "handle_error"